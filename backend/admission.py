@@ -0,0 +1,186 @@
+"""同時実行数制限（アドミッション制御）モジュール
+
+チャットリクエストの受け付けと、上流API（チャット・Embedding・検索）の呼び出しごとに
+同時実行数の上限と待ち行列を設ける。
+- 上限に達している場合は待ち行列で順番を待つ（先着順）
+- 待ち行列が満杯の場合はすぐに 429、待ち時間が期限を超えた場合は 503 を返す（OverloadedError）
+  Retry-After には、直近の処理時間と待ち行列の長さから見積もった秒数を設定する
+- 待ち行列の長さ・使用中の枠数・待ち時間はメトリクスとして出力し、オートスケールの指標にできる
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from exceptions import OverloadedError
+from metrics import (
+    admission_in_use,
+    admission_queue_depth,
+    admission_rejected_total,
+    admission_wait,
+)
+
+# Retry-After の範囲（秒）
+MIN_RETRY_AFTER_SECONDS = 1
+MAX_RETRY_AFTER_SECONDS = 60
+# 処理時間の移動平均の重み
+HOLD_TIME_EWMA_ALPHA = 0.2
+
+
+class ConcurrencyLimiter:
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int = 0,
+        queue_timeout_seconds: float = 5.0,
+    ):
+        self.name = name
+        # 0以下の場合は制限しない
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._active = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        # 1枠あたりの処理時間の移動平均（Retry-After の見積もりに使う）
+        self._hold_seconds = 1.0
+
+        # 統計
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    # 枠を確保（上限に達していれば待ち行列で待つ。確保できなければ OverloadedError）
+    async def acquire(self) -> None:
+        if not self.enabled:
+            return
+        if self._active < self.max_concurrent and not self._waiters:
+            self._grant(0.0)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            admission_rejected_total.inc(limiter=self.name, reason="queue_full")
+            raise OverloadedError(
+                f"{self.name} の待ち行列が満杯です",
+                status_code=429,
+                retry_after=self.retry_after(),
+            )
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        admission_queue_depth.inc(limiter=self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            admission_rejected_total.inc(limiter=self.name, reason="timeout")
+            raise OverloadedError(
+                f"{self.name} の待ち時間が上限（{self.queue_timeout_seconds}秒）を超えました",
+                status_code=503,
+                retry_after=self.retry_after(),
+            )
+        except asyncio.CancelledError:
+            # 枠を譲られた直後に取り消された場合は、次の待機者に譲る
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                admission_queue_depth.dec(limiter=self.name)
+        admission_wait.observe(time.perf_counter() - start, limiter=self.name)
+
+    # 空いていれば待たずに枠を確保する（確保できた場合は True。待ち行列には並ばない）
+    def try_acquire(self) -> bool:
+        if not self.enabled:
+            return True
+        if self._active < self.max_concurrent and not self._waiters:
+            self._grant(0.0)
+            return True
+        return False
+
+    # 枠を解放（待機者がいれば、その枠をそのまま先頭の待機者に譲る）
+    def release(self, hold_seconds: float | None = None) -> None:
+        if not self.enabled:
+            return
+        if hold_seconds is not None:
+            self._hold_seconds += HOLD_TIME_EWMA_ALPHA * (hold_seconds - self._hold_seconds)
+        self._release_slot()
+
+    # 枠を確保してから処理を実行し、終了時に解放する
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    # 空くまでのおおよその秒数（待ち行列の先頭から順に、1枠あたりの処理時間ずつ空いていく想定）
+    def retry_after(self) -> int:
+        rounds = (len(self._waiters) + 1) / max(1, self.max_concurrent)
+        return min(
+            MAX_RETRY_AFTER_SECONDS,
+            max(MIN_RETRY_AFTER_SECONDS, math.ceil(self._hold_seconds * rounds)),
+        )
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_use": self._active,
+            "queue_depth": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_hold_seconds": self._hold_seconds,
+        }
+
+    def _grant(self, wait_seconds: float) -> None:
+        self._active += 1
+        self.admitted += 1
+        admission_in_use.inc(limiter=self.name)
+        admission_wait.observe(wait_seconds, limiter=self.name)
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            admission_queue_depth.dec(limiter=self.name)
+            if not waiter.done():
+                # 使用中の枠数は変えずに譲る
+                self.admitted += 1
+                waiter.set_result(None)
+                return
+        self._active -= 1
+        admission_in_use.dec(limiter=self.name)
+
+
+class UpstreamLimits:
+    def __init__(
+        self,
+        chat: ConcurrencyLimiter,
+        embedding: ConcurrencyLimiter,
+        search: ConcurrencyLimiter,
+    ):
+        self.chat = chat
+        self.embedding = embedding
+        self.search = search
+
+    def stats(self) -> dict:
+        return {
+            "chat": self.chat.stats(),
+            "embedding": self.embedding.stats(),
+            "search": self.search.stats(),
+        }
@@ -0,0 +1,38 @@
+"""add summary columns to conversations
+
+Revision ID: 5c8e1f2a9d47
+Revises: 3b3b2cc2f924
+Create Date: 2026-10-18 10:12:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c8e1f2a9d47'
+down_revision: Union[str, Sequence[str], None] = '3b3b2cc2f924'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('summary', sa.String(), nullable=True))
+    op.add_column(
+        'conversations',
+        sa.Column(
+            'summarized_message_count',
+            sa.Integer(),
+            nullable=False,
+            server_default='0',
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversations', 'summarized_message_count')
+    op.drop_column('conversations', 'summary')
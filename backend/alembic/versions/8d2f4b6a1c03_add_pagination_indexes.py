@@ -0,0 +1,40 @@
+"""add pagination indexes
+
+Revision ID: 8d2f4b6a1c03
+Revises: 5c8e1f2a9d47
+Create Date: 2026-10-18 19:20:05.274118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f4b6a1c03'
+down_revision: Union[str, Sequence[str], None] = '5c8e1f2a9d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_conversations_created_at_id',
+        'conversations',
+        ['created_at', 'id'],
+        unique=False,
+    )
+    op.create_index(
+        'ix_messages_conversation_id_created_at_id',
+        'messages',
+        ['conversation_id', 'created_at', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_conversation_id_created_at_id', table_name='messages')
+    op.drop_index('ix_conversations_created_at_id', table_name='conversations')
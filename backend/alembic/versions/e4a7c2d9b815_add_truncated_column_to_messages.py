@@ -0,0 +1,31 @@
+"""add truncated column to messages
+
+Revision ID: e4a7c2d9b815
+Revises: 8d2f4b6a1c03
+Create Date: 2026-10-18 19:40:12.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c2d9b815'
+down_revision: Union[str, Sequence[str], None] = '8d2f4b6a1c03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'messages',
+        sa.Column('truncated', sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('messages', 'truncated')
@@ -0,0 +1,397 @@
+"""チャットAPIの負荷ベンチマーク
+
+上流APIスタブ（benchmarks.fake_upstreams）と実際のアプリを別プロセスで起動し、
+複数の同時SSEクライアントから /api/v1/chat に質問を送って以下を計測する。
+- スループット（完了したリクエスト数/秒）とエラー件数
+- 最初の回答トークンまでの時間（TTFT）と全体の所要時間の p50 / p95 / p99
+- アプリのイベントループの遅延（/metrics の rag_event_loop_lag_seconds から推定）
+- パイプラインの段階ごとの平均所要時間（/metrics の rag_stage_duration_seconds から算出）
+結果はコミットごとに比較できるよう JSON で保存する。
+成功件数が0件、またはエラー率が --max-error-rate を超えた場合は、結果を保存せずに終了コード1で終了する。
+
+    cd backend
+    python -m benchmarks.chat_benchmark --concurrency 32 --requests 500
+    python -m benchmarks.chat_benchmark --compare benchmarks/results/<前回の結果>.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+import httpx
+from sqlmodel import SQLModel, create_engine
+import models  # noqa: F401  テーブル定義の登録
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+
+QUESTIONS = [
+    "有給休暇は何日もらえますか？",
+    "在宅勤務の申請方法を教えてください",
+    "通勤手当の上限はいくらですか？",
+    "育児休業はいつから取得できますか？",
+    "残業の事前申請は必要ですか？",
+]
+
+METRIC_LINE_PATTERN = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$")
+LABEL_PATTERN = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# (メトリクス名, ((ラベル名, 値), ...))
+MetricKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+@dataclass
+class RequestResult:
+    ok: bool
+    ttft: float | None
+    total: float
+    error: str | None = None
+
+
+# 値の一覧から平均・パーセンタイル（最近接順位法）・最大値を求める
+def summarize(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def percentile(p: float) -> float:
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": ordered[-1],
+    }
+
+
+# Prometheus テキスト形式を解析
+def parse_metrics(text: str) -> dict[MetricKey, float]:
+    samples: dict[MetricKey, float] = {}
+    for line in text.splitlines():
+        match = METRIC_LINE_PATTERN.match(line)
+        if match is None:
+            continue
+        name, labels, value = match.groups()
+        key = tuple(sorted(LABEL_PATTERN.findall(labels or "")))
+        samples[(name, key)] = float(value)
+    return samples
+
+
+# 2時点のヒストグラムの差分から分位点を推定（histogram_quantile と同じ線形補間）
+def histogram_quantile(
+    before: dict[MetricKey, float], after: dict[MetricKey, float], name: str, q: float
+) -> float | None:
+    buckets: list[tuple[float, float]] = []
+    for (metric, labels), value in after.items():
+        if metric != f"{name}_bucket":
+            continue
+        le = dict(labels)["le"]
+        bound = math.inf if le == "+Inf" else float(le)
+        buckets.append((bound, value - before.get((metric, labels), 0.0)))
+    buckets.sort()
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+
+    rank = q * buckets[-1][1]
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (
+                count - previous_count
+            )
+        previous_bound, previous_count = bound, count
+    return None
+
+
+# 2時点の段階ごとの平均所要時間
+def stage_means(before: dict[MetricKey, float], after: dict[MetricKey, float]) -> dict:
+    means = {}
+    for (metric, labels), total in after.items():
+        if metric != "rag_stage_duration_seconds_sum":
+            continue
+        count_key = ("rag_stage_duration_seconds_count", labels)
+        count = after.get(count_key, 0.0) - before.get(count_key, 0.0)
+        if count > 0:
+            means[dict(labels)["stage"]] = {
+                "count": int(count),
+                "mean": (total - before.get((metric, labels), 0.0)) / count,
+            }
+    return means
+
+
+# 1件のチャットを送信し、最初の回答イベントまでの時間と全体の所要時間を計測
+async def run_request(client: httpx.AsyncClient, question: str) -> RequestResult:
+    start = time.perf_counter()
+    ttft: float | None = None
+    try:
+        async with client.stream(
+            "POST", "/api/v1/chat/", json={"messages": [{"role": "user", "content": question}]}
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return RequestResult(False, None, time.perf_counter() - start, f"HTTP {response.status_code}")
+            async for line in response.aiter_lines():
+                if ttft is None and line.startswith("data:") and '"message"' in line:
+                    ttft = time.perf_counter() - start
+    except httpx.HTTPError as e:
+        return RequestResult(False, ttft, time.perf_counter() - start, type(e).__name__)
+    total = time.perf_counter() - start
+    if ttft is None:
+        return RequestResult(False, None, total, "no message event")
+    return RequestResult(True, ttft, total)
+
+
+# 同時実行数を保ちながら指定件数のリクエストを送信
+async def run_load(
+    base_url: str, concurrency: int, requests: int, unique_questions: bool, offset: int = 0
+) -> tuple[list[RequestResult], float]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results: list[RequestResult] = []
+    counter = iter(range(offset, offset + requests))
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as client:
+
+        async def worker() -> None:
+            for index in counter:
+                question = QUESTIONS[index % len(QUESTIONS)]
+                if unique_questions:
+                    # キャッシュに当たらないよう質問ごとに変える
+                    question = f"{question}（{index}）"
+                results.append(await run_request(client, question))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"プロセスが終了しました（終了コード {process.returncode}）: {url}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"起動を待機中にタイムアウトしました: {url}")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 前回の結果と主要な指標を比較して表示
+def compare(current: dict, baseline: dict) -> list[str]:
+    lines = []
+    for section, key in [
+        ("throughput_rps", None),
+        ("ttft", "p50"), ("ttft", "p95"), ("ttft", "p99"),
+        ("total", "p50"), ("total", "p95"), ("total", "p99"),
+        ("event_loop_lag", "p99"),
+    ]:
+        now = current["results"].get(section)
+        before = baseline["results"].get(section)
+        if key is not None:
+            now = now.get(key) if isinstance(now, dict) else None
+            before = before.get(key) if isinstance(before, dict) else None
+        if now is None or before is None:
+            continue
+        change = (now - before) / before * 100 if before else 0.0
+        label = f"{section}.{key}" if key else section
+        lines.append(f"{label:<22} {before:>10.4f} -> {now:>10.4f} ({change:+.1f}%)")
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="チャットAPIの負荷ベンチマーク")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時SSEクライアント数")
+    parser.add_argument("--requests", type=int, default=200, help="計測するリクエスト数")
+    parser.add_argument("--warmup", type=int, default=10, help="計測前に送るリクエスト数")
+    parser.add_argument(
+        "--repeat-questions",
+        action="store_true",
+        help="同じ質問を繰り返し送る（キャッシュの効果を含めて計測する）",
+    )
+    parser.add_argument(
+        "--app-env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="アプリに渡す環境変数（例: WRITE_BEHIND_ENABLED=true）",
+    )
+    parser.add_argument(
+        "--fake-arg",
+        action="append",
+        default=[],
+        metavar="--OPTION=VALUE",
+        help="上流APIスタブに渡す引数（例: --fake-arg=--stream-ttft-ms=800）",
+    )
+    parser.add_argument(
+        "--max-error-rate",
+        type=float,
+        default=0.01,
+        help="許容するエラー率（超えた場合は結果を保存せずに失敗とする）",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="結果のJSONファイル")
+    parser.add_argument("--compare", type=Path, default=None, help="比較する前回の結果")
+    args = parser.parse_args()
+
+    fake_port, app_port = _free_port(), _free_port()
+    workdir = Path(tempfile.mkdtemp(prefix="chat-benchmark-"))
+    database_url = f"sqlite:///{workdir / 'benchmark.db'}"
+    SQLModel.metadata.create_all(create_engine(database_url))
+
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "AZURE_SEARCH_ENDPOINT": f"http://127.0.0.1:{fake_port}",
+        "AZURE_SEARCH_INDEX_NAME": "benchmark",
+        "AZURE_SEARCH_API_KEY": "benchmark",
+        "EMBEDDING_MODEL": "text-embedding-3-small",
+        "LLM_MODEL": "gpt-4o-mini",
+        "DATABASE_URL": database_url,
+        "EMBEDDING_CACHE_DB_PATH": "",
+        "ANSWER_CACHE_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+        "EVENT_LOOP_LAG_INTERVAL_SECONDS": "0.01",
+        "PROFILE_ADMIN_TOKEN": "",
+        "PROFILE_SAMPLE_RATE": "0",
+    }
+    env.pop("ASYNC_DATABASE_URL", None)
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_upstreams", "--port", str(fake_port),
+         "--documents-path", str(BACKEND_DIR / "handbook_data.json"), *args.fake_arg],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        fake_settings = json.loads(fake.stdout.readline())["fake_upstreams"]  # type: ignore[union-attr]
+        _wait_until_ready(f"http://127.0.0.1:{fake_port}/docs", fake)
+        _wait_until_ready(f"{base_url}/metrics", app)
+
+        unique_questions = not args.repeat_questions
+        if args.warmup:
+            asyncio.run(run_load(base_url, min(args.concurrency, args.warmup), args.warmup, unique_questions, offset=10**6))
+
+        before = parse_metrics(httpx.get(f"{base_url}/metrics").text)
+        results, elapsed = asyncio.run(
+            run_load(base_url, args.concurrency, args.requests, unique_questions)
+        )
+        after = parse_metrics(httpx.get(f"{base_url}/metrics").text)
+    finally:
+        for process in (app, fake):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    succeeded = [result for result in results if result.ok]
+    errors: dict[str, int] = {}
+    for result in results:
+        if not result.ok:
+            errors[result.error or "unknown"] = errors.get(result.error or "unknown", 0) + 1
+
+    # 失敗したリクエストの計測値は比較に使えないため、エラーが多い場合は保存しない
+    error_rate = 1 - len(succeeded) / len(results) if results else 1.0
+    if not succeeded or error_rate > args.max_error_rate:
+        print(
+            f"ベンチマークに失敗しました（成功: {len(succeeded)}/{len(results)}件, "
+            f"エラー率: {error_rate:.1%}, 許容: {args.max_error_rate:.1%}）: "
+            f"{json.dumps(errors, ensure_ascii=False)}",
+            file=sys.stderr,
+        )
+        return 1
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "unique_questions": unique_questions,
+            "app_env": args.app_env,
+            "fake_upstreams": fake_settings,
+        },
+        "results": {
+            "elapsed_seconds": elapsed,
+            "succeeded": len(succeeded),
+            "errors": errors,
+            "error_rate": error_rate,
+            "throughput_rps": len(succeeded) / elapsed if elapsed > 0 else 0.0,
+            "ttft": summarize([result.ttft for result in succeeded if result.ttft is not None]),
+            "total": summarize([result.total for result in succeeded]),
+            "event_loop_lag": {
+                "p50": histogram_quantile(before, after, "rag_event_loop_lag_seconds", 0.5),
+                "p99": histogram_quantile(before, after, "rag_event_loop_lag_seconds", 0.99),
+            },
+            "stages": stage_means(before, after),
+        },
+    }
+
+    output = args.output or DEFAULT_RESULTS_DIR / (
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'unknown'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(json.dumps(report["results"], ensure_ascii=False, indent=2))
+    print(f"結果を保存しました: {output}")
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        print(f"比較対象: {args.compare}（commit {baseline.get('commit')}）")
+        for line in compare(report, baseline):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""ベンチマーク用の上流APIスタブ
+
+OpenAI（チャット・ストリーミング・Embedding）と Azure AI Search の検索APIを、
+それぞれのSDKがそのまま解析できる形式で返すローカルサーバー。
+応答時間は中央値とばらつき（対数正規分布）で、ストリーミングは最初のトークンまでの時間と
+毎秒のトークン数で模擬する。
+
+    python -m benchmarks.fake_upstreams --port 8100
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 AZURE_SEARCH_ENDPOINT=http://127.0.0.1:8100 ...
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import AsyncIterator
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 回答として返す文（トークン数の分だけ繰り返す）
+ANSWER_TOKENS = [
+    "年次", "有給", "休暇", "は", "、", "入社", "後", "6", "か月",
+    "経過", "時", "に", "10", "日", "付与", "されます", "。",
+]
+
+
+@dataclass
+class FakeUpstreamSettings:
+    # 非ストリーミングのチャット（Query Rewriting・タイトル生成）の応答時間の中央値
+    chat_latency_ms: float = 400.0
+    # ストリーミングの最初のトークンまでの時間の中央値
+    stream_ttft_ms: float = 500.0
+    stream_tokens_per_second: float = 60.0
+    answer_tokens: int = 200
+    embedding_latency_ms: float = 80.0
+    embedding_dimensions: int = 1536
+    search_latency_ms: float = 120.0
+    search_results: int = 8
+    # 応答時間のばらつき（対数正規分布のσ。0の場合は常に中央値）
+    jitter: float = 0.3
+    # 検索結果の本文に使うドキュメント（handbook_data.json 形式。未指定の場合は固定の文章）
+    documents_path: str = ""
+
+
+def _sample_latency(median_ms: float, jitter: float) -> float:
+    if median_ms <= 0:
+        return 0.0
+    factor = random.lognormvariate(0.0, jitter) if jitter > 0 else 1.0
+    return median_ms * factor / 1000
+
+
+def _embedding(text: str, dimensions: int) -> np.ndarray:
+    # 同じ入力には同じベクトルを返す（Embeddingキャッシュ・回答キャッシュの挙動を再現する）
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _load_documents(path: str, count: int) -> list[dict]:
+    if path and Path(path).exists():
+        documents = json.loads(Path(path).read_text(encoding="utf-8"))
+    else:
+        documents = [
+            {
+                "id": f"doc_{i:03d}",
+                "category": "総則",
+                "source": "就業規則.pdf",
+                "page": i + 1,
+                "content": f"第{i + 1}条（ベンチマーク）\n" + "従業員は会社の定める規則に従うものとする。" * 20,
+            }
+            for i in range(count)
+        ]
+    return documents
+
+
+def create_app(settings: FakeUpstreamSettings) -> FastAPI:
+    app = FastAPI()
+    documents = _load_documents(settings.documents_path, settings.search_results)
+
+    def completion_chunk(completion_id: str, model: str, delta: dict, finish_reason: str | None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    async def stream_completion(body: dict) -> AsyncIterator[str]:
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "fake")
+        await asyncio.sleep(_sample_latency(settings.stream_ttft_ms, settings.jitter))
+        yield completion_chunk(completion_id, model, {"role": "assistant", "content": ""}, None)
+
+        interval = 1 / settings.stream_tokens_per_second if settings.stream_tokens_per_second > 0 else 0
+        started = time.perf_counter()
+        for i in range(settings.answer_tokens):
+            # トークンの送信時刻を開始時刻から計算し、スリープの誤差を累積させない
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            token = ANSWER_TOKENS[i % len(ANSWER_TOKENS)]
+            yield completion_chunk(completion_id, model, {"content": token}, None)
+        yield completion_chunk(completion_id, model, {}, "stop")
+
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage_chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": 1000,
+                    "completion_tokens": settings.answer_tokens,
+                    "total_tokens": 1000 + settings.answer_tokens,
+                },
+            }
+            yield f"data: {json.dumps(usage_chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if body.get("stream"):
+            return StreamingResponse(stream_completion(body), media_type="text/event-stream")
+
+        await asyncio.sleep(_sample_latency(settings.chat_latency_ms, settings.jitter))
+        question = body["messages"][-1]["content"]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": question[:30]},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        await asyncio.sleep(_sample_latency(settings.embedding_latency_ms, settings.jitter))
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for index, text in enumerate(inputs):
+            vector = _embedding(str(text), settings.embedding_dimensions)
+            embedding = (
+                base64.b64encode(vector.tobytes()).decode("ascii")
+                if body.get("encoding_format") == "base64"
+                else vector.tolist()
+            )
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(str(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    # Azure AI Search の検索（POST /indexes('<name>')/docs/search.post.search）
+    @app.post("/indexes{path:path}")
+    async def search(path: str, request: Request):
+        body = await request.json()
+        await asyncio.sleep(_sample_latency(settings.search_latency_ms, settings.jitter))
+        top = int(body.get("top") or settings.search_results)
+        results = [
+            {**document, "@search.score": 1.0 / (rank + 1), "@search.rerankerScore": 3.0 - rank * 0.1}
+            for rank, document in enumerate(documents[:top])
+        ]
+        return JSONResponse({"value": results})
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ベンチマーク用の上流APIスタブを起動")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    for field in fields(FakeUpstreamSettings):
+        parser.add_argument(
+            f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default
+        )
+    args = parser.parse_args()
+    settings = FakeUpstreamSettings(
+        **{field.name: getattr(args, field.name) for field in fields(FakeUpstreamSettings)}
+    )
+
+    print(json.dumps({"fake_upstreams": asdict(settings)}, ensure_ascii=False), flush=True)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""回答キャッシュモジュール
+
+書き換え後クエリのEmbeddingをキーに、生成済みの回答をキャッシュする。
+コサイン類似度が閾値以上の過去の質問があれば、その回答を再利用する（セマンティックキャッシュ）。
+ただし、会話の文脈（質問より前の履歴）が同じで、質問の文字列も十分に重なる場合に限る
+（「正社員の有給は？」と「パートの有給は？」のように、Embeddingは近いが答えが異なる質問を区別するため）。
+検索インデックスが再登録されると、インデックスバージョンファイルの更新を検知して全件破棄する。
+"""
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import numpy as np
+from caches.embedding_cache import normalize_text
+
+
+# 正規化した文字列の文字bigram（空白・記号は除く）
+def _bigrams(text: str) -> frozenset[str]:
+    chars = [c for c in normalize_text(text).lower() if c.isalnum()]
+    if len(chars) < 2:
+        return frozenset(chars)
+    return frozenset(a + b for a, b in zip(chars, chars[1:]))
+
+
+def _jaccard(a: frozenset[str], b: frozenset[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+# インデックスの再登録を通知（バージョンファイルを更新）
+def touch_index_version(path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    embedding: np.ndarray
+    chunks: list[str]
+    context_key: str = ""
+    bigrams: frozenset[str] = frozenset()
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_size: int = 256,
+        ttl_seconds: float = 3600.0,
+        similarity_threshold: float = 0.95,
+        index_version_path: str | None = None,
+        text_similarity_threshold: float = 0.5,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # 質問の文字bigramのJaccard係数の下限（0の場合は文字列を比較しない）
+        self.text_similarity_threshold = text_similarity_threshold
+        self.index_version_path = index_version_path
+        self._entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._next_id = 0
+        self._index_version = self._read_index_version()
+
+        # 類似度計算用の行列（エントリ変更時に再構築）
+        self._matrix: np.ndarray | None = None
+        self._matrix_ids: list[int] = []
+
+        # ヒット/ミス統計
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # 類似する質問の回答を検索（context_key: 質問より前の会話履歴のキー。query が空の場合は文字列を比較しない）
+    def lookup(
+        self, embedding: list[float], query: str = "", context_key: str = ""
+    ) -> CachedAnswer | None:
+        self._check_index_version()
+        self._purge_expired()
+
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        matrix = self._get_matrix()
+        similarities = matrix @ self._normalize(embedding)
+        bigrams = _bigrams(query)
+        # 類似度の高い順に、文脈と質問の文字列が一致する候補を探す
+        for index in np.argsort(-similarities):
+            if similarities[index] < self.similarity_threshold:
+                break
+            entry_id = self._matrix_ids[int(index)]
+            entry = self._entries[entry_id]
+            if entry.context_key != context_key:
+                continue
+            if (
+                query
+                and self.text_similarity_threshold > 0
+                and _jaccard(entry.bigrams, bigrams) < self.text_similarity_threshold
+            ):
+                continue
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        return None
+
+    # 回答を保存（上限を超えたら最も古いものから破棄）
+    def store(
+        self,
+        query: str,
+        embedding: list[float],
+        chunks: list[str],
+        context_key: str = "",
+    ) -> None:
+        self._check_index_version()
+        self._entries[self._next_id] = CachedAnswer(
+            query=query,
+            embedding=self._normalize(embedding),
+            chunks=list(chunks),
+            context_key=context_key,
+            bigrams=_bigrams(query),
+        )
+        self._next_id += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._matrix = None
+
+    # 全件破棄
+    def invalidate(self) -> None:
+        self._entries.clear()
+        self._matrix = None
+        self.invalidations += 1
+
+    # 統計情報を取得
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+        }
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _get_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries.keys())
+            self._matrix = np.stack([e.embedding for e in self._entries.values()])
+        return self._matrix
+
+    # 期限切れのエントリを削除
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        expired = [
+            entry_id
+            for entry_id, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    # インデックスバージョンファイルの更新時刻を取得
+    def _read_index_version(self) -> int | None:
+        if not self.index_version_path:
+            return None
+        try:
+            return os.stat(self.index_version_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    # インデックスが再登録されていれば全件破棄
+    def _check_index_version(self) -> None:
+        version = self._read_index_version()
+        if version != self._index_version:
+            self._index_version = version
+            if self._entries:
+                self.invalidate()
@@ -0,0 +1,252 @@
+"""Embeddingキャッシュモジュール
+
+モデル名と正規化済みテキストをキーに、Embeddingを2層でキャッシュする。
+- メモリ層: プロセス内のLRU（件数上限・TTLで破棄）
+- ディスク層: SQLite（再起動後も保持され、同一ホストのワーカー間で共有される）
+  一定回数の書き込みごとに期限切れの行を削除し、行数の上限を超えた分は古いものから削除する
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+EmbeddingFactory = Callable[[str], Awaitable[list[float]]]
+
+# ディスク層の期限切れ・上限超過の行を削除する間隔（書き込み回数）
+PRUNE_INTERVAL = 100
+
+
+# キャッシュキー用にテキストを正規化（全角/半角の揺れと余分な空白を吸収）
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class SQLiteEmbeddingStore:
+    def __init__(self, db_path: str, ttl_seconds: float, max_rows: int = 100_000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._writes_since_prune = 0
+        self.evictions = 0
+
+    # 接続を遅延作成（複数ワーカーからの同時アクセスに備えてWALモードを使用）
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " embedding BLOB NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS embedding_cache_created_at"
+                " ON embedding_cache (created_at)"
+            )
+            conn.commit()
+            self._conn = conn
+            # 前回の起動時に溜まった期限切れ・上限超過の行を削除
+            self._prune(conn)
+        return self._conn
+
+    # キーに対応するEmbeddingを取得。期限切れの場合は削除してNoneを返す
+    def get(self, key: str) -> list[float] | None:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT embedding, created_at FROM embedding_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM embedding_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            return array("d", row[0]).tolist()
+
+    # Embeddingを保存（同一キーは上書き）
+    def set(self, key: str, model: str, embedding: list[float]) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache (key, model, embedding, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, model, array("d", embedding).tobytes(), time.time()),
+            )
+            conn.commit()
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= PRUNE_INTERVAL:
+                self._prune(conn)
+
+    # 保存されている行数
+    def size(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+    # 期限切れの行と、行数の上限を超えた古い行を削除
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        self._writes_since_prune = 0
+        deleted = conn.execute(
+            "DELETE FROM embedding_cache WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,),
+        ).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0] - self.max_rows
+        if excess > 0:
+            deleted += conn.execute(
+                "DELETE FROM embedding_cache WHERE key IN"
+                " (SELECT key FROM embedding_cache ORDER BY created_at LIMIT ?)",
+                (excess,),
+            ).rowcount
+        conn.commit()
+        self.evictions += deleted
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: float = 604800.0,
+        db_path: str | None = None,
+        db_max_rows: int = 100_000,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._memory: OrderedDict[str, tuple[float, list[float]]] = OrderedDict()
+        self._disk = (
+            SQLiteEmbeddingStore(db_path, ttl_seconds, db_max_rows) if db_path else None
+        )
+
+        # ヒット/ミス統計
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._miss_latency_total = 0.0
+        self._saved_chars = 0
+
+    # モデル名と正規化テキストからキャッシュキーを生成
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        raw = f"{model}\0{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # キャッシュから取得（メモリ層 → ディスク層の順に参照）
+    async def get(self, model: str, text: str) -> list[float] | None:
+        key = self.make_key(model, text)
+
+        embedding = self._get_memory(key)
+        if embedding is not None:
+            self.memory_hits += 1
+            self._saved_chars += len(text)
+            return embedding
+
+        if self._disk is not None:
+            try:
+                embedding = await asyncio.to_thread(self._disk.get, key)
+            except sqlite3.Error as e:
+                logger.warning(f"Embeddingキャッシュ(ディスク)の読み込みに失敗しました: {e}")
+                embedding = None
+            if embedding is not None:
+                self.disk_hits += 1
+                self._saved_chars += len(text)
+                self._set_memory(key, embedding)
+                return embedding
+
+        return None
+
+    # キャッシュに保存（両方の層に書き込む）
+    async def set(self, model: str, text: str, embedding: list[float]) -> None:
+        key = self.make_key(model, text)
+        self._set_memory(key, embedding)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.set, key, model, embedding)
+            except sqlite3.Error as e:
+                logger.warning(f"Embeddingキャッシュ(ディスク)の書き込みに失敗しました: {e}")
+
+    # キャッシュから取得し、なければfactoryで生成して保存
+    async def get_or_create(
+        self, model: str, text: str, factory: EmbeddingFactory
+    ) -> list[float]:
+        embedding = await self.get(model, text)
+        if embedding is not None:
+            return embedding
+
+        self.misses += 1
+        start_time = time.perf_counter()
+        embedding = await factory(text)
+        self._miss_latency_total += time.perf_counter() - start_time
+
+        await self.set(model, text, embedding)
+        return embedding
+
+    # 統計情報を取得
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        avg_miss_latency = self._miss_latency_total / self.misses if self.misses else 0.0
+        disk_size: int | None = None
+        if self._disk is not None:
+            try:
+                disk_size = self._disk.size()
+            except sqlite3.Error as e:
+                logger.warning(f"Embeddingキャッシュ(ディスク)の件数を取得できませんでした: {e}")
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "memory_size": len(self._memory),
+            "disk_size": disk_size,
+            "disk_evictions": self._disk.evictions if self._disk is not None else 0,
+            "avg_miss_latency_ms": avg_miss_latency * 1000,
+            # ヒット1件あたりミス時の平均レイテンシを節約したとみなした推定値
+            "estimated_saved_seconds": hits * avg_miss_latency,
+            "saved_input_chars": self._saved_chars,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    # メモリ層から取得（期限切れは削除）
+    def _get_memory(self, key: str) -> list[float] | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        stored_at, embedding = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return embedding
+
+    # メモリ層に保存（上限を超えたら最も古いものから破棄）
+    def _set_memory(self, key: str, embedding: list[float]) -> None:
+        self._memory[key] = (time.monotonic(), embedding)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,120 @@
+"""上流APIクライアントモジュール
+
+OpenAI / Azure AI Search のクライアントをアプリ起動時に1度だけ作成し、
+チューニング済みのコネクションプールをリクエスト間で共有する。
+"""
+
+import importlib.util
+import aiohttp
+# openai の DefaultAsyncHttpxClient は httpx2 で実装されているため、設定値も httpx2 の型で渡す
+import httpx2
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.search.documents.aio import SearchClient
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from logger import get_logger
+import config
+
+logger = get_logger(__name__)
+
+
+class UpstreamClients:
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        search_client: SearchClient,
+        http_client: httpx2.AsyncClient,
+        search_session: aiohttp.ClientSession,
+    ):
+        self.openai_client = openai_client
+        self.search_client = search_client
+        self.http_client = http_client
+        self.search_session = search_session
+
+    # クライアント作成（イベントループ上で呼び出すこと）
+    @classmethod
+    def create(cls) -> "UpstreamClients":
+        # OpenAI用: httpx2のプール（h2がインストールされていればHTTP/2を使用）
+        http2 = config.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx2.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx2.Timeout(config.HTTP_TIMEOUT_SECONDS),
+            http2=http2,
+        )
+        openai_client = AsyncOpenAI(api_key=config.OPENAI_API_KEY, http_client=http_client)
+
+        # Azure AI Search用: Azure SDKの非同期トランスポートはaiohttpのため、同じ上限値でプールを構成
+        search_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=config.HTTP_MAX_CONNECTIONS,
+                keepalive_timeout=config.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=aiohttp.ClientTimeout(total=config.HTTP_TIMEOUT_SECONDS),
+        )
+        search_client = SearchClient(
+            config.AZURE_SEARCH_ENDPOINT,
+            config.AZURE_SEARCH_INDEX_NAME,
+            config.AZURE_SEARCH_CREDENTIAL,
+            transport=AioHttpTransport(session=search_session, session_owner=False),
+        )
+
+        logger.info(
+            "上流APIクライアントを作成しました",
+            extra={"extra_fields": {"http2": http2}},
+        )
+        return cls(openai_client, search_client, http_client, search_session)
+
+    # すべてのクライアントとコネクションを閉じる
+    async def aclose(self) -> None:
+        await self.openai_client.close()
+        await self.search_client.close()
+        await self.http_client.aclose()
+        await self.search_session.close()
+        logger.info("上流APIクライアントを終了しました")
+
+    # コネクションプールの統計情報を取得
+    def stats(self) -> dict:
+        return {
+            "openai": self._httpx_pool_stats(),
+            "search": self._aiohttp_pool_stats(),
+        }
+
+    # httpx / aiohttp は公開APIでプール状態を提供しないため、内部の接続管理を参照する
+    # （バージョンアップで内部構造が変わった場合は、接続数を None として返す）
+    def _httpx_pool_stats(self) -> dict:
+        pool = getattr(getattr(self.http_client, "_transport", None), "_pool", None)
+        try:
+            connections = list(getattr(pool, "connections"))
+            idle = sum(1 for connection in connections if connection.is_idle())
+        except (AttributeError, TypeError):
+            return _pool_stats(config.HTTP_MAX_CONNECTIONS, None, None, self.http_client.is_closed)
+        return _pool_stats(
+            config.HTTP_MAX_CONNECTIONS,
+            len(connections) - idle,
+            idle,
+            self.http_client.is_closed,
+        )
+
+    def _aiohttp_pool_stats(self) -> dict:
+        connector = self.search_session.connector
+        if connector is None:
+            return {"closed": True}
+        try:
+            active = len(getattr(connector, "_acquired"))
+            idle = sum(len(conns) for conns in getattr(connector, "_conns").values())
+        except (AttributeError, TypeError):
+            return _pool_stats(connector.limit, None, None, self.search_session.closed)
+        return _pool_stats(connector.limit, active, idle, self.search_session.closed)
+
+
+def _pool_stats(max_connections: int, active: int | None, idle: int | None, closed: bool) -> dict:
+    return {
+        "max_connections": max_connections,
+        "connections": active + idle if active is not None and idle is not None else None,
+        "idle": idle,
+        "active": active,
+        "closed": closed,
+    }
@@ -11,3 +11,117 @@ AZURE_SEARCH_CREDENTIAL = AzureKeyCredential(AZURE_SEARCH_API_KEY)
 OPENAI_API_KEY = get_env("OPENAI_API_KEY")
 EMBEDDING_MODEL = get_env("EMBEDDING_MODEL")
 LLM_MODEL = get_env("LLM_MODEL")
+
+# Embedding キャッシュ設定
+EMBEDDING_CACHE_MAX_SIZE = int(get_env("EMBEDDING_CACHE_MAX_SIZE", "1024"))
+EMBEDDING_CACHE_TTL_SECONDS = float(get_env("EMBEDDING_CACHE_TTL_SECONDS", "604800"))
+# 空文字の場合はディスク層（SQLite）を使用しない
+EMBEDDING_CACHE_DB_PATH = get_env("EMBEDDING_CACHE_DB_PATH", "")
+# ディスク層の行数の上限（超えた分は古いものから削除する）
+EMBEDDING_CACHE_DB_MAX_ROWS = int(get_env("EMBEDDING_CACHE_DB_MAX_ROWS", "100000"))
+
+# 回答キャッシュ設定（生成済みの回答をそのまま再送するため、既定では無効）
+ANSWER_CACHE_ENABLED = get_env("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_MAX_SIZE = int(get_env("ANSWER_CACHE_MAX_SIZE", "256"))
+ANSWER_CACHE_TTL_SECONDS = float(get_env("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(
+    get_env("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95")
+)
+# 質問の文字列の重なり（文字bigramのJaccard係数）の下限（0の場合は比較しない）
+ANSWER_CACHE_TEXT_SIMILARITY_THRESHOLD = float(
+    get_env("ANSWER_CACHE_TEXT_SIMILARITY_THRESHOLD", "0.5")
+)
+# 検索インデックス再登録時に upload_handbook.py が更新するファイル
+INDEX_VERSION_FILE = get_env("INDEX_VERSION_FILE", ".index_version")
+
+# 上流API（OpenAI / Azure AI Search）向けHTTPコネクションプール設定
+HTTP_MAX_CONNECTIONS = int(get_env("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(get_env("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(get_env("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_TIMEOUT_SECONDS = float(get_env("HTTP_TIMEOUT_SECONDS", "60"))
+HTTP2_ENABLED = get_env("HTTP2_ENABLED", "true").lower() == "true"
+
+# メッセージ書き込みバッファ（write-behind）設定
+WRITE_BEHIND_ENABLED = get_env("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = int(get_env("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_FLUSH_INTERVAL_SECONDS = float(
+    get_env("WRITE_BEHIND_FLUSH_INTERVAL_SECONDS", "0.5")
+)
+
+# 投機的検索（Query Rewriting と並行して書き換え前の質問で検索する）
+SPECULATIVE_SEARCH_ENABLED = get_env("SPECULATIVE_SEARCH_ENABLED", "false").lower() == "true"
+
+# Query Rewriting ポリシー設定
+REWRITE_POLICY_ENABLED = get_env("REWRITE_POLICY_ENABLED", "true").lower() == "true"
+REWRITE_MAX_HISTORY_MESSAGES = int(get_env("REWRITE_MAX_HISTORY_MESSAGES", "6"))
+REWRITE_MAX_HISTORY_CHARS = int(get_env("REWRITE_MAX_HISTORY_CHARS", "2000"))
+# 2ターン目以降でも、この文字数以下で指示語などを含まない質問は書き換えを省略する（0の場合は省略しない）
+# 「パートの場合は？」のような省略された追加の質問も省略対象になり、文脈なしで検索されるため既定では無効
+REWRITE_SELF_CONTAINED_MAX_CHARS = int(get_env("REWRITE_SELF_CONTAINED_MAX_CHARS", "0"))
+REWRITE_CACHE_MAX_SIZE = int(get_env("REWRITE_CACHE_MAX_SIZE", "1024"))
+REWRITE_CACHE_TTL_SECONDS = float(get_env("REWRITE_CACHE_TTL_SECONDS", "3600"))
+
+# 会話履歴設定
+# client: リクエストの messages をそのまま使用 / server: DBの履歴をトークン予算内に詰めて使用
+HISTORY_MODE = get_env("HISTORY_MODE", "client")
+HISTORY_TOKEN_BUDGET = int(get_env("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_SUMMARY_ENABLED = get_env("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
+
+# 参考情報（検索結果）組み立て設定
+CONTEXT_TOKEN_BUDGET = int(get_env("CONTEXT_TOKEN_BUDGET", "2000"))
+# 検索で取得する候補の最大件数（実際に使う件数は予算に応じて決まる）
+CONTEXT_MAX_PASSAGES = int(get_env("CONTEXT_MAX_PASSAGES", "8"))
+CONTEXT_DEDUPE_THRESHOLD = float(get_env("CONTEXT_DEDUPE_THRESHOLD", "0.8"))
+
+# 検索バックエンド設定
+# azure: Azure AI Search / local: スナップショットから読み込んだプロセス内インデックス
+SEARCH_BACKEND = get_env("SEARCH_BACKEND", "azure")
+LOCAL_SEARCH_SNAPSHOT = get_env("LOCAL_SEARCH_SNAPSHOT", "search_snapshot.jsonl")
+
+# リクエスト単位のプロファイリング設定
+# トークンを設定すると、X-Profile-Token ヘッダーに同じ値を付けたリクエストを記録し、管理用エンドポイントを利用できる
+PROFILE_ADMIN_TOKEN = get_env("PROFILE_ADMIN_TOKEN", "")
+# トークンの指定がなくても記録するリクエストの割合（0の場合は抽出しない）
+PROFILE_SAMPLE_RATE = float(get_env("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(get_env("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_MAX_STORED = int(get_env("PROFILE_MAX_STORED", "20"))
+
+# イベントループの遅延を計測する間隔（秒、0の場合は計測しない）
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(get_env("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+# SSEの送信設定（トークンごとのイベントをまとめて送信する。間隔が0の場合はまとめない）
+SSE_FLUSH_INTERVAL_SECONDS = float(get_env("SSE_FLUSH_INTERVAL_SECONDS", "0.03"))
+SSE_FLUSH_MAX_BYTES = int(get_env("SSE_FLUSH_MAX_BYTES", "4096"))
+
+# アドミッション制御（同時実行数の上限を超えた分は待ち行列で待ち、溢れた場合や待ち時間の上限を超えた場合は拒否する）
+# チャットリクエストの同時処理数・待ち行列の長さ・待ち時間の上限（秒）（同時処理数が0の場合は制限しない）
+# 同時処理数は UPSTREAM_CHAT_MAX_CONCURRENCY 以下にする（超えると回答の生成中に上流の枠を待つことになる）
+CHAT_MAX_CONCURRENT_REQUESTS = int(get_env("CHAT_MAX_CONCURRENT_REQUESTS", "32"))
+CHAT_MAX_QUEUED_REQUESTS = int(get_env("CHAT_MAX_QUEUED_REQUESTS", "128"))
+CHAT_QUEUE_TIMEOUT_SECONDS = float(get_env("CHAT_QUEUE_TIMEOUT_SECONDS", "5"))
+# 上流APIごとの同時呼び出し数（0の場合は制限しない）と、待ち行列の長さ・待ち時間の上限（秒）
+UPSTREAM_CHAT_MAX_CONCURRENCY = int(get_env("UPSTREAM_CHAT_MAX_CONCURRENCY", "32"))
+UPSTREAM_EMBEDDING_MAX_CONCURRENCY = int(get_env("UPSTREAM_EMBEDDING_MAX_CONCURRENCY", "32"))
+UPSTREAM_SEARCH_MAX_CONCURRENCY = int(get_env("UPSTREAM_SEARCH_MAX_CONCURRENCY", "32"))
+UPSTREAM_MAX_QUEUED = int(get_env("UPSTREAM_MAX_QUEUED", "256"))
+UPSTREAM_QUEUE_TIMEOUT_SECONDS = float(get_env("UPSTREAM_QUEUE_TIMEOUT_SECONDS", "10"))
+
+# 同じ入力の上流API呼び出し（Query Rewriting・Embedding生成・検索）が同時に実行された場合に1回にまとめる
+SINGLE_FLIGHT_ENABLED = get_env("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# 上流API（検索・Embedding生成）のタイムアウト・再試行・ヘッジ・サーキットブレーカー設定
+# チャット1件あたりの上流呼び出しの時間予算（秒、リクエスト開始から。各呼び出しのタイムアウトは残り時間以内に収める。0の場合は予算なし）
+UPSTREAM_REQUEST_BUDGET_SECONDS = float(get_env("UPSTREAM_REQUEST_BUDGET_SECONDS", "20"))
+# 1回の呼び出しのタイムアウト（秒、0の場合はタイムアウトなし）
+SEARCH_TIMEOUT_SECONDS = float(get_env("SEARCH_TIMEOUT_SECONDS", "5"))
+EMBEDDING_TIMEOUT_SECONDS = float(get_env("EMBEDDING_TIMEOUT_SECONDS", "5"))
+# 失敗時の最大試行回数と、指数バックオフ（フルジッター）の基準・上限（秒）
+UPSTREAM_MAX_ATTEMPTS = int(get_env("UPSTREAM_MAX_ATTEMPTS", "3"))
+UPSTREAM_RETRY_BASE_DELAY_SECONDS = float(get_env("UPSTREAM_RETRY_BASE_DELAY_SECONDS", "0.1"))
+UPSTREAM_RETRY_MAX_DELAY_SECONDS = float(get_env("UPSTREAM_RETRY_MAX_DELAY_SECONDS", "2"))
+# 直近の応答時間のこの分位点を過ぎても応答がなければ、同じ呼び出しをもう1つ送る（0の場合はヘッジしない）
+UPSTREAM_HEDGE_QUANTILE = float(get_env("UPSTREAM_HEDGE_QUANTILE", "0.95"))
+UPSTREAM_HEDGE_MIN_DELAY_SECONDS = float(get_env("UPSTREAM_HEDGE_MIN_DELAY_SECONDS", "0.05"))
+# 連続でこの回数失敗した上流は、一定時間（秒）呼び出さずにすぐエラーを返す（0の場合は無効）
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(get_env("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RESET_SECONDS = float(get_env("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
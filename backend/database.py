@@ -1,4 +1,6 @@
 from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 from dotenv import load_dotenv
 from utils import get_env
 
@@ -8,10 +10,32 @@ load_dotenv()
 # DATABASE_URL を取得
 DATABASE_URL = get_env("DATABASE_URL")
 
+
+# 同期用URLを非同期ドライバ用URLに変換（PostgreSQL: asyncpg / SQLite: aiosqlite）
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+
+# 非同期用URL（未設定の場合は DATABASE_URL から変換）
+ASYNC_DATABASE_URL = get_env("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
 # エンジンを作成
 engine = create_engine(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
 
 # セッションを取得するための関数
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+# 非同期セッションを取得するための関数
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
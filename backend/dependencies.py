@@ -1,54 +1,269 @@
 from openai import AsyncOpenAI
 from azure.search.documents.aio import SearchClient
 from sqlmodel import Session
-from database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_session, get_async_session
 from repositories.conversation_repository import ConversationRepository
+from repositories.async_conversation_repository import AsyncConversationRepository
+from repositories.message_writer import MessageWriteBehind
 from repositories.search_repository import SearchRepository
+from repositories.local_search_repository import LocalSearchRepository
 from services.chat_service import ChatService
-from fastapi import Depends
+from services.query_rewrite_policy import QueryRewritePolicy
+from services.history_service import HistoryService
+from services.context_builder import ContextBuilder
+from caches.embedding_cache import EmbeddingCache
+from caches.answer_cache import AnswerCache
+from clients import UpstreamClients
+from profiling import RequestProfiler
+from admission import ConcurrencyLimiter, UpstreamLimits
+from singleflight import SingleFlight
+from resilience import CircuitBreaker, ResilientCall, UpstreamResilience
+from exceptions import EmbeddingError, RAGException, SearchError
+from typing import AsyncIterator
+from fastapi import Depends, Request
 import config
 
 
-# SearchClientの依存関係注入
-def get_search_client():
-    # Azure Searchクライアントの作成
-    search_client = SearchClient(
-        config.AZURE_SEARCH_ENDPOINT,
-        config.AZURE_SEARCH_INDEX_NAME,
-        config.AZURE_SEARCH_CREDENTIAL,
+# Embeddingキャッシュ（プロセス内で共有）
+embedding_cache = EmbeddingCache(
+    max_size=config.EMBEDDING_CACHE_MAX_SIZE,
+    ttl_seconds=config.EMBEDDING_CACHE_TTL_SECONDS,
+    db_path=config.EMBEDDING_CACHE_DB_PATH or None,
+    db_max_rows=config.EMBEDDING_CACHE_DB_MAX_ROWS,
+)
+
+# 回答キャッシュ（プロセス内で共有）
+answer_cache = AnswerCache(
+    max_size=config.ANSWER_CACHE_MAX_SIZE,
+    ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=config.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    index_version_path=config.INDEX_VERSION_FILE,
+    text_similarity_threshold=config.ANSWER_CACHE_TEXT_SIMILARITY_THRESHOLD,
+)
+
+# Query Rewriting ポリシー（プロセス内で共有）
+rewrite_policy = QueryRewritePolicy(
+    max_history_messages=config.REWRITE_MAX_HISTORY_MESSAGES,
+    max_history_chars=config.REWRITE_MAX_HISTORY_CHARS,
+    self_contained_max_chars=config.REWRITE_SELF_CONTAINED_MAX_CHARS,
+    cache_max_size=config.REWRITE_CACHE_MAX_SIZE,
+    cache_ttl_seconds=config.REWRITE_CACHE_TTL_SECONDS,
+)
+
+# 参考情報組み立て（トークン数キャッシュをプロセス内で共有）
+context_builder = ContextBuilder(
+    token_budget=config.CONTEXT_TOKEN_BUDGET,
+    max_passages=config.CONTEXT_MAX_PASSAGES,
+    dedupe_threshold=config.CONTEXT_DEDUPE_THRESHOLD,
+)
+
+# リクエスト単位のプロファイラー（記録したプロファイルをプロセス内で保持）
+request_profiler = RequestProfiler(
+    admin_token=config.PROFILE_ADMIN_TOKEN,
+    sample_rate=config.PROFILE_SAMPLE_RATE,
+    interval_seconds=config.PROFILE_INTERVAL_SECONDS,
+    max_profiles=config.PROFILE_MAX_STORED,
+)
+
+# チャットリクエストの受け付け制御（プロセス内で共有）
+chat_admission = ConcurrencyLimiter(
+    "chat_request",
+    max_concurrent=config.CHAT_MAX_CONCURRENT_REQUESTS,
+    max_queue=config.CHAT_MAX_QUEUED_REQUESTS,
+    queue_timeout_seconds=config.CHAT_QUEUE_TIMEOUT_SECONDS,
+)
+
+# 上流APIごとの同時呼び出し数の制限（プロセス内で共有）
+upstream_limits = UpstreamLimits(
+    chat=ConcurrencyLimiter(
+        "upstream_chat",
+        max_concurrent=config.UPSTREAM_CHAT_MAX_CONCURRENCY,
+        max_queue=config.UPSTREAM_MAX_QUEUED,
+        queue_timeout_seconds=config.UPSTREAM_QUEUE_TIMEOUT_SECONDS,
+    ),
+    embedding=ConcurrencyLimiter(
+        "upstream_embedding",
+        max_concurrent=config.UPSTREAM_EMBEDDING_MAX_CONCURRENCY,
+        max_queue=config.UPSTREAM_MAX_QUEUED,
+        queue_timeout_seconds=config.UPSTREAM_QUEUE_TIMEOUT_SECONDS,
+    ),
+    search=ConcurrencyLimiter(
+        "upstream_search",
+        max_concurrent=config.UPSTREAM_SEARCH_MAX_CONCURRENCY,
+        max_queue=config.UPSTREAM_MAX_QUEUED,
+        queue_timeout_seconds=config.UPSTREAM_QUEUE_TIMEOUT_SECONDS,
+    ),
+)
+
+# 同一呼び出しの集約（プロセス内で共有）
+single_flight = SingleFlight()
+
+
+# 上流API呼び出しのタイムアウト・再試行・ヘッジ・サーキットブレーカー（応答時間の履歴と状態をプロセス内で共有）
+def _resilient_call(
+    name: str, error_class: type[RAGException], timeout_seconds: float
+) -> ResilientCall:
+    return ResilientCall(
+        name,
+        error_class,
+        timeout_seconds=timeout_seconds,
+        max_attempts=config.UPSTREAM_MAX_ATTEMPTS,
+        base_delay=config.UPSTREAM_RETRY_BASE_DELAY_SECONDS,
+        max_delay=config.UPSTREAM_RETRY_MAX_DELAY_SECONDS,
+        hedge_quantile=config.UPSTREAM_HEDGE_QUANTILE,
+        hedge_min_delay=config.UPSTREAM_HEDGE_MIN_DELAY_SECONDS,
+        breaker=CircuitBreaker(
+            name,
+            failure_threshold=config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout_seconds=config.CIRCUIT_BREAKER_RESET_SECONDS,
+        ),
     )
-    return search_client
+
+
+upstream_resilience = UpstreamResilience(
+    embedding=_resilient_call("openai_embedding", EmbeddingError, config.EMBEDDING_TIMEOUT_SECONDS),
+    search=_resilient_call("search", SearchError, config.SEARCH_TIMEOUT_SECONDS),
+)
+
+
+# 上流APIクライアントの依存関係注入（lifespanで作成したものを共有）
+def get_upstream_clients(request: Request) -> UpstreamClients:
+    return request.app.state.upstream_clients
+
+
+# SearchClientの依存関係注入
+def get_search_client(
+    clients: UpstreamClients = Depends(get_upstream_clients),
+) -> SearchClient:
+    return clients.search_client
 
 
 # OpenAIクライアントの依存関係注入
-def get_openai_client():
-    # OpenAIクライアントの作成
-    openai_client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
-    return openai_client
+def get_openai_client(
+    clients: UpstreamClients = Depends(get_upstream_clients),
+) -> AsyncOpenAI:
+    return clients.openai_client
+
+
+# メッセージ書き込みバッファの依存関係注入（無効化されている場合はNone）
+def get_message_writer(request: Request) -> MessageWriteBehind | None:
+    return getattr(request.app.state, "message_writer", None)
+
+
+# Embeddingキャッシュの依存関係注入
+def get_embedding_cache() -> EmbeddingCache:
+    return embedding_cache
+
+
+# 回答キャッシュの依存関係注入（無効化されている場合はNone）
+def get_answer_cache() -> AnswerCache | None:
+    return answer_cache if config.ANSWER_CACHE_ENABLED else None
+
+
+# Query Rewriting ポリシーの依存関係注入（無効化されている場合はNone）
+def get_rewrite_policy() -> QueryRewritePolicy | None:
+    return rewrite_policy if config.REWRITE_POLICY_ENABLED else None
+
+
+# 会話履歴サービスの依存関係注入（サーバー側履歴モードでない場合はNone）
+def get_history_service(request: Request) -> HistoryService | None:
+    return getattr(request.app.state, "history_service", None)
+
+
+# 参考情報組み立ての依存関係注入
+def get_context_builder() -> ContextBuilder:
+    return context_builder
+
+
+# プロファイラーの依存関係注入
+def get_request_profiler() -> RequestProfiler:
+    return request_profiler
+
+
+# チャット受け付け制御の依存関係注入
+def get_chat_admission() -> ConcurrencyLimiter:
+    return chat_admission
+
+
+# 上流API同時呼び出し制限の依存関係注入
+def get_upstream_limits() -> UpstreamLimits:
+    return upstream_limits
+
+
+# 同一呼び出しの集約の依存関係注入（無効化されている場合はNone）
+def get_single_flight() -> SingleFlight | None:
+    return single_flight if config.SINGLE_FLIGHT_ENABLED else None
+
+
+# 上流API呼び出しの耐障害性設定の依存関係注入
+def get_upstream_resilience() -> UpstreamResilience:
+    return upstream_resilience
+
+
+# チャットリクエストの枠を確保し、ストリームの送信が終わるまで保持する
+# （確保できない場合は OverloadedError となり、ストリームを開始する前に 429 / 503 を返す）
+async def acquire_chat_admission(
+    limiter: ConcurrencyLimiter = Depends(get_chat_admission),
+) -> AsyncIterator[None]:
+    async with limiter.slot():
+        yield
 
 
 # ConversationRepositoryの依存関係注入
 def get_conversation_repository(
     session: Session = Depends(get_session),
+    message_writer: MessageWriteBehind | None = Depends(get_message_writer),
 ) -> ConversationRepository:
-    return ConversationRepository(session)
+    return ConversationRepository(session, message_writer)
+
 
+# AsyncConversationRepositoryの依存関係注入（チャット処理用）
+def get_async_conversation_repository(
+    session: AsyncSession = Depends(get_async_session),
+    message_writer: MessageWriteBehind | None = Depends(get_message_writer),
+) -> AsyncConversationRepository:
+    return AsyncConversationRepository(session, message_writer)
 
-# SearchRepositoryの依存関係注入
+
+# SearchRepositoryの依存関係注入（設定に応じてローカル検索に切り替える）
 def get_search_repository(
+    request: Request,
     search_client: SearchClient = Depends(get_search_client),
-) -> SearchRepository:
+) -> SearchRepository | LocalSearchRepository:
+    if config.SEARCH_BACKEND == "local":
+        return request.app.state.local_search_repository
     return SearchRepository(search_client)
 
 
 # ChatServiceの依存関係注入
 def get_chat_service(
     openai_client: AsyncOpenAI = Depends(get_openai_client),
-    search_repository: SearchRepository = Depends(get_search_repository),
-    conversation_repository: ConversationRepository = Depends(
-        get_conversation_repository
+    search_repository: SearchRepository | LocalSearchRepository = Depends(
+        get_search_repository
+    ),
+    conversation_repository: AsyncConversationRepository = Depends(
+        get_async_conversation_repository
     ),
+    embedding_cache: EmbeddingCache = Depends(get_embedding_cache),
+    answer_cache: AnswerCache | None = Depends(get_answer_cache),
+    rewrite_policy: QueryRewritePolicy | None = Depends(get_rewrite_policy),
+    history_service: HistoryService | None = Depends(get_history_service),
+    context_builder: ContextBuilder = Depends(get_context_builder),
+    upstream_limits: UpstreamLimits = Depends(get_upstream_limits),
+    single_flight: SingleFlight | None = Depends(get_single_flight),
+    upstream_resilience: UpstreamResilience = Depends(get_upstream_resilience),
 ) -> ChatService:
     return ChatService(
-        openai_client, search_repository, conversation_repository
+        openai_client,
+        search_repository,
+        conversation_repository,
+        embedding_cache,
+        answer_cache,
+        rewrite_policy,
+        history_service,
+        context_builder,
+        upstream_limits,
+        single_flight,
+        upstream_resilience,
     )
\ No newline at end of file
@@ -1,28 +1,51 @@
 from fastapi import Request
 from fastapi.responses import JSONResponse
-from exceptions import RAGException, SearchError, EmbeddingError, LLMError
+from exceptions import RAGException, SearchError, EmbeddingError, LLMError, OverloadedError
 from logger import get_logger
 
 logger = get_logger(__name__)
 
 
+# エラータイプに応じたユーザー向けメッセージ（ストリーム開始後のエラーイベントでも使用する）
+def user_message(exc: Exception) -> str:
+    if isinstance(exc, SearchError):
+        return "検索中にエラーが発生しました。しばらくしてから再度お試しください。"
+    if isinstance(exc, EmbeddingError):
+        return "質問の処理中にエラーが発生しました。"
+    if isinstance(exc, LLMError):
+        return "回答の生成中にエラーが発生しました。"
+    if isinstance(exc, RAGException):
+        return "システムエラーが発生しました。"
+    return "予期せぬエラーが発生しました。"
+
+
 async def rag_exception_handler(request: Request, exc: RAGException)-> JSONResponse:
+    # 混雑による拒否は想定内のため、スタックトレースなしで記録し Retry-After を付けて返す
+    if isinstance(exc, OverloadedError):
+        logger.warning(
+            f"RAG Exception: {exc.message}",
+            extra={
+                "extra_fields": {
+                    "status_code": exc.status_code,
+                    "retry_after": exc.retry_after,
+                }
+            },
+        )
+        return JSONResponse(
+            status_code=exc.status_code,
+            content={
+                "message": "現在混み合っています。しばらくしてから再度お試しください。",
+                "type": exc.__class__.__name__,
+            },
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
     # 詳細なエラーはログに記録
     logger.error(f"RAG Exception: {exc.message}", exc_info=True)
 
-    # エラータイプに応じたユーザー向けメッセージ
-    if isinstance(exc, SearchError):
-        user_message = "検索中にエラーが発生しました。しばらくしてから再度お試しください。"
-    elif isinstance(exc, EmbeddingError):
-        user_message = "質問の処理中にエラーが発生しました。"
-    elif isinstance(exc, LLMError):
-        user_message = "回答の生成中にエラーが発生しました。"
-    else:
-        user_message = "システムエラーが発生しました。"
-
     return JSONResponse(
         status_code=503,
-        content={"message": user_message, "type": exc.__class__.__name__},
+        content={"message": user_message(exc), "type": exc.__class__.__name__},
     )
 
 
@@ -17,4 +17,11 @@ class LLMError(RAGException):
     pass
 
 class ConfigurationError(RAGException):
-    pass
\ No newline at end of file
+    pass
+
+class OverloadedError(RAGException):
+    # 同時実行数の上限を超えて受け付けられない場合（status_code: 429 / 503、retry_after: 再試行までの秒数）
+    def __init__(self, message: str, status_code: int = 503, retry_after: int = 1):
+        self.status_code = status_code
+        self.retry_after = retry_after
+        super().__init__(message, {"status_code": status_code, "retry_after": retry_after})
@@ -0,0 +1,54 @@
+"""チェックポイントモジュール
+
+登録が完了したドキュメントIDを、登録時の内容ハッシュと合わせて1行ずつ追記する。
+処理が途中で停止しても、次回の実行では記録済みのIDを読み飛ばして続きから再開できる。
+停止後に内容が変わったドキュメントはハッシュが一致しないため、読み飛ばさずに登録し直す
+（ハッシュのない行は以前の形式の記録で、IDだけで判定する）。
+"""
+
+import os
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+        # ID → 内容ハッシュ（以前の形式の記録は None）
+        self.completed: dict[str, str | None] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    document_id, _, digest = line.strip().partition("\t")
+                    if document_id:
+                        self.completed[document_id] = digest or None
+
+    # 登録済みかどうか（digest を指定した場合は、記録した内容ハッシュとも一致すること）
+    def is_completed(self, document_id: str, digest: str | None = None) -> bool:
+        if document_id not in self.completed:
+            return False
+        recorded = self.completed[document_id]
+        return recorded is None or digest is None or recorded == digest
+
+    # 登録完了したIDを記録（追記後にfsyncして、クラッシュ時も記録を残す）
+    def mark_completed(
+        self, document_ids: list[str], digests: list[str] | None = None
+    ) -> None:
+        if not document_ids:
+            return
+        records = list(zip(document_ids, digests or [""] * len(document_ids)))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(
+                "".join(
+                    f"{document_id}\t{digest}\n" if digest else f"{document_id}\n"
+                    for document_id, digest in records
+                )
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        for document_id, digest in records:
+            self.completed[document_id] = digest or None
+
+    # すべて完了したらチェックポイントを削除
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.completed.clear()
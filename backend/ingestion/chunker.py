@@ -0,0 +1,218 @@
+"""チャンク分割モジュール
+
+ドキュメントの content を、条（第N条）・段落・文の境界で最大トークン数以下のチャンクに分割する。
+- 条の先頭では、チャンクが半分以上埋まっていれば区切り、前の条の文を重複として持ち越さない
+- それ以外の区切りでは、直前のチャンク末尾の文を重複（オーバーラップ）として次のチャンクの先頭に含める
+- 1文が最大トークン数を超える場合のみ、文字数で強制的に分割する
+各チャンクは親ドキュメントのID・ページ・カテゴリ・出典を引き継ぐ。
+大量のドキュメントはプロセスプールで並列に分割する。
+非同期版（split_all_async）は一定件数ずつ別プロセス・別スレッドで分割し、イベントループを止めない。
+"""
+
+import asyncio
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import AsyncIterator, Iterable, Iterator
+from tokenizer import count_tokens
+
+ARTICLE_PATTERN = re.compile(r"\s*第[0-9０-９一二三四五六七八九十百千]+条")
+# 文末・改行の直後で区切る（「…という。）」のような括弧内の句点では区切らない）
+UNIT_BOUNDARY_PATTERN = re.compile(r"(?<=[。！？!?\n])(?![」』）)])")
+
+# 区切りの種類
+ARTICLE = "article"
+PARAGRAPH = "paragraph"
+SENTENCE = "sentence"
+
+
+# チャンクIDを作成（親ID + 連番）
+def make_chunk_id(parent_id: str, index: int) -> str:
+    return f"{parent_id}__{index:03d}"
+
+
+# ドキュメントを1件分割（プロセスプールから呼ばれるためモジュール関数にしている）
+def split_document(document: dict, max_tokens: int, overlap_tokens: int) -> list[dict]:
+    parent_id = str(document["id"])
+    base = {key: value for key, value in document.items() if key not in ("id", "content")}
+    return [
+        {
+            **base,
+            "id": make_chunk_id(parent_id, index),
+            "parent_id": parent_id,
+            "chunk_index": index,
+            "content": content,
+        }
+        for index, content in enumerate(
+            split_text(document.get("content", ""), max_tokens, overlap_tokens)
+        )
+    ]
+
+
+# 複数のドキュメントをまとめて分割（プロセスプールへの受け渡し回数を減らす）
+def split_documents(documents: list[dict], max_tokens: int, overlap_tokens: int) -> list[list[dict]]:
+    return [split_document(document, max_tokens, overlap_tokens) for document in documents]
+
+
+# テキストをチャンクに分割
+def split_text(text: str, max_tokens: int, overlap_tokens: int) -> list[str]:
+    chunks: list[str] = []
+    current: list[tuple[str, int]] = []
+    current_tokens = 0
+
+    for unit, boundary in _split_units(text, max_tokens):
+        tokens = count_tokens(unit)
+        if current and (
+            current_tokens + tokens > max_tokens
+            or (boundary == ARTICLE and current_tokens >= max_tokens // 2)
+        ):
+            chunks.append("".join(u for u, _ in current).strip())
+            carried: list[tuple[str, int]] = []
+            if boundary != ARTICLE:
+                carried = _overlap(current, overlap_tokens, max_tokens - tokens)
+            current = carried
+            current_tokens = sum(t for _, t in carried)
+        current.append((unit, tokens))
+        current_tokens += tokens
+
+    if current:
+        chunks.append("".join(u for u, _ in current).strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+# 直前のチャンク末尾から、重複として持ち越す文を選ぶ（チャンク全体は持ち越さない）
+def _overlap(
+    units: list[tuple[str, int]], overlap_tokens: int, available_tokens: int
+) -> list[tuple[str, int]]:
+    carried: list[tuple[str, int]] = []
+    total = 0
+    for unit, tokens in reversed(units[1:]):
+        if total + tokens > min(overlap_tokens, available_tokens):
+            break
+        carried.insert(0, (unit, tokens))
+        total += tokens
+    return carried
+
+
+# 文単位に分割し、各文の直前の区切りの種類を判定（連結すると元のテキストに戻る）
+def _split_units(text: str, max_tokens: int) -> list[tuple[str, str]]:
+    units: list[list[str]] = []
+    for piece in UNIT_BOUNDARY_PATTERN.split(text):
+        if not piece:
+            continue
+        # 空白だけの断片は直前の文に含める
+        if units and not piece.strip():
+            units[-1][0] += piece
+            continue
+        line_start = not units or units[-1][0].endswith("\n")
+        if line_start and ARTICLE_PATTERN.match(piece):
+            boundary = ARTICLE
+        elif line_start:
+            boundary = PARAGRAPH
+        else:
+            boundary = SENTENCE
+        units.append([piece, boundary])
+
+    # 条の見出し行（「第1条（目的）」など）は、収まる範囲で続く文と同じ単位にする
+    merged: list[list[str]] = []
+    for unit in units:
+        if (
+            merged
+            and _is_heading(merged[-1])
+            and count_tokens(merged[-1][0] + unit[0]) <= max_tokens
+        ):
+            merged[-1][0] += unit[0]
+        else:
+            merged.append(unit)
+
+    # 最大トークン数を超える文は強制的に分割する
+    result: list[tuple[str, str]] = []
+    for unit, boundary in merged:
+        if count_tokens(unit) <= max_tokens:
+            result.append((unit, boundary))
+            continue
+        for index, piece in enumerate(_hard_split(unit, max_tokens)):
+            result.append((piece, boundary if index == 0 else SENTENCE))
+    return result
+
+
+def _is_heading(unit: list[str]) -> bool:
+    text, boundary = unit
+    return boundary == ARTICLE and text.endswith("\n") and "。" not in text
+
+
+# 文字数で強制的に分割
+def _hard_split(text: str, max_tokens: int) -> list[str]:
+    pieces: list[str] = []
+    start = 0
+    while start < len(text):
+        size = max(1, max_tokens)
+        while size > 1 and count_tokens(text[start : start + size]) > max_tokens:
+            size = size * 3 // 4
+        pieces.append(text[start : start + size])
+        start += size
+    return pieces
+
+
+class Chunker:
+    def __init__(
+        self,
+        max_tokens: int = 400,
+        overlap_tokens: int = 50,
+        workers: int = 1,
+        batch_size: int = 256,
+    ):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.workers = workers
+        self.batch_size = batch_size
+
+    # 設定を表す文字列（マニフェストに記録し、設定変更時に再登録する）
+    @property
+    def signature(self) -> str:
+        return f"{self.max_tokens}:{self.overlap_tokens}"
+
+    # ドキュメントIDとチャンク一覧の組を入力順に返す（一定件数ずつプロセスプールで分割）
+    def split_all(self, documents: Iterable[dict]) -> Iterator[tuple[str, list[dict]]]:
+        split = partial(
+            split_document, max_tokens=self.max_tokens, overlap_tokens=self.overlap_tokens
+        )
+        iterator = iter(documents)
+        if self.workers <= 1:
+            for document in iterator:
+                yield str(document["id"]), split(document)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while batch := list(islice(iterator, self.batch_size)):
+                chunksize = max(1, len(batch) // (self.workers * 4))
+                for document, chunks in zip(batch, executor.map(split, batch, chunksize=chunksize)):
+                    yield str(document["id"]), chunks
+
+    # split_all の非同期版（バッチごとに run_in_executor で分割し、その間もイベントループを動かす）
+    async def split_all_async(
+        self, documents: Iterable[dict]
+    ) -> AsyncIterator[tuple[str, list[dict]]]:
+        loop = asyncio.get_running_loop()
+        split_batch = partial(
+            split_documents, max_tokens=self.max_tokens, overlap_tokens=self.overlap_tokens
+        )
+        iterator = iter(documents)
+        # 1プロセスの場合はスレッドで分割する（loop の既定のスレッドプール）
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            while batch := list(islice(iterator, self.batch_size)):
+                # プロセスプールでは小分けにして並列に分割し、入力順に結合する
+                size = max(1, len(batch) // (self.workers * 4)) if executor else len(batch)
+                parts = await asyncio.gather(
+                    *(
+                        loop.run_in_executor(executor, split_batch, batch[start : start + size])
+                        for start in range(0, len(batch), size)
+                    )
+                )
+                for document, chunks in zip(batch, (chunks for part in parts for chunks in part)):
+                    yield str(document["id"]), chunks
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
@@ -0,0 +1,151 @@
+"""マニフェストモジュール
+
+登録済みドキュメントごとの内容ハッシュ・Embeddingモデル・チャンク分割設定と、
+インデックスに登録したチャンクIDを記録する。差分同期では、マニフェストと入力を比較して新規・変更・削除されたドキュメントだけを処理する。
+変更で不要になったチャンクID（チャンク分割前のドキュメントIDを含む）は、削除できるまで
+エントリの stale に残し、中断しても次回の実行で削除する。
+記録は1行1エントリの追記形式（同じIDは後の行が優先）で、登録したバッチごとに追記するため
+途中で停止しても完了分は失われない。同期完了時に最新の状態だけを書き直す。
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Iterable
+
+# ドキュメントの内容ハッシュ（Embeddingを除いた全フィールドから計算）
+def content_hash(document: dict) -> str:
+    payload = {key: value for key, value in document.items() if key != "embedding"}
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SyncPlan:
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    # 再Embedding・登録が必要なID
+    @property
+    def to_upload(self) -> set[str]:
+        return set(self.added) | set(self.changed)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.changed or self.deleted)
+
+    # 差分の概要（ドライラン表示用）
+    def describe(self, limit: int = 10) -> str:
+        lines = [
+            f"新規: {len(self.added)}件, 変更: {len(self.changed)}件, "
+            f"削除: {len(self.deleted)}件, 変更なし: {self.unchanged}件"
+        ]
+        for label, ids in (("+", self.added), ("~", self.changed), ("-", self.deleted)):
+            for document_id in ids[:limit]:
+                lines.append(f"  {label} {document_id}")
+            if len(ids) > limit:
+                lines.append(f"  {label} ...他{len(ids) - limit}件")
+        return "\n".join(lines)
+
+
+class Manifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry.get("deleted"):
+                        self.entries.pop(entry["id"], None)
+                    else:
+                        self.entries[entry["id"]] = entry
+
+    # 入力と比較して差分を作成（入力はID→内容ハッシュ）
+    def plan(self, source_hashes: dict[str, str], model: str, chunking: str = "") -> SyncPlan:
+        plan = SyncPlan()
+        for document_id, digest in source_hashes.items():
+            entry = self.entries.get(document_id)
+            if entry is None:
+                plan.added.append(document_id)
+            elif (
+                entry["hash"] != digest
+                or entry["model"] != model
+                or entry.get("chunking", "") != chunking
+            ):
+                plan.changed.append(document_id)
+            else:
+                plan.unchanged += 1
+        plan.deleted = [
+            document_id for document_id in self.entries if document_id not in source_hashes
+        ]
+        return plan
+
+    # インデックス上のID（チャンク分割前に登録したものはドキュメントIDそのもの）
+    def index_ids(self, document_id: str) -> list[str]:
+        entry = self.entries.get(document_id)
+        if entry is None:
+            return []
+        return entry.get("chunks", [document_id])
+
+    # 登録したドキュメントを記録（各エントリは id, hash, model, chunking, chunks）
+    # 前回から使われなくなったインデックス上のIDは、削除待ちとして stale に引き継ぐ
+    def record_uploaded(self, entries: list[dict]) -> None:
+        for entry in entries:
+            previous = set(self.index_ids(entry["id"]))
+            previous.update(self.entries.get(entry["id"], {}).get("stale", []))
+            stale = sorted(previous - set(entry.get("chunks", [entry["id"]])))
+            if stale:
+                entry["stale"] = stale
+        self._append(entries)
+        for entry in entries:
+            self.entries[entry["id"]] = entry
+
+    # 削除待ちのインデックス上のID
+    def stale_ids(self) -> list[str]:
+        return [i for entry in self.entries.values() for i in entry.get("stale", [])]
+
+    # 削除できたIDを削除待ちから外す（ファイルには compact で反映する）
+    def clear_stale(self, deleted: set[str]) -> None:
+        for entry in self.entries.values():
+            if "stale" not in entry:
+                continue
+            stale = [i for i in entry["stale"] if i not in deleted]
+            if stale:
+                entry["stale"] = stale
+            else:
+                del entry["stale"]
+
+    # 削除したドキュメントを記録
+    def record_deleted(self, document_ids: Iterable[str]) -> None:
+        document_ids = list(document_ids)
+        self._append([{"id": document_id, "deleted": True} for document_id in document_ids])
+        for document_id in document_ids:
+            self.entries.pop(document_id, None)
+
+    # すべて破棄（全件登録し直す場合）
+    def reset(self) -> None:
+        self.entries.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    # 最新の状態だけを書き直す（一時ファイル経由で置き換える）
+    def compact(self) -> None:
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+
+    def _append(self, entries: list[dict]) -> None:
+        if not entries:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,281 @@
+"""取り込みパイプラインモジュール
+
+読み込み → Embedding（複数件をまとめて、同時実行数を制限して並行実行） → 登録（一定件数ごと）
+の各段階をキューでつなぎ、ストリーミングで処理する。
+一時的な失敗は指数バックオフ（ジッター付き）で再試行し、登録完了したIDはチェックポイントに記録する。
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Protocol, TypeVar
+from openai import AsyncOpenAI
+from ingestion.checkpoint import Checkpoint
+from ingestion.manifest import content_hash
+from resilience import is_transient
+from tokenizer import count_tokens
+
+T = TypeVar("T")
+
+# キューの終端を表す番兵
+_DONE = None
+
+
+class Sink(Protocol):
+    async def upload(self, documents: list[dict]) -> list[str]: ...
+
+    async def delete(self, document_ids: list[str]) -> list[str]: ...
+
+
+# 一時的な失敗（タイムアウト・接続エラー・429・5xx）を指数バックオフ（フルジッター）で再試行
+# （400/401 などそれ以外の失敗は再試行しても成功しないため、すぐに送出する）
+async def with_retry(
+    operation: Callable[[], Awaitable[T]],
+    max_attempts: int = 5,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0,
+    on_retry: Callable[[int, Exception], None] | None = None,
+) -> T:
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await operation()
+        except Exception as e:
+            if attempt == max_attempts or not is_transient(e):
+                raise
+            if on_retry is not None:
+                on_retry(attempt, e)
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+    raise AssertionError("unreachable")
+
+
+# 同期・非同期どちらの入力も async for で読めるようにする
+async def _iterate(documents: Iterable[T] | AsyncIterable[T]) -> AsyncIterator[T]:
+    if isinstance(documents, AsyncIterable):
+        async for document in documents:
+            yield document
+    else:
+        for document in documents:
+            yield document
+
+
+@dataclass
+class IngestionStats:
+    started_at: float = field(default_factory=time.perf_counter)
+    uploaded: int = 0
+    skipped: int = 0
+    tokens: int = 0
+    embedding_requests: int = 0
+    retries: int = 0
+    failed_ids: list[str] = field(default_factory=list)
+
+    # スループットを含む集計結果
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "uploaded": self.uploaded,
+            "skipped": self.skipped,
+            "failed": len(self.failed_ids),
+            "embedding_requests": self.embedding_requests,
+            "retries": self.retries,
+            "elapsed_seconds": round(elapsed, 2),
+            "docs_per_second": round(self.uploaded / elapsed, 2) if elapsed else 0.0,
+            "tokens_per_second": round(self.tokens / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+class IngestionPipeline:
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        sinks: list[Sink],
+        checkpoint: Checkpoint,
+        embedding_model: str,
+        embed_batch_size: int = 64,
+        embed_batch_max_tokens: int = 100_000,
+        concurrency: int = 4,
+        upload_batch_size: int = 500,
+        max_attempts: int = 5,
+        progress_interval: int = 500,
+        on_uploaded: Callable[[list[dict]], None] | None = None,
+    ):
+        self.openai_client = openai_client
+        self.sinks = sinks
+        self.checkpoint = checkpoint
+        self.embedding_model = embedding_model
+        self.embed_batch_size = embed_batch_size
+        self.embed_batch_max_tokens = embed_batch_max_tokens
+        self.concurrency = concurrency
+        self.upload_batch_size = upload_batch_size
+        self.max_attempts = max_attempts
+        self.progress_interval = progress_interval
+        self.on_uploaded = on_uploaded
+        self.stats = IngestionStats()
+        self._active_embedders = 0
+        self._last_progress = 0
+        # 登録待ちのドキュメントの内容ハッシュ（Embedding生成で内容を書き換える前に計算する）
+        self._digests: dict[str, str] = {}
+
+    # パイプラインを実行
+    async def run(self, documents: Iterable[dict] | AsyncIterable[dict]) -> IngestionStats:
+        self.stats = IngestionStats()
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        upload_queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        self._active_embedders = self.concurrency
+
+        async with asyncio.TaskGroup() as group:
+            group.create_task(self._produce(documents, embed_queue))
+            for _ in range(self.concurrency):
+                group.create_task(self._embed_worker(embed_queue, upload_queue))
+            group.create_task(self._upload_worker(upload_queue))
+
+        return self.stats
+
+    # ドキュメントを読み込み、Embedding用のバッチにまとめる（登録済みは読み飛ばす）
+    async def _produce(
+        self, documents: Iterable[dict] | AsyncIterable[dict], embed_queue: asyncio.Queue
+    ) -> None:
+        batch: list[dict] = []
+        batch_tokens = 0
+        async for document in _iterate(documents):
+            document_id = str(document["id"])
+            digest = content_hash(document)
+            if self.checkpoint.is_completed(document_id, digest):
+                self.stats.skipped += 1
+                continue
+            self._digests[document_id] = digest
+
+            tokens = count_tokens(document["content"])
+            if batch and (
+                len(batch) >= self.embed_batch_size
+                or batch_tokens + tokens > self.embed_batch_max_tokens
+            ):
+                await embed_queue.put(batch)
+                batch, batch_tokens = [], 0
+            batch.append(document)
+            batch_tokens += tokens
+
+        if batch:
+            await embed_queue.put(batch)
+        for _ in range(self.concurrency):
+            await embed_queue.put(_DONE)
+
+    # バッチ単位でEmbeddingを生成し、登録キューに渡す
+    async def _embed_worker(
+        self, embed_queue: asyncio.Queue, upload_queue: asyncio.Queue
+    ) -> None:
+        while (batch := await embed_queue.get()) is not _DONE:
+            try:
+                await self._embed_batch(batch)
+            except Exception as e:
+                # 再試行しても失敗したバッチは登録せず、失敗として記録する
+                ids = [str(document["id"]) for document in batch]
+                for document_id in ids:
+                    self._digests.pop(document_id, None)
+                self.stats.failed_ids.extend(ids)
+                print(f"Embedding生成に失敗しました（{len(ids)}件）: {e}")
+                continue
+            for document in batch:
+                await upload_queue.put(document)
+
+        # 最後に終了したワーカーが登録キューを閉じる
+        self._active_embedders -= 1
+        if self._active_embedders == 0:
+            await upload_queue.put(_DONE)
+
+    async def _embed_batch(self, batch: list[dict]) -> None:
+        def on_retry(attempt: int, error: Exception) -> None:
+            self.stats.retries += 1
+            print(f"Embedding生成を再試行します（{attempt}回目）: {error}")
+
+        response = await with_retry(
+            lambda: self.openai_client.embeddings.create(
+                model=self.embedding_model,
+                input=[document["content"] for document in batch],
+            ),
+            max_attempts=self.max_attempts,
+            on_retry=on_retry,
+        )
+        self.stats.embedding_requests += 1
+
+        usage = getattr(response, "usage", None)
+        total_tokens = getattr(usage, "total_tokens", None)
+        self.stats.tokens += (
+            total_tokens
+            if isinstance(total_tokens, int)
+            else sum(count_tokens(document["content"]) for document in batch)
+        )
+
+        for item in sorted(response.data, key=lambda item: item.index):
+            document = batch[item.index]
+            document["embedding"] = item.embedding
+            document["page"] = str(document["page"])
+
+    # 一定件数ごとに登録し、成功したIDをチェックポイントに記録
+    async def _upload_worker(self, upload_queue: asyncio.Queue) -> None:
+        pending: list[dict] = []
+        while (document := await upload_queue.get()) is not _DONE:
+            pending.append(document)
+            if len(pending) >= self.upload_batch_size:
+                await self._upload_batch(pending)
+                pending = []
+        if pending:
+            await self._upload_batch(pending)
+
+    async def _upload_batch(self, documents: list[dict]) -> None:
+        def on_retry(attempt: int, error: Exception) -> None:
+            self.stats.retries += 1
+            print(f"登録を再試行します（{attempt}回目）: {error}")
+
+        failed: set[str] = set()
+        for sink in self.sinks:
+            try:
+                failed_ids = await with_retry(
+                    lambda: sink.upload(documents),
+                    max_attempts=self.max_attempts,
+                    on_retry=on_retry,
+                )
+                failed.update(failed_ids)
+            except Exception as e:
+                print(f"登録に失敗しました（{len(documents)}件）: {e}")
+                failed.update(str(document["id"]) for document in documents)
+
+        ids = [str(d["id"]) for d in documents]
+        digests = [self._digests.pop(document_id, "") for document_id in ids]
+        succeeded = [document_id for document_id in ids if document_id not in failed]
+        self.checkpoint.mark_completed(
+            succeeded,
+            [digest for document_id, digest in zip(ids, digests) if document_id not in failed],
+        )
+        if self.on_uploaded is not None:
+            self.on_uploaded([d for d in documents if str(d["id"]) not in failed])
+        self.stats.failed_ids.extend(failed)
+        self.stats.uploaded += len(succeeded)
+
+        if self.stats.uploaded - self._last_progress >= self.progress_interval:
+            self._last_progress = self.stats.uploaded
+            report = self.stats.report()
+            print(
+                f"{report['uploaded']}件登録済み"
+                f"（{report['docs_per_second']} docs/s, {report['tokens_per_second']} tokens/s）"
+            )
+
+    # 一定件数ごとに削除（削除できたIDを返す）
+    async def delete(self, document_ids: list[str]) -> list[str]:
+        deleted: list[str] = []
+        for start in range(0, len(document_ids), self.upload_batch_size):
+            batch = document_ids[start : start + self.upload_batch_size]
+            failed: set[str] = set()
+            for sink in self.sinks:
+                try:
+                    failed.update(
+                        await with_retry(
+                            lambda: sink.delete(batch), max_attempts=self.max_attempts
+                        )
+                    )
+                except Exception as e:
+                    print(f"削除に失敗しました（{len(batch)}件）: {e}")
+                    failed.update(batch)
+            self.stats.failed_ids.extend(failed)
+            deleted.extend(document_id for document_id in batch if document_id not in failed)
+        return deleted
@@ -0,0 +1,71 @@
+"""入力ファイル読み込みモジュール
+
+ファイル全体をメモリに載せず、ドキュメントを1件ずつ読み出す。
+- .jsonl: 1行1ドキュメント
+- それ以外: ドキュメントのJSON配列（チャンク単位で読み込みながら逐次デコード）
+"""
+
+import json
+from typing import IO, Iterator
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+# 入力ファイルからドキュメントを1件ずつ読み出す
+def iter_documents(path: str) -> Iterator[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(f)
+
+
+# JSON配列を要素ごとに逐次デコード
+def iter_json_array(f: IO[str], chunk_size: int = READ_CHUNK_SIZE) -> Iterator[dict]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+
+    while not eof:
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+        position = 0
+
+        if not started:
+            position = _skip_whitespace(buffer, position)
+            if position == len(buffer):
+                continue
+            if buffer[position] != "[":
+                raise ValueError("入力ファイルはJSON配列である必要があります")
+            started = True
+            position += 1
+
+        while True:
+            position = _skip_whitespace(buffer, position, ",")
+            if position == len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                document, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # 要素が途中で切れているため、次のチャンクを読み込む
+                if eof:
+                    raise
+                break
+            yield document
+
+        buffer = buffer[position:]
+
+    if started:
+        raise ValueError("JSON配列が閉じられていません")
+
+
+def _skip_whitespace(buffer: str, position: int, extra: str = "") -> int:
+    while position < len(buffer) and (buffer[position].isspace() or buffer[position] in extra):
+        position += 1
+    return position
@@ -0,0 +1,68 @@
+"""登録先モジュール
+
+Embedding済みのドキュメントをバッチ単位で書き込む。
+upload() / delete() は書き込みに失敗したドキュメントIDの一覧を返す。
+"""
+
+import json
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
+from azure.search.documents.indexes.models import SearchFieldDataType, SimpleField
+
+# チャンク分割で追加したフィールド（既存のインデックスにない場合は登録前に追加する）
+CHUNK_FIELDS = [
+    SimpleField(name="parent_id", type=SearchFieldDataType.String, filterable=True),
+    SimpleField(name="chunk_index", type=SearchFieldDataType.Int32),
+]
+
+
+# インデックスにチャンク用のフィールドがなければ追加し、追加したフィールド名を返す
+# （既存のインデックスへのフィールド追加は再作成なしで反映される）
+async def ensure_chunk_fields(index_client: SearchIndexClient, index_name: str) -> list[str]:
+    index = await index_client.get_index(index_name)
+    existing = {field.name for field in index.fields}
+    missing = [field for field in CHUNK_FIELDS if field.name not in existing]
+    if missing:
+        index.fields.extend(missing)
+        await index_client.create_or_update_index(index)
+    return [field.name for field in missing]
+
+
+class AzureSearchSink:
+    def __init__(self, search_client: SearchClient, merge: bool = False):
+        self.search_client = search_client
+        self.merge = merge
+
+    # Azure AI Search に登録（差分同期では merge_or_upload を使用）
+    async def upload(self, documents: list[dict]) -> list[str]:
+        if self.merge:
+            results = await self.search_client.merge_or_upload_documents(documents)
+        else:
+            results = await self.search_client.upload_documents(documents)
+        return [result.key for result in results if not result.succeeded]
+
+    # Azure AI Search から削除
+    async def delete(self, document_ids: list[str]) -> list[str]:
+        results = await self.search_client.delete_documents(
+            [{"id": document_id} for document_id in document_ids]
+        )
+        return [result.key for result in results if not result.succeeded]
+
+
+class SnapshotSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    # ローカル検索用スナップショット（JSON Lines）に追記
+    async def upload(self, documents: list[dict]) -> list[str]:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for document in documents:
+                f.write(json.dumps(document, ensure_ascii=False) + "\n")
+        return []
+
+    # 削除済みの印を追記（読み込み時に取り除かれる）
+    async def delete(self, document_ids: list[str]) -> list[str]:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for document_id in document_ids:
+                f.write(json.dumps({"id": document_id, "@deleted": True}) + "\n")
+        return []
@@ -1,37 +1,147 @@
-import logging
+"""ロギングモジュール
+
+ログはキュー（QueueHandler）に積むだけで呼び出し元に戻り、JSONへの変換と出力は
+QueueListener の別スレッドで行うため、イベントループをブロックしない。
+- ハンドラーはプロセス内で1度だけ作成し、get_logger を何度呼んでも重複して追加しない
+- orjson がインストールされていれば高速なJSONエンコーダーを使用する
+- 大量に出力されるログ（リクエストログなど）はレベルごとの割合でサンプリングできる
+- 処理中のリクエストIDをコンテキスト変数から取得し、すべてのログに付与する
+"""
+
+import atexit
 import json
-from datetime import datetime
+import logging
+import queue
+import random
+import threading
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from utils import get_env
+
+try:
+    import orjson
+except ImportError:  # 任意の依存関係
+    orjson = None
+
+# 処理中のリクエストID（LoggingMiddleware が設定し、同じリクエストから作成したタスクにも引き継がれる）
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# 出力するログレベル
+LOG_LEVEL = get_env("LOG_LEVEL", "INFO").upper()
+
+# サンプリング対象ロガーのレベルごとの出力割合（WARNING以上は常に出力）
+LOG_SAMPLE_RATES = {
+    logging.DEBUG: float(get_env("LOG_SAMPLE_RATE_DEBUG", "1.0")),
+    logging.INFO: float(get_env("LOG_SAMPLE_RATE_INFO", "1.0")),
+}
+
+
+# JSON文字列に変換（orjson があれば使用）
+def _dumps(data: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, default=str)
 
 
 class JSONFormatter(logging.Formatter):
     def format(self, record):
         log_data = {
-            "timestamp": datetime.now().isoformat() + "Z",
+            # 出力スレッドで変換するため、時刻はログを記録した時点のものを使う
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc)
+            .replace(tzinfo=None)
+            .isoformat()
+            + "Z",
             "level": record.levelname,
             "message": record.getMessage(),
             "module": record.module,
             "function": record.funcName,
             "line": record.lineno,
         }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            log_data["request_id"] = request_id
 
         # extra属性があれば追加
         if hasattr(record, "extra_fields"):
             log_data.update(record.extra_fields) # type: ignore[attr-defined]
-        # pythonの辞書をJSON形式で出力
-        return json.dumps(log_data, ensure_ascii=False)
+        if record.exc_info:
+            log_data["exception"] = self.formatException(record.exc_info)
+        return _dumps(log_data)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # 標準の prepare は呼び出し元でフォーマットまで行うため、メッセージの確定と
+    # リクエストIDの取得（コンテキスト変数は出力スレッドから参照できない）だけにとどめる
+    # （同一プロセス内のキューなので、例外情報はそのまま出力スレッドに渡せる）
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = request_id_var.get()
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """INFO以下のログを指定した割合だけ通す
+
+    request_id を持つログは、同じリクエストのログがまとめて残るようにIDから判定する。
+    出力したログには sample_rate を付与し、集計時に件数を補正できるようにする。
+    """
+
+    def __init__(self, rates: dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0:
+            return True
+
+        extra_fields = getattr(record, "extra_fields", None) or {}
+        request_id = extra_fields.get("request_id") or request_id_var.get()
+        if request_id is not None:
+            sampled = zlib.crc32(str(request_id).encode("utf-8")) / 0xFFFFFFFF < rate
+        else:
+            sampled = random.random() < rate
+        if sampled:
+            record.extra_fields = {**extra_fields, "sample_rate": rate}
+        return sampled
+
+
+_queue_handler: QueueHandler | None = None
+_listener: QueueListener | None = None
+_setup_lock = threading.Lock()
+
+
+# キューと出力スレッドを1度だけ作成
+def setup_logging() -> QueueHandler:
+    global _queue_handler, _listener
+    with _setup_lock:
+        if _queue_handler is None:
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(JSONFormatter())
+
+            log_queue: queue.SimpleQueue = queue.SimpleQueue()
+            _queue_handler = _DeferredQueueHandler(log_queue)
+            _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+            _listener.start()
+            # 終了時にキューに残ったログを出力しきる
+            atexit.register(_listener.stop)
+    return _queue_handler
+
 
 # モジュールごとにloggerを取得する関数
-def get_logger(name: str) -> logging.Logger:
+# sampled=True の場合は LOG_SAMPLE_RATE_* に従ってINFO以下のログを間引く
+def get_logger(name: str, sampled: bool = False) -> logging.Logger:
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-
-    # 出力先設定
-    handler = logging.StreamHandler()
+    logger.setLevel(LOG_LEVEL)
 
-    # 出力フォーマット設定
-    handler.setFormatter(JSONFormatter())
+    handler = setup_logging()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
 
-    # 出力先（ハンドラー）をロガーに追加
-    logger.addHandler(handler)
+    if sampled and not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
 
     return logger
@@ -1,15 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from middleware import LoggingMiddleware
+from metrics import monitor_event_loop_lag
 from logger import get_logger
-from routers import chat, history
+from routers import chat, history, metrics, profiles, stats
 from exception_handlers import rag_exception_handler, general_exception_handler
 from exceptions import RAGException
+from clients import UpstreamClients
+from dependencies import embedding_cache, upstream_limits
+from database import async_engine
+from repositories.message_writer import MessageWriteBehind
+from repositories.local_search_repository import LocalSearchRepository
+from services.history_service import HistoryService
+import config
 
 logger = get_logger(__name__)
 
+
+# アプリのライフサイクル管理（アプリ全体で共有する資源を起動時に作成し、終了時に閉じる）
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.upstream_clients = UpstreamClients.create()
+    if config.SEARCH_BACKEND == "local":
+        app.state.local_search_repository = LocalSearchRepository.from_snapshot(
+            config.LOCAL_SEARCH_SNAPSHOT
+        )
+        logger.info(
+            "ローカル検索インデックスを読み込みました",
+            extra={
+                "extra_fields": {
+                    "documents": len(app.state.local_search_repository.documents)
+                }
+            },
+        )
+    if config.WRITE_BEHIND_ENABLED:
+        app.state.message_writer = MessageWriteBehind(
+            async_engine,
+            batch_size=config.WRITE_BEHIND_BATCH_SIZE,
+            flush_interval_seconds=config.WRITE_BEHIND_FLUSH_INTERVAL_SECONDS,
+        )
+        app.state.message_writer.start()
+    if config.HISTORY_MODE == "server":
+        app.state.history_service = HistoryService(
+            async_engine,
+            token_budget=config.HISTORY_TOKEN_BUDGET,
+            summary_enabled=config.HISTORY_SUMMARY_ENABLED,
+            upstream_limits=upstream_limits,
+        )
+    lag_monitor = (
+        asyncio.create_task(monitor_event_loop_lag(config.EVENT_LOOP_LAG_INTERVAL_SECONDS))
+        if config.EVENT_LOOP_LAG_INTERVAL_SECONDS > 0
+        else None
+    )
+    yield
+    if lag_monitor is not None:
+        lag_monitor.cancel()
+    if config.HISTORY_MODE == "server":
+        await app.state.history_service.wait_pending()
+    if config.WRITE_BEHIND_ENABLED:
+        await app.state.message_writer.stop()
+    await app.state.upstream_clients.aclose()
+    embedding_cache.close()
+    await async_engine.dispose()
+
+
 # FastAPIインスタンスを生成
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 例外ハンドラー設定
 # FastAPI の async handler の型定義制限のため、type: ignore を使用
@@ -23,6 +81,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ページネーションの次ページカーソル・リクエストID・プロファイルIDをブラウザから読めるようにする
+    expose_headers=["X-Next-Cursor", "X-Request-ID", "X-Profile-ID"],
 )
 
 # ロギング用ミドルウェア設定
@@ -31,3 +91,6 @@ app.add_middleware(LoggingMiddleware)
 # ルーター設定
 app.include_router(chat.router)
 app.include_router(history.router)
+app.include_router(stats.router)
+app.include_router(metrics.router)
+app.include_router(profiles.router)
@@ -0,0 +1,351 @@
+"""メトリクスモジュール
+
+RAGパイプラインの各段階・上流API呼び出しの所要時間、エラー件数、処理中のストリーム数、
+トークン数を記録し、Prometheus のテキスト形式で出力する。
+記録はラベル値のタプルをキーにした辞書の更新だけで済ませ、集計（累積バケットの計算）は
+/metrics の出力時にまとめて行う。
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Iterator
+from profiling import active_profile
+
+# 所要時間ヒストグラムのバケット（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# イベントループの遅延ヒストグラムのバケット（秒）
+LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{self._format_labels(key)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        # ラベルごとに [バケットごとの件数..., +Inf の件数, 合計値]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    def count(self, **labels: Any) -> int:
+        values = self._values.get(self._key(labels))
+        return int(sum(values[:-1])) if values else 0
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            snapshot = [(key, list(values)) for key, values in self._values.items()]
+        for key, values in snapshot:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = self._format_labels(key, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_number(cumulative)}")
+            cumulative += values[len(self.buckets)]
+            labels = self._format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {_number(cumulative)}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {values[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {_number(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    # Prometheus テキスト形式で出力
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+registry = MetricsRegistry()
+
+# パイプラインの段階ごとの所要時間（rewrite, embedding, search, reference, ttft, stream, title, db_write）
+stage_duration = registry.register(
+    Histogram(
+        "rag_stage_duration_seconds",
+        "Duration of each RAG pipeline stage.",
+        ("stage",),
+    )
+)
+# 上流API呼び出しの所要時間と結果
+upstream_duration = registry.register(
+    Histogram(
+        "rag_upstream_request_duration_seconds",
+        "Duration of upstream API calls.",
+        ("upstream", "outcome"),
+    )
+)
+# 段階ごと・例外クラスごとのエラー件数（RAGException のサブクラス名、DBエラーなどはそのクラス名）
+errors_total = registry.register(
+    Counter(
+        "rag_errors_total",
+        "Errors raised by RAG pipeline stages, by exception class.",
+        ("stage", "type"),
+    )
+)
+# 処理中のSSEストリーム数
+inflight_streams = registry.register(
+    Gauge("rag_inflight_streams", "Chat streams currently being served.")
+)
+# 用途（rewrite, title, answer, embedding）・種類（prompt, completion）ごとのトークン数
+tokens_total = registry.register(
+    Counter(
+        "rag_tokens_total",
+        "Tokens reported by upstream APIs.",
+        ("operation", "kind"),
+    )
+)
+# クライアントの切断で途中で打ち切ったストリーム数
+cancelled_streams_total = registry.register(
+    Counter("rag_cancelled_streams_total", "Chat streams cancelled because the client disconnected.")
+)
+# SSEで送信したイベント数と書き込み回数（まとめて送信した場合は書き込み回数の方が少なくなる）
+sse_events_total = registry.register(
+    Counter("rag_sse_events_total", "SSE events produced by chat streams.")
+)
+sse_writes_total = registry.register(
+    Counter("rag_sse_writes_total", "SSE writes after coalescing events.")
+)
+# 上流API呼び出しの再試行・タイムアウト・ヘッジの件数（upstream: search, openai_embedding）
+upstream_retries_total = registry.register(
+    Counter("rag_upstream_retries_total", "Upstream calls retried after a failure.", ("upstream",))
+)
+upstream_timeouts_total = registry.register(
+    Counter("rag_upstream_timeouts_total", "Upstream call attempts that hit their deadline.", ("upstream",))
+)
+upstream_hedges_total = registry.register(
+    Counter("rag_upstream_hedges_total", "Hedged duplicate upstream requests sent.", ("upstream",))
+)
+upstream_hedge_wins_total = registry.register(
+    Counter("rag_upstream_hedge_wins_total", "Hedged requests that answered first.", ("upstream",))
+)
+# サーキットブレーカーの状態（0: 通常, 1: 再開を試行中, 2: 停止中）と、停止中に拒否した呼び出し数
+circuit_breaker_state = registry.register(
+    Gauge(
+        "rag_circuit_breaker_state",
+        "Circuit breaker state (0=closed, 1=half-open, 2=open).",
+        ("upstream",),
+    )
+)
+circuit_breaker_rejected_total = registry.register(
+    Counter(
+        "rag_circuit_breaker_rejected_total",
+        "Upstream calls rejected while the circuit breaker was open.",
+        ("upstream",),
+    )
+)
+# 同時に実行中の同じ呼び出しに合流し、上流API呼び出しを省略した件数（operation: rewrite, embedding, search）
+singleflight_deduplicated_total = registry.register(
+    Counter(
+        "rag_singleflight_deduplicated_total",
+        "Upstream calls served by joining an identical in-flight call.",
+        ("operation",),
+    )
+)
+# アドミッション制御（limiter: chat_request, upstream_chat, upstream_embedding, upstream_search）
+# 待ち行列の長さと使用中の枠数（オートスケールの指標）
+admission_queue_depth = registry.register(
+    Gauge(
+        "rag_admission_queue_depth",
+        "Requests waiting for a concurrency slot.",
+        ("limiter",),
+    )
+)
+admission_in_use = registry.register(
+    Gauge(
+        "rag_admission_in_use",
+        "Concurrency slots currently in use.",
+        ("limiter",),
+    )
+)
+# 枠を確保するまでの待ち時間（待たずに確保できた場合は0）
+admission_wait = registry.register(
+    Histogram(
+        "rag_admission_wait_seconds",
+        "Time spent waiting for a concurrency slot.",
+        ("limiter",),
+    )
+)
+# 受け付けを拒否した件数（reason: queue_full, timeout）
+admission_rejected_total = registry.register(
+    Counter(
+        "rag_admission_rejected_total",
+        "Requests shed because no concurrency slot became available.",
+        ("limiter", "reason"),
+    )
+)
+# HTTPリクエストの所要時間（ストリーミングは送信完了まで）と最初のボディ送信までの時間
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Total HTTP request duration including the streamed body.",
+        ("method", "route", "status"),
+    )
+)
+http_ttfb = registry.register(
+    Histogram(
+        "http_time_to_first_byte_seconds",
+        "Time until the first response body byte was sent.",
+        ("method", "route"),
+    )
+)
+# イベントループの遅延（予定時刻からコールバックが実行されるまでの遅れ）
+event_loop_lag = registry.register(
+    Histogram(
+        "rag_event_loop_lag_seconds",
+        "Delay of event loop timer callbacks beyond their scheduled time.",
+        buckets=LAG_BUCKETS,
+    )
+)
+
+
+# 一定間隔でスリープし、予定より遅れて再開した時間をイベントループの遅延として記録する
+# （同期処理でループがブロックされると遅延が大きくなる。lifespan でタスクとして実行する）
+async def monitor_event_loop_lag(interval_seconds: float) -> None:
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval_seconds)
+        lag = time.perf_counter() - start - interval_seconds
+        event_loop_lag.observe(max(0.0, lag))
+
+
+# 開始時刻からの段階の所要時間を記録（プロファイル記録中であればタイムラインにも追加）
+def observe_stage(stage: str, start: float) -> None:
+    end = time.perf_counter()
+    stage_duration.observe(end - start, stage=stage)
+    profile = active_profile.get()
+    if profile is not None:
+        profile.record_stage(stage, start, end)
+
+
+# 段階の所要時間を記録し、失敗した場合は例外クラスごとに件数を記録する
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        errors_total.inc(stage=stage, type=type(e).__name__)
+        raise
+    finally:
+        observe_stage(stage, start)
+
+
+# 上流API呼び出しの所要時間を成功・失敗別に記録
+@contextmanager
+def track_upstream(upstream: str) -> Iterator[None]:
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        end = time.perf_counter()
+        upstream_duration.observe(end - start, upstream=upstream, outcome=outcome)
+        profile = active_profile.get()
+        if profile is not None:
+            profile.record_stage(f"upstream:{upstream}", start, end)
+
+
+# APIレスポンスの usage からトークン数を記録
+def record_usage(operation: str, usage: Any) -> None:
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if isinstance(value, int) and value:
+            tokens_total.inc(value, operation=operation, kind=kind.removesuffix("_tokens"))
@@ -1,46 +1,94 @@
 import time
 import uuid
-from starlette.middleware.base import BaseHTTPMiddleware
-from logger import get_logger
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from logger import get_logger, request_id_var
+from metrics import http_request_duration, http_ttfb
 
-logger = get_logger(__name__)
+# リクエストログは大量に出力されるため、LOG_SAMPLE_RATE_* に従って間引く
+logger = get_logger(__name__, sampled=True)
 
+# 受け取ったリクエストIDを引き継ぐ場合の最大長
+MAX_REQUEST_ID_LENGTH = 128
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        # リクエストIDを生成
-        request_id = str(uuid.uuid4())
 
-        # 開始時刻を記録
-        start_time = time.time()
+class LoggingMiddleware:
+    """リクエストログと処理時間を記録するASGIミドルウェア
 
-        # リクエスト情報をログに出力
-        logger.info(
-            "リクエスト受信",
-            extra={
-                "extra_fields": {
-                    "request_id": request_id,
-                    "method": request.method,
-                    "path": request.url.path,
-                }
-            },
-        )
+    BaseHTTPMiddleware と異なりレスポンスをタスクやキューで包まず、send を1段ラップするだけなので
+    SSEストリーミングでもチャンクごとの追加コストはほとんどない。
+    - リクエストIDをコンテキスト変数に設定し、処理中のすべてのログに付与する
+    - X-Process-Time（ヘッダー送信までの時間）と X-Request-ID をレスポンスヘッダーに追加する
+    - 完了時に、最初のボディ送信までの時間（TTFB）・ストリーム全体の所要時間・送信バイト数を記録する
+      （メトリクスはパスではなくルートのテンプレートごとに集計する）
+    """
 
-        # リクエストを処理
-        response = await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        # 処理時間を計算
-        process_time = time.time() - start_time
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        # レスポンスヘッダーに処理時間を追加
-        response.headers["X-Process-Time"] = str(process_time)
+        # リクエストIDを生成（上流のプロキシなどから渡された場合は引き継ぐ）
+        incoming = MutableHeaders(scope=scope).get("x-request-id")
+        request_id = (
+            incoming
+            if incoming and len(incoming) <= MAX_REQUEST_ID_LENGTH
+            else str(uuid.uuid4())
+        )
+        token = request_id_var.set(request_id)
 
-        # レスポンス情報をログに出力
+        # 開始時刻を記録
+        start_time = time.perf_counter()
+        status_code = 500
+        first_byte_time: float | None = None
+        bytes_sent = 0
+
+        # リクエスト情報をログに出力
         logger.info(
-            "リクエスト完了",
-            extra={
-                "extra_fields": {"request_id": request_id, "process_time": process_time}
-            },
+            "リクエスト受信",
+            extra={"extra_fields": {"method": scope["method"], "path": scope["path"]}},
         )
 
-        return response
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, first_byte_time, bytes_sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Process-Time", str(time.perf_counter() - start_time))
+                headers.append("X-Request-ID", request_id)
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                if body:
+                    if first_byte_time is None:
+                        first_byte_time = time.perf_counter()
+                    bytes_sent += len(body)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # レスポンス情報をログに出力（ストリーミングの場合は送信完了まで）
+            end_time = time.perf_counter()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_duration.observe(
+                end_time - start_time, method=scope["method"], route=route, status=status_code
+            )
+            if first_byte_time is not None:
+                http_ttfb.observe(first_byte_time - start_time, method=scope["method"], route=route)
+            logger.info(
+                "リクエスト完了",
+                extra={
+                    "extra_fields": {
+                        "status_code": status_code,
+                        "process_time": end_time - start_time,
+                        "ttfb": (
+                            first_byte_time - start_time if first_byte_time is not None else None
+                        ),
+                        "bytes_sent": bytes_sent,
+                    }
+                },
+            )
+            request_id_var.reset(token)
@@ -1,4 +1,5 @@
 import uuid
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 from datetime import datetime
 from typing import ClassVar, Literal
@@ -9,9 +10,14 @@ Role = Literal["system", "user", "assistant"]
 # チャットモデルの定義
 class Conversation(SQLModel, table=True):
     __tablename__: ClassVar[str] = "conversations"  # type: ignore
+    # 一覧（作成日時降順）のキーセットページネーション用
+    __table_args__ = (Index("ix_conversations_created_at_id", "created_at", "id"),)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     title: str | None = None
     created_at: datetime = Field(default_factory=datetime.now)
+    # トークン予算に収まらない古い会話の要約と、要約済みのメッセージ件数
+    summary: str | None = None
+    summarized_message_count: int = Field(default=0)
 
     messages: list["Message"] = Relationship(
         back_populates="conversation", sa_relationship_kwargs={"cascade": "all, delete"}
@@ -27,12 +33,25 @@ class MessageBase(SQLModel):
 # DBメッセージモデルの定義
 class Message(MessageBase, table=True):
     __tablename__: ClassVar[str] = "messages"  # type: ignore
+    # 会話ごとのメッセージ一覧（作成日時昇順）のキーセットページネーション用
+    __table_args__ = (
+        Index("ix_messages_conversation_id_created_at_id", "conversation_id", "created_at", "id"),
+    )
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     conversation_id: str = Field(foreign_key="conversations.id")
     created_at: datetime = Field(default_factory=datetime.now)
+    # クライアントの切断で回答の生成を途中で打ち切った場合は True（content は途中までの回答）
+    truncated: bool = Field(default=False)
 
     conversation: "Conversation" = Relationship(back_populates="messages")
 
+# 会話詳細（会話とメッセージ1ページ分）のレスポンスモデル
+class ConversationDetail(SQLModel):
+    id: str
+    title: str | None = None
+    created_at: datetime
+    messages: list[Message] = []
+
 # API リクエスト用モデル
 class ChatRequest(SQLModel):
     conversation_id: str | None = None
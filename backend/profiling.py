@@ -0,0 +1,363 @@
+"""プロファイリングモジュール
+
+特定のチャットリクエストだけを対象に、サンプリングプロファイルと段階のタイムラインを記録する。
+- 管理者用ヘッダー（X-Profile-Token）を付けたリクエスト、または設定した割合で抽出したリクエストが対象
+- 別スレッドから一定間隔で process_chat の非同期ジェネレーターを辿り、実行中であればスレッドのスタックを、
+  await 中であれば await 先のコルーチン・ジェネレーターの連鎖をスタックとして記録する
+  （上流APIの応答待ちなど、CPUを使っていない時間もどこで待っているかがわかる）
+- track_stage / track_upstream の区間をタイムラインとして記録する
+- 記録したプロファイルは speedscope（https://www.speedscope.app/）形式で取得できる
+無効な場合（トークン未設定かつ抽出割合0）はリクエストごとの処理を一切追加しない。
+"""
+
+import asyncio
+import gc
+import hmac
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from types import FrameType
+from typing import Any, AsyncGenerator, AsyncIterator
+from logger import get_logger, request_id_var
+
+logger = get_logger(__name__)
+
+# プロファイル対象のリクエストを指定するヘッダー（管理用エンドポイントの認証にも使う）
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+# 記録したプロファイルのIDを返すヘッダー
+PROFILE_ID_HEADER = "X-Profile-ID"
+
+# 記録中のプロファイル（track_stage / track_upstream がタイムラインを追記する）
+active_profile: ContextVar["ProfileSession | None"] = ContextVar(
+    "active_profile", default=None
+)
+
+# await 先を辿る最大の深さ
+MAX_STACK_DEPTH = 128
+
+# (関数名, ファイル, 行番号)
+FrameKey = tuple[str, str, int]
+
+
+def _frame_key(frame: FrameType) -> FrameKey:
+    code = frame.f_code
+    return (code.co_qualname, code.co_filename, code.co_firstlineno)
+
+
+def _pseudo_frame(name: str) -> FrameKey:
+    return (name, "", 0)
+
+
+# 非同期ジェネレーターの現在のスタックを外側から順に返す
+def async_stack(agen: AsyncGenerator, thread_id: int) -> list[FrameKey]:
+    frame = agen.ag_frame
+    if frame is None:
+        return []
+
+    # 実行中（イベントループのスレッドがジェネレーター内のコードを実行している）
+    current = sys._current_frames().get(thread_id)
+    running: list[FrameKey] = []
+    while current is not None:
+        running.append(_frame_key(current))
+        if current is frame:
+            return running[::-1]
+        current = current.f_back
+
+    # 中断中（await 先を辿る）
+    stack = [_frame_key(frame)]
+    if agen.ag_await is None:
+        stack.append(_pseudo_frame("<yield: waiting for client>"))
+        return stack
+    _walk_awaitable(agen.ag_await, stack)
+    return stack
+
+
+# await 先のコルーチン・ジェネレーター・タスクを辿ってスタックに追加
+def _walk_awaitable(awaitable: Any, stack: list[FrameKey]) -> None:
+    obj = awaitable
+    while obj is not None and len(stack) < MAX_STACK_DEPTH:
+        if isinstance(obj, types.CoroutineType):
+            frame, obj = obj.cr_frame, obj.cr_await
+        elif isinstance(obj, types.AsyncGeneratorType):
+            frame, obj = obj.ag_frame, obj.ag_await
+        elif isinstance(obj, types.GeneratorType):
+            frame, obj = obj.gi_frame, obj.gi_yieldfrom
+        elif isinstance(obj, asyncio.Task):
+            obj = obj.get_coro()
+            continue
+        elif isinstance(obj, asyncio.Future):
+            stack.append(_pseudo_frame("<await Future>"))
+            return
+        else:
+            # async for の __anext__ や Future の __await__ は、参照先の本体を辿る
+            inner = next(
+                (
+                    ref
+                    for ref in gc.get_referents(obj)
+                    if isinstance(ref, (types.AsyncGeneratorType, asyncio.Future))
+                ),
+                None,
+            )
+            if inner is None:
+                stack.append(_pseudo_frame(f"<await {type(obj).__name__}>"))
+                return
+            obj = inner
+            continue
+        if frame is None:
+            return
+        stack.append(_frame_key(frame))
+
+
+class ProfileSession:
+    def __init__(self, id: str, request_id: str | None, interval_seconds: float):
+        self.id = id
+        self.request_id = request_id
+        self.interval_seconds = interval_seconds
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end: float | None = None
+
+        # フレームの一覧とサンプル（フレーム番号の列と重み）
+        self._frames: list[FrameKey] = []
+        self._frame_index: dict[FrameKey, int] = {}
+        self.samples: list[list[int]] = []
+        self.weights: list[float] = []
+        # (名前, 開始, 終了)（開始からの経過秒）
+        self.timeline: list[tuple[str, float, float]] = []
+
+    # サンプルを追加（サンプリングスレッドから呼ばれる）
+    def add_sample(self, stack: list[FrameKey], weight: float) -> None:
+        if not stack:
+            return
+        indexes = []
+        for key in stack:
+            index = self._frame_index.get(key)
+            if index is None:
+                index = self._frame_index[key] = len(self._frames)
+                self._frames.append(key)
+            indexes.append(index)
+        self.samples.append(indexes)
+        self.weights.append(weight)
+
+    # 段階の区間を追加（perf_counter の値）
+    def record_stage(self, name: str, start: float, end: float) -> None:
+        self.timeline.append((name, start - self.start, end - self.start))
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "samples": len(self.samples),
+            "stages": [
+                {"name": name, "start": start, "duration": end - start}
+                for name, start, end in sorted(self.timeline, key=lambda t: t[1])
+            ],
+        }
+
+    # speedscope 形式に変換（サンプリングプロファイル + 重ならない区間ごとのタイムライン）
+    def to_speedscope(self) -> dict:
+        frames = [
+            {"name": name, "file": file, "line": line} if file else {"name": name}
+            for name, file, line in self._frames
+        ]
+        duration = self.duration
+        profiles: list[dict] = [
+            {
+                "type": "sampled",
+                "name": "samples",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": duration,
+                "samples": self.samples,
+                "weights": self.weights,
+            }
+        ]
+
+        stage_frames: dict[str, int] = {}
+        for lane_index, events in enumerate(_timeline_lanes(self.timeline)):
+            converted = []
+            for kind, name, at in events:
+                frame = stage_frames.get(name)
+                if frame is None:
+                    frame = stage_frames[name] = len(frames)
+                    frames.append({"name": name})
+                converted.append({"type": kind, "frame": frame, "at": at})
+            profiles.append(
+                {
+                    "type": "evented",
+                    "name": f"stages ({lane_index + 1})",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": duration,
+                    "events": converted,
+                }
+            )
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"chat {self.request_id or self.id}",
+            "exporter": "rag-practice",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+# 区間を入れ子か前後関係になるレーンに振り分け、レーンごとの開始・終了イベントを返す
+# （バックグラウンドタスクの区間は他の区間と部分的に重なることがあるため）
+def _timeline_lanes(
+    timeline: list[tuple[str, float, float]],
+) -> list[list[tuple[str, str, float]]]:
+    lanes: list[tuple[list[tuple[str, float]], list[tuple[str, str, float]]]] = []
+    for name, start, end in sorted(timeline, key=lambda t: (t[1], -t[2])):
+        for open_stack, events in lanes:
+            while open_stack and open_stack[-1][1] <= start:
+                closed, closed_end = open_stack.pop()
+                events.append(("C", closed, closed_end))
+            if not open_stack or end <= open_stack[-1][1]:
+                break
+        else:
+            open_stack, events = [], []
+            lanes.append((open_stack, events))
+        open_stack.append((name, end))
+        events.append(("O", name, start))
+
+    for open_stack, events in lanes:
+        while open_stack:
+            closed, closed_end = open_stack.pop()
+            events.append(("C", closed, closed_end))
+    return [events for _, events in lanes]
+
+
+class _Sampler(threading.Thread):
+    def __init__(
+        self, session: ProfileSession, agen: AsyncGenerator, thread_id: int
+    ):
+        super().__init__(name=f"profiler-{session.id}", daemon=True)
+        self.session = session
+        self.agen = agen
+        self.thread_id = thread_id
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop_event.wait(self.session.interval_seconds):
+            now = time.perf_counter()
+            try:
+                self.session.add_sample(async_stack(self.agen, self.thread_id), now - last)
+            except Exception:
+                # 対象のスタックが変化している最中に参照した場合は、そのサンプルを捨てる
+                pass
+            last = now
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfiler:
+    def __init__(
+        self,
+        admin_token: str = "",
+        sample_rate: float = 0.0,
+        interval_seconds: float = 0.005,
+        max_profiles: int = 20,
+        max_concurrent: int = 2,
+    ):
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.interval_seconds = interval_seconds
+        self.max_profiles = max_profiles
+        self.max_concurrent = max_concurrent
+        self._profiles: OrderedDict[str, ProfileSession] = OrderedDict()
+        self._active = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.admin_token) or self.sample_rate > 0
+
+    # 管理者用トークンを検証
+    def is_admin(self, token: str | None) -> bool:
+        return bool(self.admin_token) and token is not None and hmac.compare_digest(
+            token.encode("utf-8"), self.admin_token.encode("utf-8")
+        )
+
+    # リクエストをプロファイル対象にするか判定し、対象ならセッションを作成
+    # （同時に記録するのは管理者の指定を含めて max_concurrent 件まで。最終的な判定は wrap で行う）
+    def maybe_profile(self, token: str | None) -> ProfileSession | None:
+        if not self.enabled or self._active >= self.max_concurrent:
+            return None
+        if not self.is_admin(token):
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+            if not sampled:
+                return None
+        return ProfileSession(
+            str(uuid.uuid4()), request_id_var.get(), self.interval_seconds
+        )
+
+    # ストリームを消費し終えるまで、ストリーム本体をサンプリングする
+    async def wrap(
+        self, session: ProfileSession, stream: AsyncGenerator[str, None]
+    ) -> AsyncIterator[str]:
+        # 上限の判定と加算の間に await を挟まない
+        # （maybe_profile の後にストリームが始まるまでの間に、他のリクエストが記録を始めている場合がある）
+        if self._active >= self.max_concurrent:
+            logger.warning(
+                "同時に記録できるプロファイルの上限に達したため、記録しません",
+                extra={"extra_fields": {"profile_id": session.id}},
+            )
+            async for item in stream:
+                yield item
+            return
+        self._active += 1
+        token = active_profile.set(session)
+        session.start = time.perf_counter()
+        sampler = _Sampler(session, stream, threading.get_ident())
+        sampler.start()
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            sampler.stop()
+            session.end = time.perf_counter()
+            try:
+                active_profile.reset(token)
+            except ValueError:
+                # ジェネレーターが別のコンテキストで閉じられた場合
+                active_profile.set(None)
+            self._active -= 1
+            self._store(session)
+
+    def _store(self, session: ProfileSession) -> None:
+        self._profiles[session.id] = session
+        while len(self._profiles) > self.max_profiles:
+            self._profiles.popitem(last=False)
+        logger.info(
+            "プロファイルを記録しました",
+            extra={
+                "extra_fields": {
+                    "profile_id": session.id,
+                    "duration": session.duration,
+                    "samples": len(session.samples),
+                }
+            },
+        )
+
+    def get(self, profile_id: str) -> ProfileSession | None:
+        return self._profiles.get(profile_id)
+
+    # 記録済みプロファイルの一覧（新しい順）
+    def summaries(self) -> list[dict]:
+        return [session.summary() for session in reversed(self._profiles.values())]
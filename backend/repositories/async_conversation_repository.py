@@ -0,0 +1,108 @@
+"""非同期会話リポジトリモジュール
+
+ConversationRepository の非同期版。チャット処理（SSEストリーミング中）から呼び出しても
+イベントループをブロックしない。
+セッションは expire_on_commit=False で作成されるため、コミット後の refresh は行わない。
+message_writer が渡された場合、メッセージ追加とタイトル更新は write-behind でまとめて書き込む。
+"""
+
+from sqlalchemy import delete
+from sqlmodel import select, desc, asc
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Conversation, Message, Role
+from repositories.message_writer import MessageWriteBehind
+
+
+class AsyncConversationRepository:
+    def __init__(
+        self, session: AsyncSession, message_writer: MessageWriteBehind | None = None
+    ):
+        self.session = session
+        self.message_writer = message_writer
+
+    # 会話作成
+    async def create_conversation(self) -> Conversation:
+        conversation = Conversation()
+        self.session.add(conversation)
+        await self.session.commit()
+        return conversation
+
+    # 会話1件取得
+    async def get_conversation(self, conversation_id: str) -> Conversation | None:
+        return await self.session.get(Conversation, conversation_id)
+
+    # 全会話取得
+    async def get_all_conversations(self) -> list[Conversation]:
+        results = await self.session.exec(
+            select(Conversation).order_by(desc(Conversation.created_at))
+        )
+        return list(results.all())
+
+    # 会話削除（非同期では関連の遅延ロードができないため、メッセージは明示的に削除）
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        conversation = await self.get_conversation(conversation_id)
+        if conversation:
+            await self.session.execute(
+                delete(Message).where(Message.conversation_id == conversation_id)  # type: ignore[arg-type]
+            )
+            await self.session.delete(conversation)
+            await self.session.commit()
+            return True
+        return False
+
+    # 会話タイトル更新
+    async def update_conversation_title(
+        self, conversation_id: str, title: str
+    ) -> Conversation | None:
+        # write-behind時は反映が非同期のため None を返す
+        if self.message_writer is not None:
+            self.message_writer.enqueue_title(conversation_id, title)
+            return None
+
+        conversation = await self.get_conversation(conversation_id)
+        if conversation:
+            conversation.title = title
+            self.session.add(conversation)
+            await self.session.commit()
+            return conversation
+        return None
+
+    # 会話要約更新
+    async def update_conversation_summary(
+        self, conversation_id: str, summary: str, summarized_message_count: int
+    ) -> Conversation | None:
+        conversation = await self.get_conversation(conversation_id)
+        if conversation:
+            conversation.summary = summary
+            conversation.summarized_message_count = summarized_message_count
+            self.session.add(conversation)
+            await self.session.commit()
+            return conversation
+        return None
+
+    # 会話にメッセージ追加（truncated: 回答の生成を途中で打ち切ったメッセージ）
+    async def add_message(
+        self, conversation_id: str, role: Role, content: str, truncated: bool = False
+    ) -> Message:
+        message = Message(
+            conversation_id=conversation_id, role=role, content=content, truncated=truncated
+        )
+        if self.message_writer is not None:
+            self.message_writer.enqueue_message(message)
+            return message
+
+        self.session.add(message)
+        await self.session.commit()
+        return message
+
+    # 会話のメッセージ一覧取得
+    async def get_messages(self, conversation_id: str) -> list[Message]:
+        results = await self.session.exec(
+            select(Message)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(asc(Message.created_at))
+        )
+        messages = list(results.all())
+        if self.message_writer is not None:
+            messages = self.message_writer.merge_pending(conversation_id, messages)
+        return messages
@@ -1,13 +1,21 @@
-from sqlmodel import Session, select, desc, asc
-from models import Conversation, Message, Role
-
 """会話リポジトリモジュール
 
 会話とメッセージのCRUD操作を提供するリポジトリクラス。
 """
+
+from sqlalchemy import and_, or_, true
+from sqlmodel import Session, select, desc, asc
+from models import Conversation, Message, Role
+from repositories.message_writer import MessageWriteBehind
+from repositories.pagination import decode_cursor, encode_cursor
+
+
 class ConversationRepository:
-    def __init__(self, session: Session):
+    def __init__(
+        self, session: Session, message_writer: MessageWriteBehind | None = None
+    ):
         self.session = session
+        self.message_writer = message_writer
 
     # 会話作成
     def create_conversation(self) -> Conversation:
@@ -35,6 +43,29 @@ class ConversationRepository:
         ).all()
         return list(results)
 
+    # 会話一覧をページ単位で取得（作成日時降順）。次ページのカーソルも返す
+    def get_conversations_page(
+        self, limit: int, cursor: str | None = None
+    ) -> tuple[list[Conversation], str | None]:
+        statement = select(Conversation)
+        if cursor is not None:
+            created_at, id = decode_cursor(cursor)
+            statement = statement.where(
+                or_(
+                    Conversation.created_at < created_at,
+                    and_(Conversation.created_at == created_at, Conversation.id < id),
+                )
+            )
+        # 1件多く取得して次ページの有無を判定
+        results = list(
+            self.session.exec(
+                statement.order_by(desc(Conversation.created_at), desc(Conversation.id)).limit(
+                    limit + 1
+                )
+            ).all()
+        )
+        return _page(results, limit)
+
     # 会話削除
     def delete_conversation(self, conversation_id: str) -> bool:
         # 会話をIDで1件取得
@@ -74,4 +105,72 @@ class ConversationRepository:
             .where(Message.conversation_id == conversation_id)
             .order_by(asc(Message.created_at))
         ).all()
-        return list(results)
+        messages = list(results)
+        # write-behindで未書き込みのメッセージも含める（read-your-writes）
+        if self.message_writer is not None:
+            messages = self.message_writer.merge_pending(conversation_id, messages)
+        return messages
+
+    # 会話のメッセージ一覧をページ単位で取得（作成日時昇順）。次ページのカーソルも返す
+    def get_messages_page(
+        self, conversation_id: str, limit: int, cursor: str | None = None
+    ) -> tuple[list[Message], str | None]:
+        statement = select(Message).where(
+            Message.conversation_id == conversation_id, _messages_after(cursor)
+        )
+        results = list(
+            self.session.exec(
+                statement.order_by(asc(Message.created_at), asc(Message.id)).limit(limit + 1)
+            ).all()
+        )
+        return self._merge_pending_page(conversation_id, *_page(results, limit))
+
+    # 会話とメッセージ1ページ分を1回のクエリで取得（会話が存在しない場合は None）
+    # メッセージはページ条件付きの外部結合で取得するため、メッセージがなくても会話は1行返る
+    def get_conversation_detail(
+        self, conversation_id: str, limit: int, cursor: str | None = None
+    ) -> tuple[Conversation, list[Message], str | None] | None:
+        statement = (
+            select(Conversation, Message)
+            .outerjoin(
+                Message,
+                and_(Message.conversation_id == Conversation.id, _messages_after(cursor)),  # type: ignore[arg-type]
+            )
+            .where(Conversation.id == conversation_id)
+            .order_by(asc(Message.created_at), asc(Message.id))
+            .limit(limit + 1)
+        )
+        rows = self.session.exec(statement).all()
+        if not rows:
+            return None
+        conversation = rows[0][0]
+        results = [message for _, message in rows if message is not None]
+        messages, next_cursor = self._merge_pending_page(conversation_id, *_page(results, limit))
+        return conversation, messages, next_cursor
+
+    # 最終ページには write-behind で未書き込みのメッセージも含める
+    def _merge_pending_page(
+        self, conversation_id: str, messages: list[Message], next_cursor: str | None
+    ) -> tuple[list[Message], str | None]:
+        if next_cursor is None and self.message_writer is not None:
+            messages = self.message_writer.merge_pending(conversation_id, messages)
+        return messages, next_cursor
+
+
+# カーソルより後のメッセージ（作成日時昇順）の条件
+def _messages_after(cursor: str | None):
+    if cursor is None:
+        return true()
+    created_at, id = decode_cursor(cursor)
+    return or_(
+        Message.created_at > created_at,
+        and_(Message.created_at == created_at, Message.id > id),
+    )
+
+
+# limit + 1 件の取得結果から、ページと次ページのカーソルを作成
+def _page(results: list, limit: int) -> tuple[list, str | None]:
+    if len(results) <= limit:
+        return results, None
+    last = results[limit - 1]
+    return results[:limit], encode_cursor(last.created_at, last.id)
@@ -0,0 +1,290 @@
+"""
+ローカル検索リポジトリクラス
+
+Azure AI Search の代わりにプロセス内で検索する小規模コーパス向けの実装。
+SearchRepository.hybrid_search と同じシグネチャで呼び出せる。
+- ベクトル検索: 正規化済みEmbeddingのNumPy行列との内積（コサイン類似度）
+- キーワード検索: 転置インデックスによるBM25（日本語は文字bigram、英数字は単語単位）
+- 統合: Reciprocal Rank Fusion (RRF)
+- フィルタ: category / source などに対するODataの基本構文（eq, ne, and, or, not, search.in）
+"""
+
+import json
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+import numpy as np
+from exceptions import SearchError
+
+# BM25 パラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# RRF の定数
+RRF_K = 60
+
+# 各検索方式で統合前に取得する候補数の下限
+MIN_CANDIDATES = 50
+
+ASCII_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+# BM25用のトークン化（英数字は単語、それ以外の文字の連続は文字bigram）
+def tokenize(text: str) -> list[str]:
+    tokens: list[str] = []
+    normalized = unicodedata.normalize("NFKC", text).lower()
+    for segment in re.split(r"[\s\W_]+", normalized):
+        if not segment:
+            continue
+        position = 0
+        for match in ASCII_WORD_PATTERN.finditer(segment):
+            tokens.extend(_char_bigrams(segment[position : match.start()]))
+            tokens.append(match.group())
+            position = match.end()
+        tokens.extend(_char_bigrams(segment[position:]))
+    return tokens
+
+
+def _char_bigrams(text: str) -> list[str]:
+    if len(text) <= 1:
+        return [text] if text else []
+    return [text[i : i + 2] for i in range(len(text) - 1)]
+
+
+# 検索用スナップショット（Embedding付きドキュメント）を保存
+# .jsonl の場合は1行1ドキュメント、それ以外はJSON配列
+def save_snapshot(path: str, documents: list[dict]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for document in documents:
+                f.write(json.dumps(document, ensure_ascii=False) + "\n")
+        else:
+            json.dump(documents, f, ensure_ascii=False)
+
+
+# スナップショットを読み込む（追記で同じIDが複数ある場合は後のものを採用し、削除済みの印は除く）
+def load_snapshot(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            documents = [json.loads(line) for line in f if line.strip()]
+        else:
+            documents = json.load(f)
+    latest = {str(document["id"]): document for document in documents}
+    return [document for document in latest.values() if not document.get("@deleted")]
+
+
+class LocalSearchRepository:
+    def __init__(self, documents: list[dict]):
+        self.documents = [
+            {key: value for key, value in doc.items() if key != "embedding"}
+            for doc in documents
+        ]
+
+        # ベクトル検索用の正規化済み行列
+        embeddings = np.asarray([doc["embedding"] for doc in documents], dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True) if len(documents) else 1.0
+        self.embeddings = embeddings / np.where(norms == 0, 1.0, norms)
+
+        # BM25用の転置インデックス
+        self.postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths = np.zeros(len(documents), dtype=np.float32)
+        for index, doc in enumerate(documents):
+            tokens = tokenize(doc.get("content", ""))
+            self.doc_lengths[index] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                self.postings[term].append((index, frequency))
+        self.avg_doc_length = float(self.doc_lengths.mean()) if len(documents) else 0.0
+
+    # スナップショットファイルから作成
+    @classmethod
+    def from_snapshot(cls, path: str) -> "LocalSearchRepository":
+        return cls(load_snapshot(path))
+
+    # ハイブリッド検索
+    async def hybrid_search(
+        self,
+        vector_query: list[float],
+        top_k: int = 2,
+        text_query: str | None = None,
+        use_semantic_search: bool = True,
+        filter: str | None = None,
+    ) -> list[dict]:
+        # ローカル実装にはセマンティックランカーがないため use_semantic_search は無視する
+        try:
+            mask = self._filter_mask(filter)
+            candidates = max(top_k, MIN_CANDIDATES)
+
+            rankings = [self._vector_ranking(vector_query, mask, candidates)]
+            if text_query:
+                rankings.append(self._bm25_ranking(text_query, mask, candidates))
+        except SearchError:
+            raise
+        except Exception as e:
+            raise SearchError(f"検索中にエラーが発生しました: {str(e)}") from e
+
+        # Reciprocal Rank Fusion
+        fused: dict[int, float] = defaultdict(float)
+        for ranking in rankings:
+            for rank, index in enumerate(ranking):
+                fused[index] += 1.0 / (RRF_K + rank + 1)
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [
+            {**self.documents[index], "@search.score": score, "@search.reranker_score": None}
+            for index, score in ranked
+        ]
+
+    def _vector_ranking(
+        self, vector_query: list[float], mask: np.ndarray, candidates: int
+    ) -> list[int]:
+        if not len(self.documents):
+            return []
+        query = np.asarray(vector_query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = self.embeddings @ (query / norm if norm > 0 else query)
+        scores = np.where(mask, scores, -np.inf)
+        return self._top_indices(scores, mask, candidates)
+
+    def _bm25_ranking(self, text_query: str, mask: np.ndarray, candidates: int) -> list[int]:
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        total = len(self.documents)
+        for term in set(tokenize(text_query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, frequency in postings:
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[index] / self.avg_doc_length
+                scores[index] += idf * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * length_norm
+                )
+        # キーワードに一致しないドキュメントはランキングに含めない
+        scores = np.where(mask & (scores > 0), scores, -np.inf)
+        return self._top_indices(scores, mask & (scores > -np.inf), candidates)
+
+    @staticmethod
+    def _top_indices(scores: np.ndarray, mask: np.ndarray, candidates: int) -> list[int]:
+        count = min(candidates, int(mask.sum()))
+        if count == 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        return [int(i) for i in top[np.argsort(-scores[top])]]
+
+    # フィルタ式を評価してドキュメントごとの真偽値マスクを作成
+    def _filter_mask(self, filter: str | None) -> np.ndarray:
+        if not filter:
+            return np.ones(len(self.documents), dtype=bool)
+        predicate = ODataFilterParser(filter).parse()
+        return np.array([predicate(doc) for doc in self.documents], dtype=bool)
+
+
+class ODataFilterParser:
+    """Azure AI Search のフィルタ構文のうち、よく使う基本形のみを解釈する"""
+
+    TOKEN_PATTERN = re.compile(
+        r"\s*(?:(?P<string>'(?:[^']|'')*')|(?P<paren>[(),])|(?P<word>[\w.]+))"
+    )
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = self._tokenize(expression)
+        self.position = 0
+
+    def parse(self):
+        predicate = self._parse_or()
+        if self.position != len(self.tokens):
+            raise SearchError(f"サポートされていないフィルタ式です: {self.expression}")
+        return predicate
+
+    def _tokenize(self, expression: str) -> list[str]:
+        tokens: list[str] = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = self.TOKEN_PATTERN.match(expression, position)
+            if match is None or match.end() == position:
+                raise SearchError(f"サポートされていないフィルタ式です: {expression}")
+            tokens.append(match.group().strip())
+            position = match.end()
+        return [token for token in tokens if token]
+
+    def _peek(self) -> str | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise SearchError(f"フィルタ式が途中で終わっています: {self.expression}")
+        self.position += 1
+        return token
+
+    def _expect(self, expected: str) -> None:
+        if self._next() != expected:
+            raise SearchError(f"サポートされていないフィルタ式です: {self.expression}")
+
+    def _parse_or(self):
+        left = self._parse_and()
+        while self._peek() == "or":
+            self._next()
+            right = self._parse_and()
+            left = (lambda l, r: lambda doc: l(doc) or r(doc))(left, right)
+        return left
+
+    def _parse_and(self):
+        left = self._parse_not()
+        while self._peek() == "and":
+            self._next()
+            right = self._parse_not()
+            left = (lambda l, r: lambda doc: l(doc) and r(doc))(left, right)
+        return left
+
+    def _parse_not(self):
+        if self._peek() == "not":
+            self._next()
+            operand = self._parse_not()
+            return lambda doc: not operand(doc)
+        return self._parse_primary()
+
+    def _parse_primary(self):
+        token = self._next()
+        if token == "(":
+            predicate = self._parse_or()
+            self._expect(")")
+            return predicate
+
+        # search.in(field, 'a,b,c') / search.in(field, 'a|b', '|')
+        if token == "search.in":
+            self._expect("(")
+            field = self._next()
+            self._expect(",")
+            values = self._literal(self._next())
+            delimiter = ","
+            if self._peek() == ",":
+                self._next()
+                delimiter = self._literal(self._next())
+            self._expect(")")
+            allowed = {value.strip() for value in str(values).split(delimiter)}
+            return lambda doc: str(doc.get(field)) in allowed
+
+        field = token
+        operator = self._next()
+        value = self._literal(self._next())
+        if operator == "eq":
+            return lambda doc: doc.get(field) == value or str(doc.get(field)) == str(value)
+        if operator == "ne":
+            return lambda doc: not (doc.get(field) == value or str(doc.get(field)) == str(value))
+        raise SearchError(f"サポートされていない演算子です: {operator}")
+
+    @staticmethod
+    def _literal(token: str):
+        if token.startswith("'"):
+            return token[1:-1].replace("''", "'")
+        if token in ("true", "false"):
+            return token == "true"
+        if token == "null":
+            return None
+        try:
+            return int(token)
+        except ValueError:
+            return float(token)
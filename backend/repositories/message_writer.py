@@ -0,0 +1,233 @@
+"""メッセージ書き込みバッファ（write-behind）モジュール
+
+メッセージ追加・タイトル更新をプロセス内のキューに溜め、件数または経過時間の閾値で
+まとめてDBに書き込む。書き込み完了まではキュー内のメッセージを読み取り側に公開し、
+同じ会話に対する get_messages の read-your-writes 一貫性を保つ。
+一時的な失敗で書き込めなかったものはキューに残して指数バックオフで再試行し、
+制約違反など再試行しても成功しないものだけを破棄する。
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine
+from models import Conversation, Message
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class MessageWriteBehind:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        batch_size: int = 100,
+        flush_interval_seconds: float = 0.5,
+        max_retry_delay_seconds: float = 30.0,
+    ):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retry_delay_seconds = max_retry_delay_seconds
+
+        # 未書き込みのメッセージとタイトル（書き込み完了まで保持）
+        self._messages: list[Message] = []
+        self._titles: dict[str, str] = {}
+
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stop_requested = asyncio.Event()
+        # 連続して書き込みに失敗した回数（バックオフの計算に使う）
+        self._consecutive_failures = 0
+
+        # 統計
+        self.flush_count = 0
+        self.flushed_messages = 0
+        self.flushed_titles = 0
+        self.failed_messages = 0
+        self.last_flush_ms = 0.0
+
+    # バックグラウンドの書き込みタスクを開始
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    # 書き込みタスクを停止し、残りをすべて書き込む
+    # （書き込み中にキャンセルすると、コミット済みのバッチをキューから外す前に中断して
+    # 再度書き込んでしまうため、タスク自身にループを抜けさせてから最後の書き込みを行う）
+    async def stop(self) -> None:
+        self._stop_requested.set()
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._messages or self._titles:
+            logger.error(
+                "停止時に書き込めなかったメッセージがあります",
+                extra={
+                    "extra_fields": {
+                        "pending_messages": len(self._messages),
+                        "pending_titles": len(self._titles),
+                    }
+                },
+            )
+
+    # メッセージをキューに追加
+    def enqueue_message(self, message: Message) -> None:
+        self._messages.append(message)
+        if len(self._messages) >= self.batch_size:
+            self._wakeup.set()
+
+    # タイトル更新をキューに追加（同じ会話は最新の値で上書き）
+    def enqueue_title(self, conversation_id: str, title: str) -> None:
+        self._titles[conversation_id] = title
+
+    # 未書き込みのメッセージを取得
+    def pending_messages(self, conversation_id: str) -> list[Message]:
+        return [m for m in list(self._messages) if m.conversation_id == conversation_id]
+
+    # 未書き込みのタイトルを取得
+    def pending_title(self, conversation_id: str) -> str | None:
+        return self._titles.get(conversation_id)
+
+    # DB結果と未書き込みメッセージを作成日時順にマージ
+    def merge_pending(self, conversation_id: str, messages: list[Message]) -> list[Message]:
+        pending = self.pending_messages(conversation_id)
+        if not pending:
+            return messages
+        persisted_ids = {m.id for m in messages}
+        merged = messages + [m for m in pending if m.id not in persisted_ids]
+        return sorted(merged, key=lambda m: m.created_at or datetime.min)
+
+    # キューの内容をまとめて書き込む
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            messages = list(self._messages)
+            titles = dict(self._titles)
+            if not messages and not titles:
+                return
+
+            start_time = time.perf_counter()
+            retry_messages: list[Message] = []
+            retry_titles: dict[str, str] = {}
+            try:
+                await self._write(messages, titles)
+            except Exception as e:
+                # 一括書き込みに失敗した場合は1件ずつ書き込み、一時的に失敗したものはキューに残す
+                logger.warning(f"メッセージの一括書き込みに失敗しました: {e}")
+                retry_messages, retry_titles = await self._write_one_by_one(messages, titles)
+
+            # 書き込み完了（または破棄）したものをキューから取り除く
+            retry_ids = {id(m) for m in retry_messages}
+            for conversation_id in retry_titles:
+                titles.pop(conversation_id)
+            flushed_ids = {id(m) for m in messages if id(m) not in retry_ids}
+            self._messages = [m for m in self._messages if id(m) not in flushed_ids]
+            for conversation_id, title in titles.items():
+                if self._titles.get(conversation_id) == title:
+                    del self._titles[conversation_id]
+
+            if retry_messages or retry_titles:
+                self._consecutive_failures += 1
+            else:
+                self._consecutive_failures = 0
+            self.flush_count += 1
+            self.last_flush_ms = (time.perf_counter() - start_time) * 1000
+
+    # 統計情報を取得
+    def stats(self) -> dict:
+        return {
+            "pending_messages": len(self._messages),
+            "pending_titles": len(self._titles),
+            "flush_count": self.flush_count,
+            "flushed_messages": self.flushed_messages,
+            "flushed_titles": self.flushed_titles,
+            "failed_messages": self.failed_messages,
+            "consecutive_failures": self._consecutive_failures,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+    # 次の書き込みまでの待ち時間（失敗が続いている間は指数バックオフ）
+    def _next_delay(self) -> float:
+        if self._consecutive_failures == 0:
+            return self.flush_interval_seconds
+        return min(
+            self.max_retry_delay_seconds,
+            self.flush_interval_seconds * 2**self._consecutive_failures,
+        )
+
+    # 件数または時間の閾値で定期的に書き込む
+    async def _run(self) -> None:
+        while not self._stop_requested.is_set():
+            # 失敗が続いている間は件数の閾値では起こさず、バックオフの時間だけ待つ（停止要求では起きる）
+            event = self._wakeup if self._consecutive_failures == 0 else self._stop_requested
+            try:
+                await asyncio.wait_for(event.wait(), timeout=self._next_delay())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stop_requested.is_set():
+                break
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"メッセージの書き込みに失敗しました: {e}", exc_info=True)
+
+    # 1トランザクションでバルクINSERT/UPDATE
+    async def _write(self, messages: list[Message], titles: dict[str, str]) -> None:
+        async with AsyncSession(self.engine) as session:
+            if messages:
+                await session.execute(
+                    insert(Message), [m.model_dump() for m in messages]
+                )
+            if titles:
+                await session.execute(
+                    update(Conversation),
+                    [{"id": cid, "title": title} for cid, title in titles.items()],
+                )
+            await session.commit()
+        self.flushed_messages += len(messages)
+        self.flushed_titles += len(titles)
+
+    # 1件ずつ書き込み、再試行すべきもの（一時的な失敗）を返す
+    # 制約違反（IntegrityError）は再試行しても成功しないため破棄する
+    async def _write_one_by_one(
+        self, messages: list[Message], titles: dict[str, str]
+    ) -> tuple[list[Message], dict[str, str]]:
+        retry_messages: list[Message] = []
+        retry_titles: dict[str, str] = {}
+        for message in messages:
+            try:
+                await self._write([message], {})
+            except IntegrityError as e:
+                self.failed_messages += 1
+                logger.error(
+                    f"メッセージを書き込めなかったため破棄しました: {e}",
+                    extra={"extra_fields": {"conversation_id": message.conversation_id}},
+                )
+            except Exception as e:
+                retry_messages.append(message)
+                logger.warning(
+                    f"メッセージの書き込みに失敗したため再試行します: {e}",
+                    extra={"extra_fields": {"conversation_id": message.conversation_id}},
+                )
+        for conversation_id, title in titles.items():
+            try:
+                await self._write([], {conversation_id: title})
+            except IntegrityError as e:
+                logger.error(
+                    f"タイトルを書き込めなかったため破棄しました: {e}",
+                    extra={"extra_fields": {"conversation_id": conversation_id}},
+                )
+            except Exception as e:
+                retry_titles[conversation_id] = title
+                logger.warning(
+                    f"タイトルの書き込みに失敗したため再試行します: {e}",
+                    extra={"extra_fields": {"conversation_id": conversation_id}},
+                )
+        return retry_messages, retry_titles
@@ -0,0 +1,26 @@
+"""ページネーションモジュール
+
+キーセット（シーク）方式のページネーションで使うカーソルを作成・解析する。
+カーソルは直前のページ末尾の (created_at, id) をBase64URLで符号化した不透明な文字列で、
+OFFSET を使わないため、何ページ目でもインデックスを辿る範囲は limit 件分で済む。
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+# ページ末尾の行からカーソルを作成
+def encode_cursor(created_at: datetime, id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+# カーソルを解析（不正な値の場合は ValueError）
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created_at), str(id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"不正なカーソルです: {cursor}") from e
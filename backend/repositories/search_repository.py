@@ -1,10 +1,67 @@
-from azure.search.documents.aio import SearchClient
-from exceptions import SearchError
-
 """
 Azure AI Searchリポジトリクラス
 
 """
+
+from azure.search.documents.aio import SearchClient
+from exceptions import SearchError
+
+# チャンク単位の検索結果を親ドキュメントごとにまとめる
+# 同じ親のチャンクは chunk_index 順に連結し（重複部分は除く）、スコアは最も高いものを採用する
+# parent_id を持たない結果（チャンク分割前に登録したドキュメント）はそのまま返す
+def group_by_parent(results: list[dict]) -> list[dict]:
+    groups: dict[str, list[dict]] = {}
+    for position, result in enumerate(results):
+        key = result.get("parent_id") or result.get("id") or f"#{position}"
+        groups.setdefault(str(key), []).append(result)
+
+    grouped: list[dict] = []
+    for parent_id, chunks in groups.items():
+        if len(chunks) == 1:
+            grouped.append({**chunks[0], "id": parent_id} if chunks[0].get("parent_id") else chunks[0])
+            continue
+        best = max(chunks, key=_score)
+        chunks = sorted(chunks, key=lambda chunk: chunk.get("chunk_index", 0))
+        content = chunks[0]["content"]
+        for previous, chunk in zip(chunks, chunks[1:]):
+            overlap = _overlap_length(previous["content"], chunk["content"])
+            if chunk.get("chunk_index", 0) != previous.get("chunk_index", 0) + 1:
+                content += "\n…\n" + chunk["content"]
+            elif overlap:
+                content += chunk["content"][overlap:]
+            else:
+                content += "\n" + chunk["content"]
+        reranker_scores = [
+            chunk["@search.reranker_score"]
+            for chunk in chunks
+            if chunk.get("@search.reranker_score") is not None
+        ]
+        grouped.append(
+            {
+                **best,
+                "id": parent_id,
+                "content": content,
+                "@search.score": max(chunk.get("@search.score") or 0.0 for chunk in chunks),
+                "@search.reranker_score": max(reranker_scores) if reranker_scores else None,
+            }
+        )
+
+    return sorted(grouped, key=_score, reverse=True)
+
+
+def _score(result: dict) -> float:
+    reranker_score = result.get("@search.reranker_score")
+    return reranker_score if reranker_score is not None else result.get("@search.score") or 0.0
+
+
+# 前のチャンク末尾と次のチャンク先頭の重複（オーバーラップ）の長さ
+def _overlap_length(previous: str, current: str) -> int:
+    for length in range(min(len(previous), len(current)), 0, -1):
+        if previous.endswith(current[:length]):
+            return length
+    return 0
+
+
 class SearchRepository:
     def __init__(self, search_client: SearchClient):
         self.search_client = search_client
@@ -37,4 +94,4 @@ class SearchRepository:
             )
             return [result async for result in results]
         except Exception as e:
-            raise SearchError(f"検索中にエラーが発生しました: {str(e)}")
+            raise SearchError(f"検索中にエラーが発生しました: {str(e)}") from e
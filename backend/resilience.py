@@ -0,0 +1,371 @@
+"""上流API呼び出しの耐障害性モジュール
+
+検索・Embedding生成の呼び出しに、タイムアウト・再試行・ヘッジ・サーキットブレーカーを適用する。
+- タイムアウト: 呼び出しごとの上限と、リクエスト全体の時間予算（request_deadline）の残り時間の短い方
+- 再試行: 一時的な失敗（タイムアウト・接続エラー・429・5xx）は指数バックオフ（フルジッター）で再試行する
+  （待ち時間が予算を超える場合は諦める）。それ以外の失敗は再試行せず、サーキットブレーカーにも数えない
+- ヘッジ: 直近の応答時間の分位点（p95など）を過ぎても応答がなければ同じ呼び出しをもう1つ送り、
+  先に成功した方を使う（もう一方は取り消す）。ヘッジは同時呼び出し数の上限の枠を別に1つ使い、
+  空きがなければ送らない（上流への同時呼び出しが上限を超えないようにする）
+- サーキットブレーカー: 連続で失敗した上流は一定時間呼び出さず、すぐに SearchError / EmbeddingError を返す
+  （一定時間後に1件だけ試し、成功すれば再開する）
+"""
+
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, TypeVar
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from openai import APIConnectionError
+from admission import ConcurrencyLimiter
+from exceptions import RAGException
+from logger import get_logger
+from metrics import (
+    circuit_breaker_rejected_total,
+    circuit_breaker_state,
+    upstream_hedge_wins_total,
+    upstream_hedges_total,
+    upstream_retries_total,
+    upstream_timeouts_total,
+)
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# リクエスト全体の上流呼び出しの期限（time.monotonic の値。未設定の場合は呼び出しごとのタイムアウトのみ）
+request_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+# 一時的な失敗とみなすHTTPステータス（これ以外の4xxは呼び出し側の誤りとして再試行しない）
+TRANSIENT_STATUS_CODES = {408, 429}
+# 接続できなかった・応答が途中で切れた場合のSDKの例外
+TRANSIENT_ERRORS = (
+    TimeoutError,
+    ConnectionError,
+    APIConnectionError,
+    ServiceRequestError,
+    ServiceResponseError,
+)
+
+
+# 再試行してよい一時的な失敗か（SearchError などに包まれている場合は元の例外をたどって判定する）
+def is_transient(error: BaseException) -> bool:
+    seen: set[int] = set()
+    current: BaseException | None = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, TRANSIENT_ERRORS):
+            return True
+        status_code = getattr(current, "status_code", None)
+        if isinstance(status_code, int):
+            return status_code in TRANSIENT_STATUS_CODES or status_code >= 500
+        current = current.__cause__ or current.__context__
+    return False
+
+
+# サーキットブレーカーの状態（メトリクスの値）
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout_seconds: float = 30.0,
+    ):
+        self.name = name
+        # 0以下の場合は常に呼び出しを許可する
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+        # 統計
+        self.opened = 0
+        self.rejected = 0
+        circuit_breaker_state.set(STATE_VALUES[CLOSED], upstream=name)
+
+    # 呼び出してよいか判定（停止中は False。再開を試す状態では1件だけ許可する）
+    def allow(self) -> bool:
+        if self.failure_threshold <= 0:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout_seconds:
+                return self._reject()
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return self._reject()
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probing = False
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+            logger.info(f"{self.name} の呼び出しを再開しました")
+
+    def record_failure(self) -> None:
+        self._probing = False
+        self._failures += 1
+        if self.failure_threshold <= 0:
+            return
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self._failures >= self.failure_threshold
+        ):
+            self.opened += 1
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+            logger.warning(
+                f"{self.name} の呼び出しを一時停止しました",
+                extra={
+                    "extra_fields": {
+                        "consecutive_failures": self._failures,
+                        "reset_timeout_seconds": self.reset_timeout_seconds,
+                    }
+                },
+            )
+
+    # 結果が出ないまま取り消された場合や、上流の障害ではない失敗の場合
+    # （連続失敗数は変えず、再開の試行中であれば次の呼び出しに試行を譲る）
+    def record_cancel(self) -> None:
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+    def _reject(self) -> bool:
+        self.rejected += 1
+        circuit_breaker_rejected_total.inc(upstream=self.name)
+        return False
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        circuit_breaker_state.set(STATE_VALUES[state], upstream=self.name)
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    # 直近の応答時間の分位点（サンプルが少ない間は None）
+    def quantile(self, q: float) -> float | None:
+        if len(self._samples) < max(1, self.min_samples):
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class ResilientCall:
+    def __init__(
+        self,
+        name: str,
+        error_class: type[RAGException],
+        timeout_seconds: float = 5.0,
+        max_attempts: int = 3,
+        base_delay: float = 0.1,
+        max_delay: float = 2.0,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.05,
+        hedge_min_samples: int = 20,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.name = name
+        self.error_class = error_class
+        # 0以下の場合は呼び出しごとのタイムアウトなし
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 0以下の場合はヘッジしない
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker(name, failure_threshold=0)
+        self.latencies = LatencyWindow(min_samples=hedge_min_samples)
+
+        # 統計
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedges_skipped = 0
+        self.hedge_wins = 0
+
+    # タイムアウト・再試行・ヘッジ・サーキットブレーカーを適用して呼び出す
+    # （失敗した場合は error_class の例外を送出する。hedge_limiter を指定した場合、ヘッジはその枠を待たずに確保できたときだけ送る）
+    async def call(
+        self,
+        operation: Callable[[], Awaitable[T]],
+        hedge_limiter: ConcurrencyLimiter | None = None,
+    ) -> T:
+        self.calls += 1
+        last_error: Exception | None = None
+        for attempt in range(1, self.max_attempts + 1):
+            timeout = self._timeout()
+            if timeout is not None and timeout <= 0:
+                last_error = last_error or TimeoutError("リクエストの時間予算を使い切りました")
+                break
+            if not self.breaker.allow():
+                raise self.error_class(
+                    f"{self.name} は一時的に利用できません（連続して失敗したため呼び出しを停止中）"
+                )
+
+            start = time.perf_counter()
+            try:
+                result = await self._attempt(operation, timeout, hedge_limiter)
+            except asyncio.CancelledError:
+                self.breaker.record_cancel()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # 呼び出し側の誤りなど、再試行しても結果が変わらない失敗はすぐに送出する
+                    self.breaker.record_cancel()
+                    raise self._as_error(e)
+                last_error = e
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                self.latencies.observe(time.perf_counter() - start)
+                return result
+
+            if attempt == self.max_attempts:
+                break
+            # ingestion.pipeline.with_retry と同じ指数バックオフ（フルジッター）
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            remaining = self._timeout()
+            if remaining is not None and delay >= remaining:
+                break
+            self.retries += 1
+            upstream_retries_total.inc(upstream=self.name)
+            logger.warning(
+                f"{self.name} の呼び出しを再試行します: {last_error}",
+                extra={"extra_fields": {"attempt": attempt, "delay": delay}},
+            )
+            await asyncio.sleep(delay)
+
+        raise self._as_error(last_error)
+
+    # ヘッジを送るまでの待ち時間（直近の応答時間が足りない間は None）
+    def hedge_delay(self) -> float | None:
+        if self.hedge_quantile <= 0:
+            return None
+        quantile = self.latencies.quantile(self.hedge_quantile)
+        if quantile is None:
+            return None
+        return max(self.hedge_min_delay, quantile)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedges_skipped": self.hedges_skipped,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_seconds": self.hedge_delay(),
+            "circuit_breaker": self.breaker.stats(),
+        }
+
+    # error_class の例外に変換する（元の例外は __cause__ に残す）
+    def _as_error(self, error: Exception | None) -> RAGException:
+        if isinstance(error, self.error_class):
+            return error
+        wrapped = self.error_class(f"{self.name} の呼び出しに失敗しました: {error}")
+        wrapped.__cause__ = error
+        return wrapped
+
+    # 呼び出しごとのタイムアウトとリクエストの残り時間のうち短い方（どちらもなければ None）
+    def _timeout(self) -> float | None:
+        timeout = self.timeout_seconds if self.timeout_seconds > 0 else None
+        deadline = request_deadline.get()
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    # 1回分の呼び出し（応答が遅ければヘッジを送り、先に成功した方を返す）
+    async def _attempt(
+        self,
+        operation: Callable[[], Awaitable[T]],
+        timeout: float | None,
+        hedge_limiter: ConcurrencyLimiter | None = None,
+    ) -> T:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        primary = asyncio.ensure_future(operation())
+        pending = {primary}
+        try:
+            hedge_delay = self.hedge_delay()
+            if hedge_delay is not None and (timeout is None or hedge_delay < timeout):
+                done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+                if not done:
+                    pending.update(self._hedge(operation, hedge_limiter))
+
+            error: BaseException | None = None
+            while pending:
+                remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.timeouts += 1
+                    upstream_timeouts_total.inc(upstream=self.name)
+                    raise TimeoutError(f"{timeout:.2f}秒以内に応答がありませんでした")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                            upstream_hedge_wins_total.inc(upstream=self.name)
+                        return task.result()
+                    error = task.exception()
+            # ヘッジを含むすべての呼び出しが失敗した場合は、最後の例外を送出する
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # ヘッジを送る（枠に空きがなければ送らない。確保した枠はヘッジが終了・取り消された時点で解放する）
+    def _hedge(
+        self, operation: Callable[[], Awaitable[T]], limiter: ConcurrencyLimiter | None
+    ) -> list[asyncio.Future[T]]:
+        if limiter is not None and not limiter.try_acquire():
+            self.hedges_skipped += 1
+            return []
+        self.hedges += 1
+        upstream_hedges_total.inc(upstream=self.name)
+        hedge = asyncio.ensure_future(operation())
+        if limiter is not None:
+            start = time.perf_counter()
+            hedge.add_done_callback(lambda _: limiter.release(time.perf_counter() - start))
+        return [hedge]
+
+
+class UpstreamResilience:
+    def __init__(self, embedding: ResilientCall, search: ResilientCall):
+        self.embedding = embedding
+        self.search = search
+
+    def stats(self) -> dict:
+        return {
+            "embedding": self.embedding.stats(),
+            "search": self.search.stats(),
+        }
@@ -1,19 +1,42 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from services.chat_service import ChatService
-from dependencies import get_chat_service
+from dependencies import acquire_chat_admission, get_chat_service, get_request_profiler
 from models import ChatRequest
 from fastapi import Depends
 from logger import get_logger
 from fastapi.responses import StreamingResponse
+from profiling import PROFILE_ID_HEADER, PROFILE_TOKEN_HEADER, RequestProfiler
+from sse import cancel_on_disconnect, coalesce
+import config
 
 router = APIRouter(prefix="/api/v1/chat", tags=["chat"])
 logger = get_logger(__name__)
 
 
-@router.post("/", response_model=None)
+# 同時処理数の上限を超えた場合は待ち行列で待ち、受け付けられない場合はストリーム開始前に 429 / 503 を返す
+@router.post("/", response_model=None, dependencies=[Depends(acquire_chat_admission)])
 async def chat(
-    request: ChatRequest, service: ChatService = Depends(get_chat_service)
+    request: ChatRequest,
+    http_request: Request,
+    service: ChatService = Depends(get_chat_service),
+    profiler: RequestProfiler = Depends(get_request_profiler),
 ) -> StreamingResponse:
+    stream = service.process_chat(request)
+
+    # プロファイル対象のリクエストはストリーム全体を記録し、プロファイルIDをヘッダーで返す
+    headers = {}
+    session = profiler.maybe_profile(http_request.headers.get(PROFILE_TOKEN_HEADER))
+    if session is not None:
+        stream = profiler.wrap(session, stream)
+        headers[PROFILE_ID_HEADER] = session.id
+
+    # クライアントが切断したら回答の生成を取り消し、トークンごとのイベントはまとめて送信する
     return StreamingResponse(
-        service.process_chat(request), media_type="text/event-stream"
+        coalesce(
+            cancel_on_disconnect(stream, http_request.receive),
+            max_bytes=config.SSE_FLUSH_MAX_BYTES,
+            interval_seconds=config.SSE_FLUSH_INTERVAL_SECONDS,
+        ),
+        media_type="text/event-stream",
+        headers=headers,
     )
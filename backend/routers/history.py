@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
 from repositories.conversation_repository import ConversationRepository
 from dependencies import get_conversation_repository
-from models import Conversation, Message
+from models import Conversation, ConversationDetail, Message
 
 router = APIRouter(prefix="/api/v1/conversations", tags=["conversations"])
 
+# 次ページのカーソルを返すレスポンスヘッダー（最終ページでは付与しない）
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 # 会話作成
 @router.post("/", response_model=Conversation)
 def create_conversation(
@@ -13,12 +17,24 @@ def create_conversation(
     return repo.create_conversation()
 
 
-# 会話一覧取得
+# 会話一覧取得（作成日時降順）
+# limit か cursor を指定した場合はキーセットページネーション（既存クライアント向けに、指定がなければ全件を返す）
 @router.get("/", response_model=list[Conversation])
 def get_all_conversations(
+    response: Response,
+    limit: int | None = Query(default=None, ge=1, le=200),
+    cursor: str | None = None,
     repo: ConversationRepository = Depends(get_conversation_repository),
 ) -> list[Conversation]:
-    return repo.get_all_conversations()
+    if limit is None and cursor is None:
+        return repo.get_all_conversations()
+    try:
+        conversations, next_cursor = repo.get_conversations_page(limit or 50, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return conversations
 
 
 # 特定の会話取得
@@ -33,13 +49,77 @@ def get_conversation(
     return conversation
 
 
-# メッセージ一覧取得
+# 会話詳細取得（会話とメッセージ1ページ分を1回のクエリで取得）
+# fields で返すフィールドを絞り込める（例: fields=title,messages.role,messages.content）
+@router.get("/{conversation_id}/detail", response_model=ConversationDetail)
+def get_conversation_detail(
+    conversation_id: str,
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: str | None = None,
+    fields: str | None = None,
+    repo: ConversationRepository = Depends(get_conversation_repository),
+) -> ConversationDetail | JSONResponse:
+    include = _parse_fields(fields) if fields else None
+    try:
+        detail = repo.get_conversation_detail(conversation_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    conversation, messages, next_cursor = detail
+    result = ConversationDetail(
+        id=conversation.id,
+        title=conversation.title,
+        created_at=conversation.created_at,
+        messages=messages,
+    )
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor is not None else {}
+    if include is None:
+        response.headers.update(headers)
+        return result
+    return JSONResponse(result.model_dump(mode="json", include=include), headers=headers)
+
+
+# fields パラメータを model_dump の include 形式に変換
+def _parse_fields(fields: str) -> dict:
+    include: dict = {}
+    message_fields: set[str] = set()
+    for name in (field.strip() for field in fields.split(",")):
+        if not name:
+            continue
+        if name.startswith("messages."):
+            message_fields.add(name.removeprefix("messages."))
+        elif name in ConversationDetail.model_fields:
+            include[name] = True
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+
+    unknown = message_fields - set(Message.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field: messages.{sorted(unknown)[0]}")
+    if message_fields:
+        include["messages"] = {"__all__": message_fields}
+    return include
+
+
+# メッセージ一覧取得（作成日時昇順、キーセットページネーション）
 @router.get("/{conversation_id}/messages", response_model=list[Message])
 def get_messages(
     conversation_id: str,
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: str | None = None,
     repo: ConversationRepository = Depends(get_conversation_repository),
 ) -> list[Message]:
-    return repo.get_messages(conversation_id)
+    try:
+        messages, next_cursor = repo.get_messages_page(conversation_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return messages
 
 
 # 会話削除
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from metrics import registry
+
+router = APIRouter(tags=["metrics"])
+
+# Prometheus のテキスト形式のContent-Type
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# メトリクス取得（Prometheus のスクレイプ用）
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from dependencies import get_request_profiler
+from profiling import RequestProfiler
+
+router = APIRouter(prefix="/api/v1/admin/profiles", tags=["admin"])
+
+
+# 管理者用トークンの検証（トークン未設定の場合は常に拒否）
+def verify_profile_token(
+    x_profile_token: str | None = Header(default=None),
+    profiler: RequestProfiler = Depends(get_request_profiler),
+) -> None:
+    if not profiler.is_admin(x_profile_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+# 記録済みプロファイル一覧取得（新しい順、段階のタイムラインを含む）
+@router.get("/", response_model=list[dict], dependencies=[Depends(verify_profile_token)])
+def get_profiles(
+    profiler: RequestProfiler = Depends(get_request_profiler),
+) -> list[dict]:
+    return profiler.summaries()
+
+
+# プロファイル取得（speedscope 形式。https://www.speedscope.app/ で読み込める）
+@router.get("/{profile_id}", response_model=dict, dependencies=[Depends(verify_profile_token)])
+def get_profile(
+    profile_id: str,
+    profiler: RequestProfiler = Depends(get_request_profiler),
+) -> dict:
+    session = profiler.get(profile_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return session.to_speedscope()
@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends
+from caches.embedding_cache import EmbeddingCache
+from caches.answer_cache import AnswerCache
+from clients import UpstreamClients
+from repositories.message_writer import MessageWriteBehind
+from services.query_rewrite_policy import QueryRewritePolicy
+from services.context_builder import ContextBuilder
+from admission import ConcurrencyLimiter, UpstreamLimits
+from singleflight import SingleFlight
+from resilience import UpstreamResilience
+from dependencies import (
+    get_embedding_cache,
+    get_answer_cache,
+    get_upstream_clients,
+    get_message_writer,
+    get_rewrite_policy,
+    get_context_builder,
+    get_chat_admission,
+    get_upstream_limits,
+    get_single_flight,
+    get_upstream_resilience,
+)
+
+router = APIRouter(prefix="/api/v1/stats", tags=["stats"])
+
+
+# キャッシュ統計取得
+@router.get("/cache", response_model=dict)
+def get_cache_stats(
+    embedding_cache: EmbeddingCache = Depends(get_embedding_cache),
+    answer_cache: AnswerCache | None = Depends(get_answer_cache),
+) -> dict:
+    return {
+        "embedding": embedding_cache.stats(),
+        "answer": answer_cache.stats() if answer_cache is not None else None,
+    }
+
+
+# コネクションプール統計取得
+@router.get("/pool", response_model=dict)
+def get_pool_stats(
+    clients: UpstreamClients = Depends(get_upstream_clients),
+) -> dict:
+    return clients.stats()
+
+
+# メッセージ書き込みバッファ統計取得
+@router.get("/write-behind", response_model=None)
+def get_write_behind_stats(
+    message_writer: MessageWriteBehind | None = Depends(get_message_writer),
+) -> dict | None:
+    return message_writer.stats() if message_writer is not None else None
+
+
+# Query Rewriting 経路別カウンタ取得
+@router.get("/rewrite", response_model=None)
+def get_rewrite_stats(
+    rewrite_policy: QueryRewritePolicy | None = Depends(get_rewrite_policy),
+) -> dict | None:
+    return rewrite_policy.stats() if rewrite_policy is not None else None
+
+
+# 参考情報組み立て統計取得
+@router.get("/context", response_model=dict)
+def get_context_stats(
+    context_builder: ContextBuilder = Depends(get_context_builder),
+) -> dict:
+    return context_builder.stats()
+
+
+# アドミッション制御統計取得（同時処理数・待ち行列の長さ・拒否件数）
+@router.get("/admission", response_model=dict)
+def get_admission_stats(
+    chat_admission: ConcurrencyLimiter = Depends(get_chat_admission),
+    upstream_limits: UpstreamLimits = Depends(get_upstream_limits),
+) -> dict:
+    return {
+        "chat_request": chat_admission.stats(),
+        "upstream": upstream_limits.stats(),
+    }
+
+
+# 同一呼び出しの集約統計取得（用途ごとの呼び出し数と合流した件数）
+@router.get("/singleflight", response_model=None)
+def get_single_flight_stats(
+    single_flight: SingleFlight | None = Depends(get_single_flight),
+) -> dict | None:
+    return single_flight.stats() if single_flight is not None else None
+
+
+# 上流API呼び出しの再試行・タイムアウト・ヘッジ・サーキットブレーカーの統計取得
+@router.get("/resilience", response_model=dict)
+def get_resilience_stats(
+    upstream_resilience: UpstreamResilience = Depends(get_upstream_resilience),
+) -> dict:
+    return upstream_resilience.stats()
@@ -1,109 +1,426 @@
-from repositories.search_repository import SearchRepository
-from repositories.conversation_repository import ConversationRepository
+from repositories.search_repository import SearchRepository, group_by_parent
+from repositories.local_search_repository import LocalSearchRepository
+from repositories.async_conversation_repository import AsyncConversationRepository
+from caches.embedding_cache import EmbeddingCache, normalize_text
+from caches.answer_cache import AnswerCache
+from services.query_rewrite_policy import QueryRewritePolicy
+from services.history_service import HistoryService
+from services.context_builder import ContextBuilder
+from admission import UpstreamLimits
+from singleflight import SingleFlight
+from resilience import UpstreamResilience, request_deadline
 from openai import AsyncOpenAI
-from exceptions import EmbeddingError, LLMError
+from exceptions import EmbeddingError, LLMError, OverloadedError
+from exception_handlers import user_message
 from models import ChatRequest, MessageBase, Role
-from typing import AsyncGenerator
-import json
+from logger import get_logger
+from sse import error_event, message_event, title_event
+from metrics import (
+    cancelled_streams_total,
+    inflight_streams,
+    observe_stage,
+    record_usage,
+    track_stage,
+    track_upstream,
+)
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, AsyncGenerator, Awaitable, Callable, TypeVar
+from array import array
+import asyncio
+import hashlib
+import time
+import unicodedata
 import config
 
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
 
 class ChatService:
     def __init__(
         self,
         openai_client: AsyncOpenAI,
-        search_repository: SearchRepository,
-        conversation_repository: ConversationRepository,
+        search_repository: SearchRepository | LocalSearchRepository,
+        conversation_repository: AsyncConversationRepository,
+        embedding_cache: EmbeddingCache | None = None,
+        answer_cache: AnswerCache | None = None,
+        rewrite_policy: QueryRewritePolicy | None = None,
+        history_service: HistoryService | None = None,
+        context_builder: ContextBuilder | None = None,
+        upstream_limits: UpstreamLimits | None = None,
+        single_flight: SingleFlight | None = None,
+        upstream_resilience: UpstreamResilience | None = None,
     ):
         self.openai_client = openai_client
         self.search_repository = search_repository
         self.conversation_repository = conversation_repository
+        self.embedding_cache = embedding_cache
+        self.answer_cache = answer_cache
+        self.rewrite_policy = rewrite_policy
+        self.history_service = history_service
+        self.context_builder = context_builder
+        self.upstream_limits = upstream_limits
+        self.single_flight = single_flight
+        self.upstream_resilience = upstream_resilience
+        self._db_lock = asyncio.Lock()
+        self._db_tasks: list[asyncio.Task] = []
 
     # チャット処理
+    # DB書き込み・タイトル生成・投機的検索はタスクとして並行に実行し、最初のトークンまでの時間を短縮する
     async def process_chat(self, request: ChatRequest) -> AsyncGenerator[str, None]:
-        # 会話IDがなければ新規会話作成
+        # 会話IDがなければ新規会話作成（以降の書き込みの外部キーになるため待機する）
         if request.conversation_id is None:
-            conversation = self.conversation_repository.create_conversation()
+            conversation = await self.conversation_repository.create_conversation()
             conversation_id = conversation.id
         else:
             conversation_id = request.conversation_id
 
-        # ユーザーメッセージをDBに保存
-        self.conversation_repository.add_message(
-            conversation_id, "user", request.messages[-1].content
+        # 会話履歴の組み立て（サーバー側履歴モードではDBから読み込み、トークン予算内に詰める）
+        messages = request.messages
+        is_first_turn = len(request.messages) == 1
+        if self.history_service is not None and request.conversation_id is not None:
+            messages, is_first_turn = await self._load_history(
+                conversation_id, request.messages[-1]
+            )
+
+        user_query = request.messages[-1].content
+        title_task: asyncio.Task[str] | None = None
+        speculative_task: asyncio.Task[tuple[list[float], list[dict]]] | None = None
+        full_response = ""
+        response_saved = False
+        # 上流呼び出しの時間予算（バックグラウンドタスクにも引き継ぐため、タスク作成前に設定する）
+        deadline_token = request_deadline.set(
+            time.monotonic() + config.UPSTREAM_REQUEST_BUDGET_SECONDS
+            if config.UPSTREAM_REQUEST_BUDGET_SECONDS > 0
+            else None
         )
+        inflight_streams.inc()
+        try:
+            # ユーザーメッセージをDBに保存（バックグラウンド）
+            self._schedule_db_write(
+                self.conversation_repository.add_message(conversation_id, "user", user_query)
+            )
 
-        # Query Rewriting
-        rewrited_query = await self._rewrite_query(request.messages)
+            # 会話タイトル生成（最初のメッセージのみ、回答生成と並行して実行）
+            if is_first_turn:
+                title_task = asyncio.create_task(
+                    self._create_conversation_title(user_query)
+                )
 
-        # ベクトル生成
-        vector_query_for_reference = await self._generate_embedding(rewrited_query)
+            # 書き換え前の質問で投機的に検索（書き換え結果が同等ならそのまま使用する）
+            if config.SPECULATIVE_SEARCH_ENABLED:
+                speculative_task = asyncio.create_task(self._embed_and_search(user_query))
 
-        # 参考情報のベクトル検索
-        search_results = await self.search_repository.hybrid_search(
-            vector_query=vector_query_for_reference,
-            top_k=2,
-            text_query=rewrited_query,
-            use_semantic_search=True,
-            filter=None,
-        )
+            # Query Rewriting
+            with track_stage("rewrite"):
+                rewrited_query = await self._rewrite_query(messages)
 
-        # 参考情報の組み立て
-        reference_messages = self._build_reference(search_results)
+            search_results: list[dict] | None = None
+            vector_query_for_reference: list[float] | None = None
+            if speculative_task is not None and self._is_equivalent_query(
+                user_query, rewrited_query
+            ):
+                try:
+                    vector_query_for_reference, search_results = await speculative_task
+                except Exception as e:
+                    # 投機的検索が失敗した場合は、通常の経路でやり直す
+                    logger.warning(f"投機的検索に失敗したため再実行します: {e}")
+            elif speculative_task is not None:
+                speculative_task.cancel()
+            if vector_query_for_reference is None:
+                # ベクトル生成
+                vector_query_for_reference = await self._generate_embedding(rewrited_query)
 
-        # ストリーミング応答の取得とクライアントへのSSE送信
-        full_response = ""
-        async for chunk in self._stream_response(
-            messages=[reference_messages] + request.messages,
-        ):
-            full_response += chunk
-            yield f"data: {json.dumps({'type': 'message', 'content': chunk})}\n\n"
-
-        # 会話タイトル更新（最初のメッセージをタイトルに変換）
-        if len(request.messages) == 1:
-            title = await self._create_conversation_title(request.messages[0].content)
-            self.conversation_repository.update_conversation_title(
-                conversation_id, title
+            # 類似質問の回答がキャッシュにあれば、検索とLLM呼び出しを省略して再送する
+            # （質問より前の会話履歴が同じ場合に限る）
+            answer_context_key = QueryRewritePolicy.make_key(messages[:-1])
+            cached_answer = (
+                self.answer_cache.lookup(
+                    vector_query_for_reference, rewrited_query, answer_context_key
+                )
+                if self.answer_cache is not None
+                else None
+            )
+            if cached_answer is not None:
+                for chunk in cached_answer.chunks:
+                    full_response += chunk
+                    yield message_event(chunk)
+            else:
+                # 参考情報のベクトル検索
+                if search_results is None:
+                    search_results = await self._search(
+                        vector_query_for_reference, rewrited_query
+                    )
+
+                # 参考情報の組み立て
+                with track_stage("reference"):
+                    reference_messages = self._build_reference(search_results)
+
+                # ストリーミング応答の取得とクライアントへのSSE送信
+                # （最初のトークンまでの時間を ttft、ストリーム全体を stream として記録）
+                chunks: list[str] = []
+                stream_start = time.perf_counter()
+                with track_stage("stream"):
+                    async for chunk in self._stream_response(
+                        messages=[reference_messages] + messages,
+                    ):
+                        if not chunks:
+                            observe_stage("ttft", stream_start)
+                        chunks.append(chunk)
+                        full_response += chunk
+                        yield message_event(chunk)
+
+                # 回答をキャッシュに保存
+                if self.answer_cache is not None and chunks:
+                    self.answer_cache.store(
+                        rewrited_query,
+                        vector_query_for_reference,
+                        chunks,
+                        answer_context_key,
+                    )
+
+            # アシスタントメッセージをDBに保存（バックグラウンド）
+            self._schedule_db_write(
+                self.conversation_repository.add_message(
+                    conversation_id, "assistant", full_response
+                )
+            )
+            response_saved = True
+
+            # 会話タイトル更新（生成済みのタイトルを送信）
+            if title_task is not None:
+                title = await title_task
+                self._schedule_db_write(
+                    self.conversation_repository.update_conversation_title(
+                        conversation_id, title
+                    )
+                )
+                yield title_event(title)
+        except OverloadedError as e:
+            # ストリーム開始後に上流の枠を確保できなかった場合は、ステータスコードを返せないため
+            # エラーイベントで通知する（途中までの回答は中断した印を付けて保存する）
+            if not response_saved:
+                self._save_truncated_response(conversation_id, full_response)
+            logger.warning(
+                f"回答の生成中に混雑のため処理を中断しました: {e.message}",
+                extra={"extra_fields": {"conversation_id": conversation_id}},
+            )
+            yield error_event(e.message, e.retry_after)
+        except Exception as e:
+            # 検索・LLMなどのエラーも同様に、ステータスコードの代わりにエラーイベントで通知する
+            if not response_saved:
+                self._save_truncated_response(conversation_id, full_response)
+            logger.error(
+                f"回答の生成中にエラーが発生したため処理を中断しました: {e}",
+                exc_info=True,
+                extra={"extra_fields": {"conversation_id": conversation_id}},
+            )
+            yield error_event(user_message(e))
+        except (asyncio.CancelledError, GeneratorExit):
+            # クライアントの切断で打ち切られた場合は、途中までの回答を中断した印を付けて保存する
+            cancelled_streams_total.inc()
+            if not response_saved:
+                self._save_truncated_response(conversation_id, full_response)
+            logger.info(
+                "クライアントの切断により回答の生成を中断しました",
+                extra={
+                    "extra_fields": {
+                        "conversation_id": conversation_id,
+                        "response_chars": len(full_response),
+                    }
+                },
             )
-            yield f"data: {json.dumps({'type': 'title', 'title': title})}\n\n"
+            raise
+        finally:
+            # 未完了のLLM/検索タスクは破棄し、DB書き込みは完了を待つ
+            for task in (title_task, speculative_task):
+                if task is not None and not task.done():
+                    task.cancel()
+            await self._wait_db_writes()
+            inflight_streams.dec()
+            try:
+                request_deadline.reset(deadline_token)
+            except ValueError:
+                # ジェネレーターが別のコンテキストで閉じられた場合
+                request_deadline.set(None)
 
-        # アシスタントメッセージをDBに保存
-        self.conversation_repository.add_message(
-            conversation_id, "assistant", full_response
+    # 途中までの回答を中断した印を付けて保存する
+    def _save_truncated_response(self, conversation_id: str, full_response: str) -> None:
+        if full_response:
+            self._schedule_db_write(
+                self.conversation_repository.add_message(
+                    conversation_id, "assistant", full_response, truncated=True
+                )
+            )
+
+    # サーバー側の会話履歴を読み込み、トークン予算内の履歴と初回ターンかどうかを返す
+    async def _load_history(
+        self, conversation_id: str, new_message: MessageBase
+    ) -> tuple[list[MessageBase], bool]:
+        assert self.history_service is not None
+        conversation = await self.conversation_repository.get_conversation(conversation_id)
+        if conversation is None:
+            return [new_message], True
+        stored_messages = await self.conversation_repository.get_messages(conversation_id)
+
+        history, overflow, summarized_count = self.history_service.pack(
+            conversation, stored_messages, new_message
+        )
+        # あふれた古いメッセージは次のターンに向けて要約に畳み込む
+        self.history_service.schedule_summary_update(
+            self.openai_client,
+            conversation_id, conversation.summary, overflow, summarized_count
         )
+        return history + [new_message], not stored_messages
+
+    # DB書き込みをバックグラウンドで実行（同一セッションを共有するため、投入順に直列化する）
+    def _schedule_db_write(self, write: Awaitable[Any]) -> asyncio.Task:
+        async def run() -> Any:
+            async with self._db_lock:
+                with track_stage("db_write"):
+                    return await write
+
+        task = asyncio.create_task(run())
+        self._db_tasks.append(task)
+        return task
+
+    # バックグラウンドのDB書き込みの完了を待つ（失敗はログに記録）
+    async def _wait_db_writes(self) -> None:
+        results = await asyncio.gather(*self._db_tasks, return_exceptions=True)
+        self._db_tasks.clear()
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"会話履歴の保存に失敗しました: {result}", exc_info=result)
+
+    # 参考情報のベクトル検索
+    async def _search(self, vector_query: list[float], text_query: str) -> list[dict]:
+        # ContextBuilderがある場合は候補を多めに取得し、採用件数は予算に応じて決める
+        top_k = (
+            self.context_builder.max_passages if self.context_builder is not None else 2
+        )
+
+        async def search() -> list[dict]:
+            with track_upstream("search"):
+                return await self.search_repository.hybrid_search(
+                    vector_query=vector_query,
+                    top_k=top_k,
+                    text_query=text_query,
+                    use_semantic_search=True,
+                    filter=None,
+                )
+
+        with track_stage("search"):
+            results = await self._single_flight(
+                "search",
+                self._search_key(vector_query, top_k, text_query),
+                lambda: self._call_upstream("search", search),
+            )
+        # 同じ規定から複数のチャンクがヒットした場合は1件にまとめる
+        return group_by_parent(results)
+
+    # 検索の集約キー（ベクトルはそのままのバイト列、検索ワードは表記揺れを正規化）
+    @staticmethod
+    def _search_key(vector_query: list[float], top_k: int, text_query: str) -> str:
+        digest = hashlib.sha256(array("d", vector_query).tobytes())
+        digest.update(f"\0{top_k}\0{normalize_text(text_query)}".encode("utf-8"))
+        return digest.hexdigest()
+
+    # ベクトル生成と検索をまとめて実行（投機的検索用）
+    async def _embed_and_search(self, query: str) -> tuple[list[float], list[dict]]:
+        vector_query = await self._generate_embedding(query)
+        return vector_query, await self._search(vector_query, query)
+
+    # 書き換え前後のクエリが同等か判定（表記揺れ・空白・記号の違いは無視）
+    @staticmethod
+    def _is_equivalent_query(original: str, rewritten: str) -> bool:
+        def strip(text: str) -> str:
+            return "".join(
+                c for c in normalize_text(text).lower()
+                if not c.isspace() and not unicodedata.category(c).startswith("P")
+            )
+
+        return strip(original) == strip(rewritten)
 
     # 会話タイトル要約
     async def _create_conversation_title(self, message: str) -> str:
-        try:
-            response = await self.openai_client.chat.completions.create(
-                model=config.LLM_MODEL,
-                messages=[  # type: ignore
-                    self._create_system_message(
-                        "system",
-                        "以下の文章を30文字以内で要約し、会話のタイトルとして適切な名前を付けてください。",
-                    ),
-                    self._create_system_message("user", message),
-                ],
-            )
-            result = response.choices[0].message.content
-            if result is None:
-                raise LLMError("LLMからの応答が空です")
-            return result
-        except Exception as e:
-            raise LLMError(f"LLM応答中にエラーが発生しました: {str(e)}")
+        with track_stage("title"):
+            async with self._upstream_slot("chat"):
+                try:
+                    with track_upstream("openai_chat"):
+                        response = await self.openai_client.chat.completions.create(
+                            model=config.LLM_MODEL,
+                            messages=[  # type: ignore
+                                self._create_system_message(
+                                    "system",
+                                    "以下の文章を30文字以内で要約し、会話のタイトルとして適切な名前を付けてください。",
+                                ),
+                                self._create_system_message("user", message),
+                            ],
+                        )
+                    record_usage("title", getattr(response, "usage", None))
+                    result = response.choices[0].message.content
+                    if result is None:
+                        raise LLMError("LLMからの応答が空です")
+                    return result
+                except Exception as e:
+                    raise LLMError(f"LLM応答中にエラーが発生しました: {str(e)}")
 
-    # テキストからEmbedding生成
+    # テキストからEmbedding生成（キャッシュがあれば優先して使用）
     async def _generate_embedding(self, text: str) -> list[float]:
-        try:
-            response = await self.openai_client.embeddings.create(
-                model=config.EMBEDDING_MODEL, input=text
+        async def generate() -> list[float]:
+            if self.embedding_cache is None:
+                return await self._create_embedding(text)
+            return await self.embedding_cache.get_or_create(
+                config.EMBEDDING_MODEL, text, self._create_embedding
             )
-            return response.data[0].embedding
-        except Exception as e:
-            raise EmbeddingError(f"Embedding作成中にエラーが発生しました: {str(e)}")
+
+        with track_stage("embedding"):
+            return await self._single_flight(
+                "embedding", EmbeddingCache.make_key(config.EMBEDDING_MODEL, text), generate
+            )
+
+    # OpenAI APIでEmbedding生成
+    async def _create_embedding(self, text: str) -> list[float]:
+        async def create() -> list[float]:
+            try:
+                with track_upstream("openai_embedding"):
+                    response = await self.openai_client.embeddings.create(
+                        model=config.EMBEDDING_MODEL, input=text
+                    )
+                record_usage("embedding", getattr(response, "usage", None))
+                return response.data[0].embedding
+            except Exception as e:
+                # 元の例外を残し、再試行するかどうかを判定できるようにする
+                raise EmbeddingError(f"Embedding作成中にエラーが発生しました: {str(e)}") from e
+
+        return await self._call_upstream("embedding", create)
 
     # 質問の意図を検索ワードに書き直す
+    # （ポリシーが設定されていれば、不要な書き換えの省略・履歴の上限・結果のキャッシュを適用。
+    #   同じ履歴の書き換えが同時に実行された場合は1回のLLM呼び出しにまとめる）
     async def _rewrite_query(self, messages: list[MessageBase]) -> str:
+        policy = self.rewrite_policy
+        if policy is not None:
+            if policy.should_skip(messages):
+                return messages[-1].content
+            messages = policy.window(messages)
+            cached = policy.get_cached(messages)
+            if cached is not None:
+                return cached
+
+        async def rewrite() -> str:
+            rewritten = await self._create_rewritten_query(messages)
+            if policy is not None:
+                policy.store(messages, rewritten)
+            return rewritten
+
+        return await self._single_flight(
+            "rewrite", QueryRewritePolicy.make_key(messages), rewrite
+        )
+
+    # LLMで質問を検索ワードに書き直す
+    async def _create_rewritten_query(self, messages: list[MessageBase]) -> str:
         # システムメッセージ（指示）を追加
         system_message = self._create_system_message(
             "system",
@@ -114,24 +431,32 @@ class ChatService:
         all_messages = [system_message] + messages
 
         # 質問の意図を検索ワードに書き直してもらう
-        try:
-            response = await self.openai_client.chat.completions.create(
-                model=config.LLM_MODEL,
-                messages=all_messages,  # type: ignore
-            )
-            result = response.choices[0].message.content
-            if result is None:
-                raise LLMError("LLMからの応答が空です")
-            return result
-        except Exception as e:
-            raise LLMError(f"LLM応答中にエラーが発生しました: {str(e)}")
+        async with self._upstream_slot("chat"):
+            try:
+                with track_upstream("openai_chat"):
+                    response = await self.openai_client.chat.completions.create(
+                        model=config.LLM_MODEL,
+                        messages=all_messages,  # type: ignore
+                    )
+                record_usage("rewrite", getattr(response, "usage", None))
+                result = response.choices[0].message.content
+                if result is None:
+                    raise LLMError("LLMからの応答が空です")
+                return result
+            except Exception as e:
+                raise LLMError(f"LLM応答中にエラーが発生しました: {str(e)}")
 
     # 参考情報の組み立て
+    # （ContextBuilderが設定されていれば、トークン予算内に重複除去・切り詰めして詰める）
     def _build_reference(self, search_results: list[dict]) -> MessageBase:
-        context = ""
-        for result in search_results:
-            context += f"【出典: {result['source']} (P.{result['page']}) / カテゴリ: {result['category']}】\n"
-            context += f"{result['content']}\n\n"
+        if self.context_builder is not None:
+            context = self.context_builder.build(search_results)
+        else:
+            context = "".join(
+                f"【出典: {result['source']} (P.{result['page']}) / カテゴリ: {result['category']}】\n"
+                f"{result['content']}\n\n"
+                for result in search_results
+            )
 
         system_messages = self._create_system_message(
             "system",
@@ -139,22 +464,59 @@ class ChatService:
         )
         return system_messages
 
-    # ストリーミング応答取得
+    # ストリーミング応答取得（上流の同時呼び出し枠はストリームを読み終えるまで保持する）
     async def _stream_response(
         self,
         messages: list[MessageBase],
     ) -> AsyncGenerator[str, None]:
-        try:
-            response = await self.openai_client.chat.completions.create(
-                model=config.LLM_MODEL,
-                messages=messages,  # type: ignore
-                stream=True,
+        async with self._upstream_slot("chat"):
+            try:
+                with track_upstream("openai_chat_stream"):
+                    response = await self.openai_client.chat.completions.create(
+                        model=config.LLM_MODEL,
+                        messages=messages,  # type: ignore
+                        stream=True,
+                        # 最後のチャンクでトークン数を受け取る（choices は空）
+                        stream_options={"include_usage": True},
+                    )
+                try:
+                    async for chunk in response:
+                        if chunk.choices and chunk.choices[0].delta.content is not None:
+                            yield chunk.choices[0].delta.content
+                        if getattr(chunk, "usage", None) is not None:
+                            record_usage("answer", chunk.usage)
+                finally:
+                    # 途中で打ち切られた場合も、上流への接続をすぐに閉じる
+                    close = getattr(response, "close", None)
+                    if close is not None:
+                        await close()
+            except Exception as e:
+                raise LLMError(f"LLM応答中にエラーが発生しました: {str(e)}")
+
+    # 同じ入力の呼び出しが実行中であれば合流し、その結果を共有する（集約が設定されていなければそのまま実行）
+    async def _single_flight(
+        self, operation: str, key: str, factory: Callable[[], Awaitable[T]]
+    ) -> T:
+        if self.single_flight is None:
+            return await factory()
+        return await self.single_flight.do(operation, key, factory)
+
+    # 上流APIの同時呼び出し枠を確保し、タイムアウト・再試行・ヘッジ・サーキットブレーカーを適用して呼び出す
+    # （upstream: embedding, search。再試行は確保した1枠の中で行い、ヘッジは空いている枠があるときだけ別の枠で送る）
+    async def _call_upstream(self, upstream: str, operation: Callable[[], Awaitable[T]]) -> T:
+        async with self._upstream_slot(upstream):
+            if self.upstream_resilience is None:
+                return await operation()
+            hedge_limiter = (
+                getattr(self.upstream_limits, upstream) if self.upstream_limits is not None else None
             )
-            async for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-        except Exception as e:
-            raise LLMError(f"LLM応答中にエラーが発生しました: {str(e)}")
+            return await getattr(self.upstream_resilience, upstream).call(operation, hedge_limiter)
+
+    # 上流APIの同時呼び出し枠（upstream: chat, embedding, search。制限が設定されていなければ何もしない）
+    def _upstream_slot(self, upstream: str) -> AsyncContextManager[None]:
+        if self.upstream_limits is None:
+            return nullcontext()
+        return getattr(self.upstream_limits, upstream).slot()
 
     # ユーザーのメッセージを作成
     def _create_system_message(self, role: Role, content: str) -> MessageBase:
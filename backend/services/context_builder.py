@@ -0,0 +1,148 @@
+"""参考情報組み立てモジュール
+
+検索結果をスコア順に並べ、重複・重なりの大きいパッセージを除外しながら、
+トークン予算に収まるだけ参考情報に詰める（採用件数 = 動的な top_k）。
+予算に収まらないパッセージは文の区切りで切り詰める。
+ドキュメントごとのトークン数はキャッシュし、リクエストごとに再計算しない。
+"""
+
+import hashlib
+import re
+from collections import OrderedDict
+from tokenizer import count_tokens
+
+# 文の区切り（句点・感嘆符・疑問符・改行の直後）
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[。！？!?\n])")
+
+# 重なり判定に使う文字n-gramの長さ
+SHINGLE_SIZE = 3
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        token_budget: int = 2000,
+        max_passages: int = 8,
+        dedupe_threshold: float = 0.8,
+        min_truncated_tokens: int = 50,
+        token_cache_size: int = 4096,
+    ):
+        self.token_budget = token_budget
+        self.max_passages = max_passages
+        self.dedupe_threshold = dedupe_threshold
+        self.min_truncated_tokens = min_truncated_tokens
+        self.token_cache_size = token_cache_size
+        self._token_cache: OrderedDict[str, int] = OrderedDict()
+
+        # 統計
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
+        self.deduplicated = 0
+        self.truncated = 0
+
+    # 検索結果から参考情報の文字列を組み立てる
+    def build(self, search_results: list[dict]) -> str:
+        remaining = self.token_budget
+        selected: list[tuple[dict, str]] = []
+        selected_shingles: list[set[str]] = []
+
+        for result in self._sort_by_score(search_results):
+            if remaining <= 0 or len(selected) >= self.max_passages:
+                break
+
+            content = result["content"]
+            shingles = self._shingles(content)
+            if self._is_duplicate(shingles, selected_shingles):
+                self.deduplicated += 1
+                continue
+
+            header = self._header(result)
+            header_tokens = count_tokens(header)
+            content_tokens = self._count_cached(result, content)
+
+            if header_tokens + content_tokens <= remaining:
+                selected.append((result, content))
+                remaining -= header_tokens + content_tokens
+            else:
+                # 予算に収まらない場合は文の区切りで切り詰め、以降のパッセージは追加しない
+                truncated = self._truncate(content, remaining - header_tokens)
+                if truncated:
+                    selected.append((result, truncated))
+                    self.truncated += 1
+                break
+            selected_shingles.append(shingles)
+
+        return "".join(
+            f"{self._header(result)}{content}\n\n" for result, content in selected
+        )
+
+    # 統計情報を取得
+    def stats(self) -> dict:
+        return {
+            "token_cache_hits": self.token_cache_hits,
+            "token_cache_misses": self.token_cache_misses,
+            "token_cache_size": len(self._token_cache),
+            "deduplicated": self.deduplicated,
+            "truncated": self.truncated,
+        }
+
+    # スコアの高い順に並べる（セマンティックランカーのスコアを優先、同点は検索順）
+    @staticmethod
+    def _sort_by_score(search_results: list[dict]) -> list[dict]:
+        def score(result: dict) -> float:
+            reranker_score = result.get("@search.reranker_score")
+            if reranker_score is not None:
+                return reranker_score
+            return result.get("@search.score") or 0.0
+
+        return sorted(search_results, key=score, reverse=True)
+
+    @staticmethod
+    def _header(result: dict) -> str:
+        return f"【出典: {result['source']} (P.{result['page']}) / カテゴリ: {result['category']}】\n"
+
+    # ドキュメントのトークン数を取得（IDと内容のハッシュをキーにキャッシュ）
+    def _count_cached(self, result: dict, content: str) -> int:
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        key = f"{result.get('id', '')}:{digest}"
+        tokens = self._token_cache.get(key)
+        if tokens is not None:
+            self._token_cache.move_to_end(key)
+            self.token_cache_hits += 1
+            return tokens
+
+        self.token_cache_misses += 1
+        tokens = count_tokens(content)
+        self._token_cache[key] = tokens
+        while len(self._token_cache) > self.token_cache_size:
+            self._token_cache.popitem(last=False)
+        return tokens
+
+    # 予算内に収まるよう文の区切りで切り詰める（短すぎる場合は採用しない）
+    def _truncate(self, content: str, budget: int) -> str:
+        if budget < self.min_truncated_tokens:
+            return ""
+        kept: list[str] = []
+        used = 0
+        for sentence in SENTENCE_BOUNDARY_PATTERN.split(content):
+            tokens = count_tokens(sentence)
+            if used + tokens > budget:
+                break
+            kept.append(sentence)
+            used += tokens
+        return "".join(kept).rstrip()
+
+    @staticmethod
+    def _shingles(content: str) -> set[str]:
+        text = "".join(content.split())
+        if len(text) <= SHINGLE_SIZE:
+            return {text}
+        return {text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+    # 採用済みのパッセージとの重なり（小さい方に対する包含率）が閾値以上なら重複とみなす
+    def _is_duplicate(self, shingles: set[str], selected: list[set[str]]) -> bool:
+        for other in selected:
+            smaller = min(len(shingles), len(other))
+            if smaller and len(shingles & other) / smaller >= self.dedupe_threshold:
+                return True
+        return False
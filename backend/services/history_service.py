@@ -0,0 +1,176 @@
+"""会話履歴サービスモジュール
+
+サーバー側に保存された会話履歴を、トークン予算に収まるよう新しいものから詰めて返す。
+予算からあふれた古いメッセージは会話ごとの要約に畳み込み、Conversation に保存する。
+要約の更新は次のターンに向けてバックグラウンドで行い、応答を遅らせない。
+要約が追いつくまでは、あふれた未要約のメッセージも履歴に残して会話の途切れを防ぐ。
+要約のLLM呼び出しも、チャットと同じ上流の同時呼び出し数の枠を使う。
+"""
+
+import asyncio
+from contextlib import nullcontext
+from openai import AsyncOpenAI
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from admission import UpstreamLimits
+from exceptions import LLMError
+from logger import get_logger
+from metrics import record_usage, track_upstream
+from models import Conversation, Message, MessageBase
+from repositories.async_conversation_repository import AsyncConversationRepository
+from tokenizer import count_message_tokens
+import config
+
+logger = get_logger(__name__)
+
+
+class HistoryService:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        token_budget: int = 3000,
+        summary_enabled: bool = True,
+        upstream_limits: UpstreamLimits | None = None,
+    ):
+        self.engine = engine
+        self.token_budget = token_budget
+        self.summary_enabled = summary_enabled
+        self.upstream_limits = upstream_limits
+        self._summarizing: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    # 要約と履歴をトークン予算内に詰める
+    # 戻り値は (LLMに渡す履歴, 要約に畳み込むべき未要約のメッセージ, 畳み込み後の要約済み件数)
+    def pack(
+        self,
+        conversation: Conversation,
+        messages: list[Message],
+        new_message: MessageBase,
+    ) -> tuple[list[MessageBase], list[Message], int]:
+        summarized_count = min(conversation.summarized_message_count, len(messages))
+        summary_message = self._summary_message(conversation.summary)
+
+        budget = self.token_budget - count_message_tokens(new_message.content)
+        if summary_message is not None:
+            budget -= count_message_tokens(summary_message.content)
+
+        # 新しいメッセージから予算に収まるだけ採用
+        window_start = len(messages)
+        for index in range(len(messages) - 1, summarized_count - 1, -1):
+            budget -= count_message_tokens(messages[index].content)
+            if budget < 0:
+                break
+            window_start = index
+
+        # 要約が追いつくまで、あふれた未要約のメッセージも新しいものから残す
+        # （要約が失敗し続けても際限なく増えないよう、予算と同じトークン数までとする）
+        history_start = window_start
+        if self.summary_enabled:
+            carry_budget = self.token_budget
+            while history_start > summarized_count:
+                carry_budget -= count_message_tokens(messages[history_start - 1].content)
+                if carry_budget < 0:
+                    break
+                history_start -= 1
+
+        history = [
+            MessageBase(role=m.role, content=m.content) for m in messages[history_start:]
+        ]
+        if summary_message is not None:
+            history.insert(0, summary_message)
+        return history, messages[summarized_count:window_start], window_start
+
+    # 要約の更新をバックグラウンドで開始（同じ会話の要約が進行中なら何もしない）
+    def schedule_summary_update(
+        self,
+        openai_client: AsyncOpenAI,
+        conversation_id: str,
+        previous_summary: str | None,
+        overflow: list[Message],
+        summarized_message_count: int,
+    ) -> None:
+        if not self.summary_enabled or not overflow:
+            return
+        if conversation_id in self._summarizing:
+            return
+        self._summarizing.add(conversation_id)
+        task = asyncio.create_task(
+            self._update_summary(
+                openai_client,
+                conversation_id,
+                previous_summary,
+                overflow,
+                summarized_message_count,
+            )
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # 進行中の要約更新の完了を待つ（シャットダウン時）
+    async def wait_pending(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _update_summary(
+        self,
+        openai_client: AsyncOpenAI,
+        conversation_id: str,
+        previous_summary: str | None,
+        overflow: list[Message],
+        summarized_message_count: int,
+    ) -> None:
+        try:
+            summary = await self._summarize(openai_client, previous_summary, overflow)
+            async with AsyncSession(self.engine, expire_on_commit=False) as session:
+                await AsyncConversationRepository(session).update_conversation_summary(
+                    conversation_id, summary, summarized_message_count
+                )
+        except Exception as e:
+            logger.error(
+                f"会話要約の更新に失敗しました: {e}",
+                extra={"extra_fields": {"conversation_id": conversation_id}},
+            )
+        finally:
+            self._summarizing.discard(conversation_id)
+
+    # 既存の要約に新しいメッセージを畳み込む
+    async def _summarize(
+        self,
+        openai_client: AsyncOpenAI,
+        previous_summary: str | None,
+        overflow: list[Message],
+    ) -> str:
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in overflow)
+        prompt = (
+            f"【これまでの要約】\n{previous_summary or 'なし'}\n\n【追加の会話】\n{transcript}"
+        )
+        # チャットと同じ上流の同時呼び出し数の枠を使う（空きがなければ待つ）
+        chat_slot = (
+            self.upstream_limits.chat.slot() if self.upstream_limits is not None else nullcontext()
+        )
+        async with chat_slot:
+            try:
+                with track_upstream("openai_chat"):
+                    response = await openai_client.chat.completions.create(
+                        model=config.LLM_MODEL,
+                        messages=[  # type: ignore
+                            MessageBase(
+                                role="system",
+                                content="これまでの要約と追加の会話を、後続の質問に答えるために必要な事実を残して簡潔な要約にまとめてください。",
+                            ),
+                            MessageBase(role="user", content=prompt),
+                        ],
+                    )
+                record_usage("summary", getattr(response, "usage", None))
+                result = response.choices[0].message.content
+                if result is None:
+                    raise LLMError("LLMからの応答が空です")
+                return result
+            except Exception as e:
+                raise LLMError(f"LLM応答中にエラーが発生しました: {str(e)}")
+
+    @staticmethod
+    def _summary_message(summary: str | None) -> MessageBase | None:
+        if not summary:
+            return None
+        return MessageBase(role="system", content=f"これまでの会話の要約:\n{summary}")
@@ -0,0 +1,119 @@
+"""Query Rewriting ポリシーモジュール
+
+書き換えが不要な場合（会話の最初の質問・文脈に依存しない短い質問）はLLM呼び出しを省略し、
+直近の会話履歴ウィンドウをキーに書き換え結果をキャッシュする。
+書き換えプロンプトに渡す履歴の件数・文字数にも上限を設ける。
+"""
+
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from caches.embedding_cache import normalize_text
+from models import MessageBase
+
+# 直前の会話に依存する表現（指示語・省略を補う接続表現など）
+CONTEXT_DEPENDENT_PATTERN = re.compile(
+    r"(それ|その|そこ|そちら|あれ|あの|これ|この|こちら|上記|前述|さっき|先ほど|同じ|"
+    r"ほか|他の|その他|^(じゃあ|では|なら|それで|あと|また|ちなみに|で、))"
+    r"|\b(it|that|this|those|these|them|they|above)\b",
+    re.IGNORECASE,
+)
+
+
+class QueryRewritePolicy:
+    def __init__(
+        self,
+        max_history_messages: int = 6,
+        max_history_chars: int = 2000,
+        self_contained_max_chars: int = 0,
+        cache_max_size: int = 1024,
+        cache_ttl_seconds: float = 3600.0,
+    ):
+        self.max_history_messages = max_history_messages
+        self.max_history_chars = max_history_chars
+        self.self_contained_max_chars = self_contained_max_chars
+        self.cache_max_size = cache_max_size
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+        # 経路ごとのカウンタ
+        self.skipped_single_turn = 0
+        self.skipped_self_contained = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.truncated_histories = 0
+
+    # 書き換えを省略できるか判定
+    def should_skip(self, messages: list[MessageBase]) -> bool:
+        # 会話の最初の質問は解決すべき履歴がない
+        if len(messages) == 1:
+            self.skipped_single_turn += 1
+            return True
+
+        # 短く、指示語などを含まない質問はそのまま検索できる（0の場合は判定しない）
+        query = normalize_text(messages[-1].content)
+        if self.self_contained_max_chars <= 0:
+            return False
+        if len(query) <= self.self_contained_max_chars and not (
+            CONTEXT_DEPENDENT_PATTERN.search(query)
+        ):
+            self.skipped_self_contained += 1
+            return True
+
+        return False
+
+    # 書き換えに使う履歴ウィンドウを取得（最新の質問は必ず含める）
+    def window(self, messages: list[MessageBase]) -> list[MessageBase]:
+        selected = [messages[-1]]
+        total_chars = len(messages[-1].content)
+        for message in reversed(messages[-self.max_history_messages : -1]):
+            total_chars += len(message.content)
+            if total_chars > self.max_history_chars:
+                break
+            selected.append(message)
+        selected.reverse()
+
+        if len(selected) < len(messages):
+            self.truncated_histories += 1
+        return selected
+
+    # 履歴ウィンドウに対応する書き換え結果を取得
+    def get_cached(self, window: list[MessageBase]) -> str | None:
+        key = self.make_key(window)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        stored_at, rewritten = entry
+        if time.monotonic() - stored_at > self.cache_ttl_seconds:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        self.cache_hits += 1
+        return rewritten
+
+    # 書き換え結果を保存（LLMを呼び出した回数として記録）
+    def store(self, window: list[MessageBase], rewritten: str) -> None:
+        self.llm_calls += 1
+        key = self.make_key(window)
+        self._cache[key] = (time.monotonic(), rewritten)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_size:
+            self._cache.popitem(last=False)
+
+    # 統計情報を取得
+    def stats(self) -> dict:
+        return {
+            "skipped_single_turn": self.skipped_single_turn,
+            "skipped_self_contained": self.skipped_self_contained,
+            "cache_hits": self.cache_hits,
+            "llm_calls": self.llm_calls,
+            "truncated_histories": self.truncated_histories,
+            "cache_size": len(self._cache),
+        }
+
+    # 履歴ウィンドウのキャッシュキーを生成（表記揺れを正規化）
+    @staticmethod
+    def make_key(window: list[MessageBase]) -> str:
+        raw = "\0".join(f"{m.role}:{normalize_text(m.content)}" for m in window)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
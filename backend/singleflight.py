@@ -0,0 +1,77 @@
+"""同一呼び出しの集約（single-flight）モジュール
+
+同じ入力の上流API呼び出し（Query Rewriting・Embedding生成・ハイブリッド検索）が同時に実行された場合、
+最初の呼び出しだけを実行し、後続の呼び出しはその結果を待って共有する。
+- 呼び出しは (用途, 正規化した入力のキー) で識別し、完了した時点で登録を外す（結果はキャッシュしない）
+- 例外も待っていたすべての呼び出し元に同じ例外として伝わる
+- 実行は別タスクで行い、最初の呼び出し元が取り消されても他の待機者には影響しない
+  （待機者が全員取り消された場合のみ実行を取り消す）
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, TypeVar
+from metrics import singleflight_deduplicated_total
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: dict[tuple[str, str], _Flight] = {}
+
+        # 用途ごとの統計
+        self.calls: dict[str, int] = {}
+        self.deduplicated: dict[str, int] = {}
+
+    # 同じキーの呼び出しが実行中であればその結果を待ち、なければ factory を実行する
+    async def do(self, operation: str, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        flight_key = (operation, key)
+        flight = self._flights.get(flight_key)
+        if flight is None:
+            flight = self._flights[flight_key] = _Flight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(lambda _: self._forget(flight_key, flight))
+        else:
+            self.deduplicated[operation] = self.deduplicated.get(operation, 0) + 1
+            singleflight_deduplicated_total.inc(operation=operation)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # 待機者がいなくなった呼び出しは実行を続ける意味がないため取り消す
+            # （取り消し中の呼び出しに新しい呼び出し元が合流しないよう、登録もすぐに外す）
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+                self._forget_key(flight_key, flight)
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "operations": {
+                operation: {
+                    "calls": calls,
+                    "deduplicated": self.deduplicated.get(operation, 0),
+                }
+                for operation, calls in self.calls.items()
+            },
+        }
+
+    def _forget_key(self, flight_key: tuple[str, str], flight: _Flight) -> None:
+        if self._flights.get(flight_key) is flight:
+            del self._flights[flight_key]
+
+    def _forget(self, flight_key: tuple[str, str], flight: _Flight) -> None:
+        self._forget_key(flight_key, flight)
+        # 待機者が全員取り消された後に失敗した場合、例外が取得されないまま破棄される警告を防ぐ
+        if not flight.task.cancelled():
+            flight.task.exception()
@@ -0,0 +1,151 @@
+"""SSEフレーミングモジュール
+
+チャットのストリームで送るイベントを組み立て、複数のイベントをまとめて送信する。
+- イベントは固定部分を事前に組み立てた文字列に、JSONエスケープした値を埋め込むだけで作成する
+  （json.dumps({"type": ..., ...}) と同じ文字列になるため、クライアントから見た形式は変わらない）
+- トークンごとのイベントはバッファに溜め、一定のバイト数か一定時間ごとにまとめて送信する
+  （最初のイベントだけは体感速度を保つため、溜めずにすぐ送信する）
+- イベントの生成は別タスクで行い、クライアントの切断を検知した時点でそのタスクを取り消す
+  （上流APIの応答待ちの途中でも取り消され、不要なトークン消費と接続の占有を避ける）
+"""
+
+import asyncio
+import time
+from json.encoder import encode_basestring_ascii
+from typing import AsyncIterator
+from starlette.types import Receive
+from metrics import sse_events_total, sse_writes_total
+
+MESSAGE_EVENT_PREFIX = 'data: {"type": "message", "content": '
+TITLE_EVENT_PREFIX = 'data: {"type": "title", "title": '
+ERROR_EVENT_PREFIX = 'data: {"type": "error", "message": '
+EVENT_SUFFIX = "}\n\n"
+
+# イベント生成の終了を表す値
+_END = object()
+# 実行中のイベント生成タスク（完了前にガベージコレクションされないよう参照を保持する）
+_producers: set[asyncio.Task] = set()
+
+
+# 回答のトークンを送るイベント
+def message_event(content: str) -> str:
+    return MESSAGE_EVENT_PREFIX + encode_basestring_ascii(content) + EVENT_SUFFIX
+
+
+# 会話タイトルを送るイベント
+def title_event(title: str) -> str:
+    return TITLE_EVENT_PREFIX + encode_basestring_ascii(title) + EVENT_SUFFIX
+
+
+# ストリームの開始後に処理を続けられなくなったことを送るイベント
+# （retry_after: 再試行までの秒数。混雑以外のエラーでは省略する）
+def error_event(message: str, retry_after: int | None = None) -> str:
+    event = ERROR_EVENT_PREFIX + encode_basestring_ascii(message)
+    if retry_after is not None:
+        event += f', "retry_after": {retry_after}'
+    return event + EVENT_SUFFIX
+
+
+# イベントをまとめて送信する
+# max_bytes 以上溜まるか、最初に溜めたイベントから interval_seconds 経過した時点で送信する
+# （interval_seconds が0以下の場合はまとめずにそのまま送信する）
+async def coalesce(
+    events: AsyncIterator[str], max_bytes: int = 4096, interval_seconds: float = 0.03
+) -> AsyncIterator[str]:
+    if interval_seconds <= 0:
+        async for event in events:
+            sse_events_total.inc()
+            sse_writes_total.inc()
+            yield event
+        return
+
+    iterator = events.__aiter__()
+    buffer: list[str] = []
+    buffered_bytes = 0
+    deadline = 0.0
+    first = True
+    pending: asyncio.Future[str] | None = None
+    try:
+        while True:
+            if pending is None and not buffer:
+                # 送信待ちがなければ、期限を気にせず次のイベントを待つ
+                try:
+                    event = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                # 送信待ちがあれば、期限までに次のイベントが来なければ先に送信する
+                # （待機中の __anext__ は取り消さず、次のループで引き続き待つ）
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                timeout = max(0.0, deadline - time.perf_counter()) if buffer else None
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    yield _flush(buffer)
+                    buffered_bytes = 0
+                    continue
+                try:
+                    event = pending.result()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    pending = None
+
+            sse_events_total.inc()
+            if not buffer:
+                deadline = time.perf_counter() + interval_seconds
+            buffer.append(event)
+            buffered_bytes += len(event)
+            if first or buffered_bytes >= max_bytes:
+                first = False
+                yield _flush(buffer)
+                buffered_bytes = 0
+
+        if buffer:
+            yield _flush(buffer)
+    finally:
+        # クライアントの切断などで途中で閉じられた場合は、待機中のイベント取得を取り消す
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+def _flush(buffer: list[str]) -> str:
+    sse_writes_total.inc()
+    data = "".join(buffer)
+    buffer.clear()
+    return data
+
+
+# イベントの生成を別タスクで行い、クライアントが切断したら取り消す
+# （取り消された生成側では asyncio.CancelledError が発生する。受信側は送信をやめて静かに終了する）
+async def cancel_on_disconnect(events: AsyncIterator[str], receive: Receive) -> AsyncIterator[str]:
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce() -> None:
+        try:
+            async for event in events:
+                queue.put_nowait(event)
+        finally:
+            queue.put_nowait(_END)
+
+    async def watch_disconnect() -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        producer.cancel()
+
+    producer = asyncio.create_task(produce())
+    _producers.add(producer)
+    producer.add_done_callback(_producers.discard)
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        while (event := await queue.get()) is not _END:
+            yield event
+        if not producer.cancelled():
+            # 生成側の例外は受信側に伝える
+            await producer
+    finally:
+        watcher.cancel()
+        # 送信が失敗するなど、受信側が先に終了した場合も生成を取り消し、後処理（途中までの回答の保存など）を待つ
+        if not producer.done():
+            producer.cancel()
+            await asyncio.wait({producer})
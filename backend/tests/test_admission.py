@@ -0,0 +1,155 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from admission import ConcurrencyLimiter, UpstreamLimits
+from dependencies import get_chat_admission
+from exceptions import OverloadedError
+from main import app
+from metrics import admission_rejected_total
+from models import ChatRequest, MessageBase
+from services.chat_service import ChatService
+
+
+def test_release_hands_slot_to_waiters_in_order():
+    limiter = ConcurrencyLimiter("test_handoff", max_concurrent=1, max_queue=2)
+    order: list[int] = []
+
+    async def worker(index: int) -> None:
+        async with limiter.slot():
+            order.append(index)
+            await asyncio.sleep(0.01)
+
+    async def run() -> None:
+        await asyncio.gather(*(worker(i) for i in range(3)))
+
+    asyncio.run(run())
+
+    assert order == [0, 1, 2]
+    stats = limiter.stats()
+    assert stats["in_use"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["admitted"] == 3
+    assert stats["queued"] == 2
+
+
+def test_full_queue_is_rejected_with_429():
+    limiter = ConcurrencyLimiter("test_queue_full", max_concurrent=1, max_queue=0)
+    before = admission_rejected_total.value(limiter="test_queue_full", reason="queue_full")
+
+    async def run() -> None:
+        await limiter.acquire()
+        await limiter.acquire()
+
+    with pytest.raises(OverloadedError) as exc_info:
+        asyncio.run(run())
+
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.retry_after >= 1
+    assert (
+        admission_rejected_total.value(limiter="test_queue_full", reason="queue_full")
+        == before + 1
+    )
+
+
+def test_queue_timeout_is_rejected_with_503_and_frees_queue():
+    limiter = ConcurrencyLimiter(
+        "test_timeout", max_concurrent=1, max_queue=1, queue_timeout_seconds=0.01
+    )
+
+    async def run() -> None:
+        await limiter.acquire()
+        try:
+            await limiter.acquire()
+        finally:
+            assert limiter.stats()["queue_depth"] == 0
+            limiter.release()
+
+    with pytest.raises(OverloadedError) as exc_info:
+        asyncio.run(run())
+
+    assert exc_info.value.status_code == 503
+    assert limiter.stats()["in_use"] == 0
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    limiter = ConcurrencyLimiter("test_cancel", max_concurrent=1, max_queue=1)
+
+    async def run() -> None:
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 1
+        # 待機中に取り消された場合は待ち行列から外れ、解放した枠は誰にも渡らない
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+
+    asyncio.run(run())
+
+    stats = limiter.stats()
+    assert stats["in_use"] == 0
+    assert stats["queue_depth"] == 0
+
+
+def test_unlimited_when_max_concurrent_is_zero():
+    limiter = ConcurrencyLimiter("test_unlimited", max_concurrent=0)
+
+    async def run() -> None:
+        for _ in range(5):
+            await limiter.acquire()
+
+    asyncio.run(run())
+
+    assert limiter.stats()["in_use"] == 0
+
+
+def test_chat_endpoint_sheds_load_with_retry_after(client):
+    limiter = ConcurrencyLimiter("test_endpoint", max_concurrent=1, max_queue=0)
+    asyncio.run(limiter.acquire())
+    app.dependency_overrides[get_chat_admission] = lambda: limiter
+
+    response = client.post(
+        "/api/v1/chat/",
+        json={"messages": [{"role": "user", "content": "有給休暇は？"}]},
+    )
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["type"] == "OverloadedError"
+    assert client.get("/api/v1/stats/admission").status_code == 200
+
+
+def test_overload_after_stream_start_is_sent_as_error_event():
+    # 上流のチャットの枠がすべて使用中で、待ち行列もない
+    chat = ConcurrencyLimiter("test_stream_chat", max_concurrent=1, max_queue=0)
+    asyncio.run(chat.acquire())
+    limits = UpstreamLimits(
+        chat,
+        ConcurrencyLimiter("test_stream_embedding", max_concurrent=0),
+        ConcurrencyLimiter("test_stream_search", max_concurrent=0),
+    )
+    openai_client = AsyncMock()
+    openai_client.embeddings.create.return_value = MagicMock(
+        data=[MagicMock(embedding=[1.0, 0.0])], usage=None
+    )
+    search_repository = AsyncMock()
+    search_repository.hybrid_search.return_value = []
+    service = ChatService(
+        openai_client, search_repository, AsyncMock(), upstream_limits=limits
+    )
+    request = ChatRequest(
+        conversation_id="c1", messages=[MessageBase(role="user", content="有給休暇は？")]
+    )
+
+    async def run() -> list[str]:
+        return [event async for event in service.process_chat(request)]
+
+    events = asyncio.run(run())
+
+    assert len(events) == 1
+    event = json.loads(events[0].removeprefix("data: "))
+    assert event["type"] == "error"
+    assert event["retry_after"] >= 1
+    openai_client.chat.completions.create.assert_not_awaited()
@@ -0,0 +1,58 @@
+import os
+from caches.answer_cache import AnswerCache, touch_index_version
+
+
+def test_lookup_returns_similar_answer():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.store("有給休暇の日数", [1.0, 0.0, 0.0], ["10日", "です。"])
+
+    hit = cache.lookup([0.99, 0.05, 0.0])
+    miss = cache.lookup([0.0, 1.0, 0.0])
+
+    assert hit is not None
+    assert hit.chunks == ["10日", "です。"]
+    assert miss is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_size=1)
+    cache.store("a", [1.0, 0.0], ["a"])
+    cache.store("b", [0.0, 1.0], ["b"])
+
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidated_when_index_version_changes(tmp_path):
+    version_path = str(tmp_path / ".index_version")
+    touch_index_version(version_path)
+    cache = AnswerCache(index_version_path=version_path)
+    cache.store("a", [1.0, 0.0], ["a"])
+
+    # インデックス再登録（更新時刻を確実に進める）
+    touch_index_version(version_path)
+    stat = os.stat(version_path)
+    os.utime(version_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_similar_but_distinct_questions_do_not_collide():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.store("正社員の有給休暇の日数", [1.0, 0.0, 0.0], ["10日です。"])
+
+    # Embeddingはほぼ同じでも、質問の文字列が異なれば別の質問として扱う
+    assert cache.lookup([0.99, 0.05, 0.0], "パートタイマーの有給休暇の付与条件") is None
+    # 表記揺れ程度の違いであれば再利用する
+    assert cache.lookup([0.99, 0.05, 0.0], "正社員の有給休暇の日数は？") is not None
+
+
+def test_same_question_in_different_context_does_not_collide():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.store("申請期限は？", [1.0, 0.0], ["3日前までです。"], context_key="paid_leave")
+
+    assert cache.lookup([1.0, 0.0], "申請期限は？", context_key="expenses") is None
+    assert cache.lookup([1.0, 0.0], "申請期限は？", context_key="paid_leave") is not None
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import to_async_url
+from models import Message
+from repositories.async_conversation_repository import AsyncConversationRepository
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"),
+    [
+        ("sqlite:///./app.db", "sqlite+aiosqlite:///./app.db"),
+        ("sqlite+pysqlite:////tmp/app.db", "sqlite+aiosqlite:////tmp/app.db"),
+        ("postgresql://user:pw@db:5432/rag", "postgresql+asyncpg://user:pw@db:5432/rag"),
+        ("postgresql+psycopg2://user:pw@db/rag", "postgresql+asyncpg://user:pw@db/rag"),
+        ("postgres://user:pw@db/rag", "postgresql+asyncpg://user:pw@db/rag"),
+        ("mysql://user:pw@db/rag", "mysql://user:pw@db/rag"),
+    ],
+)
+def test_to_async_url(url, expected):
+    assert to_async_url(url) == expected
+
+
+def test_conversation_crud(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            repo = AsyncConversationRepository(session)
+            first = await repo.create_conversation()
+            second = await repo.create_conversation()
+            await repo.add_message(first.id, "user", "質問")
+            await repo.add_message(first.id, "assistant", "途中まで", truncated=True)
+            await repo.add_message(second.id, "user", "別の質問")
+            await repo.update_conversation_title(first.id, "タイトル")
+            await repo.update_conversation_summary(first.id, "要約", 2)
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            repo = AsyncConversationRepository(session)
+            conversation = await repo.get_conversation(first.id)
+            messages = await repo.get_messages(first.id)
+            all_ids = {c.id for c in await repo.get_all_conversations()}
+            deleted = await repo.delete_conversation(first.id)
+            deleted_missing = await repo.delete_conversation("missing")
+            after_delete = await repo.get_conversation(first.id)
+            orphan_messages = (
+                await session.exec(select(Message).where(Message.conversation_id == first.id))
+            ).all()
+            title_missing = await repo.update_conversation_title("missing", "x")
+
+        await engine.dispose()
+        return (
+            first, second, conversation, messages, all_ids, deleted,
+            deleted_missing, after_delete, orphan_messages, title_missing,
+        )
+
+    (
+        first, second, conversation, messages, all_ids, deleted,
+        deleted_missing, after_delete, orphan_messages, title_missing,
+    ) = asyncio.run(run())
+
+    assert conversation is not None
+    assert conversation.title == "タイトル"
+    assert conversation.summary == "要約"
+    assert conversation.summarized_message_count == 2
+    assert [(m.role, m.content, m.truncated) for m in messages] == [
+        ("user", "質問", False),
+        ("assistant", "途中まで", True),
+    ]
+    assert all_ids == {first.id, second.id}
+    assert deleted is True
+    assert deleted_missing is False
+    assert after_delete is None
+    assert orphan_messages == []
+    assert title_missing is None
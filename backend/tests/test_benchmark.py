@@ -0,0 +1,123 @@
+import base64
+import json
+import subprocess
+import sys
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from benchmarks.chat_benchmark import BACKEND_DIR, histogram_quantile, parse_metrics, stage_means, summarize
+from benchmarks.fake_upstreams import FakeUpstreamSettings, create_app
+from metrics import Histogram, MetricsRegistry
+
+NO_LATENCY = FakeUpstreamSettings(
+    chat_latency_ms=0,
+    stream_ttft_ms=0,
+    stream_tokens_per_second=0,
+    answer_tokens=3,
+    embedding_latency_ms=0,
+    embedding_dimensions=8,
+    search_latency_ms=0,
+    search_results=2,
+)
+
+
+def test_fake_stream_returns_openai_chunks_with_usage():
+    with TestClient(create_app(NO_LATENCY)) as client:
+        response = client.post(
+            "/v1/chat/completions",
+            json={
+                "model": "m",
+                "messages": [{"role": "user", "content": "質問"}],
+                "stream": True,
+                "stream_options": {"include_usage": True},
+            },
+        )
+
+    events = [line[len("data: "):] for line in response.text.split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    content = "".join(
+        chunk["choices"][0]["delta"].get("content", "") for chunk in chunks if chunk["choices"]
+    )
+    assert content == "年次有給休暇"
+    assert chunks[-1]["usage"]["completion_tokens"] == 3
+
+
+def test_fake_embedding_is_deterministic_and_supports_base64():
+    with TestClient(create_app(NO_LATENCY)) as client:
+        floats = client.post("/v1/embeddings", json={"model": "m", "input": "有給"}).json()
+        encoded = client.post(
+            "/v1/embeddings", json={"model": "m", "input": ["有給"], "encoding_format": "base64"}
+        ).json()
+
+    decoded = np.frombuffer(base64.b64decode(encoded["data"][0]["embedding"]), dtype=np.float32)
+    assert np.allclose(decoded, floats["data"][0]["embedding"])
+    assert len(decoded) == 8
+
+
+def test_fake_search_returns_top_documents():
+    with TestClient(create_app(NO_LATENCY)) as client:
+        response = client.post(
+            "/indexes('idx')/docs/search.post.search?api-version=2024-07-01", json={"top": 2}
+        )
+
+    results = response.json()["value"]
+    assert len(results) == 2
+    assert results[0]["@search.rerankerScore"] > results[1]["@search.rerankerScore"]
+
+
+def test_summarize_uses_nearest_rank_percentiles():
+    summary = summarize([float(i) for i in range(1, 101)])
+
+    assert summary["p50"] == 50.0
+    assert summary["p95"] == 95.0
+    assert summary["p99"] == 99.0
+    assert summary["max"] == 100.0
+    assert summarize([]) == {"count": 0}
+
+
+def test_quantiles_and_stage_means_from_metrics_deltas():
+    registry = MetricsRegistry()
+    lag = registry.register(Histogram("lag_seconds", "Test.", buckets=(0.01, 0.1)))
+    stages = registry.register(Histogram("rag_stage_duration_seconds", "Test.", ("stage",)))
+    lag.observe(0.5)
+    before = parse_metrics(registry.render())
+
+    for _ in range(4):
+        lag.observe(0.005)
+    stages.observe(0.2, stage="search")
+    stages.observe(0.4, stage="search")
+    after = parse_metrics(registry.render())
+
+    # 計測前の観測値（0.5秒）は差分に含まれない
+    assert histogram_quantile(before, after, "lag_seconds", 0.5) == 0.005
+    assert stage_means(before, after) == {"search": {"count": 2, "mean": pytest.approx(0.3)}}
+
+
+def test_benchmark_smoke_run_against_fake_upstreams(tmp_path):
+    output = tmp_path / "result.json"
+    fake_args = [
+        "--fake-arg=--chat-latency-ms=0",
+        "--fake-arg=--stream-ttft-ms=0",
+        "--fake-arg=--stream-tokens-per-second=0",
+        "--fake-arg=--answer-tokens=3",
+        "--fake-arg=--embedding-latency-ms=0",
+        "--fake-arg=--search-latency-ms=0",
+    ]
+    completed = subprocess.run(
+        [
+            sys.executable, "-m", "benchmarks.chat_benchmark",
+            "--concurrency", "2", "--requests", "4", "--warmup", "0",
+            "--max-error-rate", "0", "--output", str(output), *fake_args,
+        ],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    results = json.loads(output.read_text(encoding="utf-8"))["results"]
+    assert results["succeeded"] == 4
+    assert results["errors"] == {}
+    assert results["ttft"]["count"] == 4
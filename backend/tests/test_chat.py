@@ -1,6 +1,5 @@
 from dataclasses import dataclass
 from unittest.mock import MagicMock
-import pytest
 
 
 @dataclass
@@ -149,9 +148,10 @@ def test_chat_openai_error(client, mock_openai_client, mock_search_client):
     ]
 
     # 3. テスト実行と検証
-    # 「RuntimeError が起きるはずだ」ということをテストします
-    with pytest.raises(RuntimeError):
-        client.post(
-            "/api/v1/chat",
-            json={"messages": [{"role": "user", "content": "こんにちは"}]},
-        )
+    # ストリーム開始後のエラーは、ステータスコードの代わりにエラーイベントで通知されます
+    response = client.post(
+        "/api/v1/chat",
+        json={"messages": [{"role": "user", "content": "こんにちは"}]},
+    )
+    assert response.status_code == 200
+    assert '"type": "error"' in response.text
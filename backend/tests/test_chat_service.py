@@ -0,0 +1,219 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock
+from metrics import cancelled_streams_total
+from models import ChatRequest, MessageBase
+from services.chat_service import ChatService
+from sse import cancel_on_disconnect, message_event
+from exceptions import SearchError
+import config
+
+
+class _Chunk:
+    def __init__(self, content: str):
+        self.choices = [MagicMock(delta=MagicMock(content=content))]
+        self.usage = None
+
+
+class _SlowStream:
+    """最初のトークンの後、応答が止まる上流のストリーム"""
+
+    def __init__(self):
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        yield _Chunk("途中まで")
+        await asyncio.sleep(10)
+        yield _Chunk("の回答")
+
+    async def close(self):
+        self.closed = True
+
+
+def test_disconnect_cancels_upstream_and_saves_truncated_response():
+    upstream = _SlowStream()
+    rewritten = MagicMock(choices=[MagicMock(message=MagicMock(content="有給休暇"))])
+
+    async def create(stream: bool = False, **kwargs):
+        return upstream if stream else rewritten
+
+    openai_client = AsyncMock()
+    openai_client.chat.completions.create.side_effect = create
+    openai_client.embeddings.create.return_value = MagicMock(
+        data=[MagicMock(embedding=[1.0, 0.0])], usage=None
+    )
+    search_repository = AsyncMock()
+    search_repository.hybrid_search.return_value = [
+        {"source": "a.pdf", "page": 1, "category": "c", "content": "本文"}
+    ]
+    conversation_repository = AsyncMock()
+    service = ChatService(openai_client, search_repository, conversation_repository)
+
+    async def receive() -> dict:
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    request = ChatRequest(
+        conversation_id="c1",
+        messages=[
+            MessageBase(role="user", content="前の質問"),
+            MessageBase(role="assistant", content="前の回答"),
+            MessageBase(role="user", content="有給休暇は？"),
+        ],
+    )
+    before = cancelled_streams_total.value()
+
+    async def run() -> list[str]:
+        return [e async for e in cancel_on_disconnect(service.process_chat(request), receive)]
+
+    events = asyncio.run(asyncio.wait_for(run(), timeout=2))
+
+    assert len(events) == 1
+    assert upstream.closed
+    assert cancelled_streams_total.value() == before + 1
+    conversation_repository.add_message.assert_any_call(
+        "c1", "assistant", "途中まで", truncated=True
+    )
+
+
+def _speculative_service(rewritten: str, search_side_effect=None):
+    rewrite_response = MagicMock(choices=[MagicMock(message=MagicMock(content=rewritten))])
+
+    async def create(stream: bool = False, **kwargs):
+        if stream:
+            return _AnswerStream()
+        # 投機的検索が先に始まるよう、書き換えには時間がかかる
+        await asyncio.sleep(0.01)
+        return rewrite_response
+
+    openai_client = AsyncMock()
+    openai_client.chat.completions.create.side_effect = create
+    openai_client.embeddings.create.return_value = MagicMock(
+        data=[MagicMock(embedding=[1.0, 0.0])], usage=None
+    )
+    search_repository = AsyncMock()
+    search_repository.hybrid_search.return_value = [
+        {"id": "a", "source": "a.pdf", "page": 1, "category": "c", "content": "本文"}
+    ]
+    if search_side_effect is not None:
+        search_repository.hybrid_search.side_effect = search_side_effect
+    return ChatService(openai_client, search_repository, AsyncMock())
+
+
+class _AnswerStream:
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        yield _Chunk("回答")
+
+
+def _run_chat(service: ChatService) -> list[str]:
+    request = ChatRequest(
+        conversation_id="c1",
+        messages=[
+            MessageBase(role="user", content="前の質問"),
+            MessageBase(role="assistant", content="前の回答"),
+            MessageBase(role="user", content="有給休暇は？"),
+        ],
+    )
+
+    async def run() -> list[str]:
+        return [event async for event in service.process_chat(request)]
+
+    return asyncio.run(run())
+
+
+def test_is_equivalent_query_ignores_width_spaces_and_punctuation():
+    assert ChatService._is_equivalent_query("有給休暇は？", "有給休暇は?")
+    assert ChatService._is_equivalent_query("ＰＣの貸与", "PC の 貸与。")
+    assert not ChatService._is_equivalent_query("有給休暇は？", "有給休暇 付与日数")
+
+
+def test_speculative_search_is_used_when_rewrite_is_equivalent(monkeypatch):
+    monkeypatch.setattr(config, "SPECULATIVE_SEARCH_ENABLED", True)
+    service = _speculative_service("有給休暇は?")
+
+    events = _run_chat(service)
+
+    assert events == [message_event("回答")]
+    assert service.openai_client.embeddings.create.await_count == 1
+    search = service.search_repository.hybrid_search
+    assert search.await_count == 1
+    assert search.await_args.kwargs["text_query"] == "有給休暇は？"
+
+
+def test_speculative_search_is_discarded_when_rewrite_differs(monkeypatch):
+    monkeypatch.setattr(config, "SPECULATIVE_SEARCH_ENABLED", True)
+    service = _speculative_service("有給休暇 付与日数 パート")
+
+    events = _run_chat(service)
+
+    assert events == [message_event("回答")]
+    embeddings = service.openai_client.embeddings.create
+    assert embeddings.await_args.kwargs["input"] == "有給休暇 付与日数 パート"
+    assert service.search_repository.hybrid_search.await_args.kwargs["text_query"] == (
+        "有給休暇 付与日数 パート"
+    )
+
+
+def test_speculative_search_failure_falls_back_to_normal_path(monkeypatch):
+    monkeypatch.setattr(config, "SPECULATIVE_SEARCH_ENABLED", True)
+    results = [{"id": "a", "source": "a.pdf", "page": 1, "category": "c", "content": "本文"}]
+    service = _speculative_service(
+        "有給休暇は?", search_side_effect=[SearchError("一時的なエラー"), results]
+    )
+
+    events = _run_chat(service)
+
+    assert events == [message_event("回答")]
+    assert service.search_repository.hybrid_search.await_count == 2
+
+
+class _BrokenStream:
+    """最初のトークンの後、上流の接続が切れるストリーム"""
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        yield _Chunk("途中まで")
+        raise ConnectionError("connection reset")
+
+
+def test_search_error_after_stream_start_is_sent_as_error_event(monkeypatch):
+    monkeypatch.setattr(config, "SPECULATIVE_SEARCH_ENABLED", False)
+    service = _speculative_service("有給休暇", search_side_effect=SearchError("検索失敗"))
+
+    events = _run_chat(service)
+
+    assert len(events) == 1
+    event = json.loads(events[0].removeprefix("data: "))
+    assert event == {
+        "type": "error",
+        "message": "検索中にエラーが発生しました。しばらくしてから再度お試しください。",
+    }
+
+
+def test_upstream_error_mid_stream_sends_error_event_and_saves_truncated_response(
+    monkeypatch,
+):
+    monkeypatch.setattr(config, "SPECULATIVE_SEARCH_ENABLED", False)
+    service = _speculative_service("有給休暇")
+    rewritten = MagicMock(choices=[MagicMock(message=MagicMock(content="有給休暇"))])
+
+    async def create(stream: bool = False, **kwargs):
+        return _BrokenStream() if stream else rewritten
+
+    service.openai_client.chat.completions.create.side_effect = create
+
+    events = _run_chat(service)
+
+    assert events[0] == message_event("途中まで")
+    assert json.loads(events[1].removeprefix("data: "))["type"] == "error"
+    service.conversation_repository.add_message.assert_any_call(
+        "c1", "assistant", "途中まで", truncated=True
+    )
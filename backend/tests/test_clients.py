@@ -0,0 +1,124 @@
+import asyncio
+import socket
+import threading
+import time
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+from benchmarks.fake_upstreams import FakeUpstreamSettings, create_app
+from clients import UpstreamClients
+from main import app
+import config
+
+
+# 上流APIスタブを別スレッドで起動し、そのURLを返す
+@pytest.fixture
+def fake_upstream_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    settings = FakeUpstreamSettings(
+        chat_latency_ms=0,
+        stream_ttft_ms=0,
+        stream_tokens_per_second=0,
+        answer_tokens=3,
+        embedding_latency_ms=0,
+        embedding_dimensions=8,
+        search_latency_ms=0,
+        search_results=2,
+    )
+    server = uvicorn.Server(
+        uvicorn.Config(create_app(settings), host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "上流APIスタブが起動しませんでした"
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=10)
+
+
+def test_create_and_close_clients():
+    async def run() -> tuple[dict, dict]:
+        clients = UpstreamClients.create()
+        opened = clients.stats()
+        await clients.aclose()
+        return opened, clients.stats()
+
+    opened, closed = asyncio.run(run())
+
+    assert opened["openai"]["closed"] is False
+    assert opened["openai"]["connections"] == 0
+    assert opened["search"]["closed"] is False
+    assert opened["search"]["connections"] == 0
+    assert closed["openai"]["closed"] is True
+    assert closed["search"]["closed"] is True
+
+
+def test_pool_stats_tolerate_missing_internals():
+    async def run() -> dict:
+        clients = UpstreamClients.create()
+        transport = clients.http_client._transport
+        connector = clients.search_session.connector
+        acquired = connector._acquired  # type: ignore[union-attr]
+        try:
+            # ライブラリの内部構造が変わった場合を再現
+            clients.http_client._transport = object()  # type: ignore[assignment]
+            del connector._acquired  # type: ignore[union-attr]
+            return clients.stats()
+        finally:
+            clients.http_client._transport = transport
+            connector._acquired = acquired  # type: ignore[union-attr]
+            await clients.aclose()
+
+    stats = asyncio.run(run())
+
+    assert stats["openai"]["connections"] is None
+    assert stats["search"]["active"] is None
+    assert stats["search"]["max_connections"] > 0
+
+
+def test_lifespan_creates_and_closes_clients():
+    with TestClient(app) as client:
+        clients = app.state.upstream_clients
+        assert isinstance(clients, UpstreamClients)
+        assert client.get("/api/v1/stats/pool").json()["openai"]["closed"] is False
+
+    assert clients.http_client.is_closed
+    assert clients.search_session.closed
+
+
+def test_clients_send_real_requests_through_pools(fake_upstream_url, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{fake_upstream_url}/v1")
+    monkeypatch.setattr(config, "AZURE_SEARCH_ENDPOINT", fake_upstream_url)
+
+    async def run() -> tuple[list[float], str | None, list[dict], dict]:
+        clients = UpstreamClients.create()
+        try:
+            embedding = await clients.openai_client.embeddings.create(
+                model="text-embedding-3-small", input="有給休暇"
+            )
+            completion = await clients.openai_client.chat.completions.create(
+                model="gpt-4o-mini", messages=[{"role": "user", "content": "有給休暇は？"}]
+            )
+            results = await clients.search_client.search(search_text="有給休暇", top=2)
+            documents = [document async for document in results]
+            return (
+                embedding.data[0].embedding,
+                completion.choices[0].message.content,
+                documents,
+                clients.stats(),
+            )
+        finally:
+            await clients.aclose()
+
+    embedding, answer, documents, stats = asyncio.run(run())
+
+    assert len(embedding) == 8
+    assert answer
+    assert len(documents) == 2
+    # 使い終えた接続はプールに戻り、再利用できる状態で残る
+    assert stats["openai"]["connections"] >= 1
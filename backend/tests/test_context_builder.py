@@ -0,0 +1,47 @@
+from services.context_builder import ContextBuilder
+
+
+def _result(id: str, content: str, score: float) -> dict:
+    return {
+        "id": id,
+        "source": "就業規則.pdf",
+        "page": 1,
+        "category": "テスト",
+        "content": content,
+        "@search.score": score,
+    }
+
+
+def test_orders_by_score_and_deduplicates():
+    builder = ContextBuilder(token_budget=1000)
+    context = builder.build(
+        [
+            _result("a", "第1条 本規則は従業員の就業条件を定める。", 0.5),
+            _result("b", "第5条 所定労働時間は1日8時間とする。", 0.9),
+            _result("c", "第5条 所定労働時間は1日8時間とする。", 0.8),
+        ]
+    )
+
+    assert context.index("第5条") < context.index("第1条")
+    assert context.count("第5条") == 1
+    assert builder.stats()["deduplicated"] == 1
+
+
+def test_truncates_at_sentence_boundary_within_budget():
+    builder = ContextBuilder(token_budget=80, min_truncated_tokens=10)
+    content = "一文目です。" * 5 + "二文目です。" * 20
+    context = builder.build([_result("a", content, 1.0)])
+
+    assert context.strip().endswith("。")
+    assert len(context) < len(content)
+    assert builder.stats()["truncated"] == 1
+
+
+def test_token_count_is_cached_per_document():
+    builder = ContextBuilder()
+    results = [_result("a", "第1条 本規則は従業員の就業条件を定める。", 1.0)]
+    builder.build(results)
+    builder.build(results)
+
+    assert builder.stats()["token_cache_misses"] == 1
+    assert builder.stats()["token_cache_hits"] == 1
@@ -0,0 +1,101 @@
+import asyncio
+from caches import embedding_cache
+from caches.embedding_cache import EmbeddingCache
+
+
+def test_get_or_create_uses_memory_cache():
+    cache = EmbeddingCache(max_size=10)
+    calls = []
+
+    async def factory(text):
+        calls.append(text)
+        return [0.1, 0.2]
+
+    async def run():
+        first = await cache.get_or_create("model", "有給休暇の日数", factory)
+        # 全角スペースや前後の空白は正規化されて同じキーになる
+        second = await cache.get_or_create("model", "  有給休暇の日数　", factory)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first == second == [0.1, 0.2]
+    assert len(calls) == 1
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_key_includes_model():
+    assert EmbeddingCache.make_key("a", "text") != EmbeddingCache.make_key("b", "text")
+
+
+def test_lru_eviction():
+    cache = EmbeddingCache(max_size=2)
+
+    async def run():
+        await cache.set("model", "a", [1.0])
+        await cache.set("model", "b", [2.0])
+        await cache.get("model", "a")
+        await cache.set("model", "c", [3.0])
+        return await cache.get("model", "a"), await cache.get("model", "b")
+
+    a, b = asyncio.run(run())
+
+    assert a == [1.0]
+    assert b is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    db_path = str(tmp_path / "embeddings.db")
+
+    async def run():
+        writer = EmbeddingCache(db_path=db_path)
+        await writer.set("model", "text", [0.5, -0.25])
+        writer.close()
+
+        reader = EmbeddingCache(db_path=db_path)
+        result = await reader.get("model", "text")
+        stats = reader.stats()
+        reader.close()
+        return result, stats
+
+    result, stats = asyncio.run(run())
+
+    assert result == [0.5, -0.25]
+    assert stats["disk_hits"] == 1
+
+
+def test_disk_tier_prunes_expired_and_oldest_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "PRUNE_INTERVAL", 3)
+    db_path = str(tmp_path / "embeddings.db")
+
+    async def run():
+        cache = EmbeddingCache(ttl_seconds=60, db_path=db_path, db_max_rows=2)
+        # 期限切れの行
+        monkeypatch.setattr(embedding_cache.time, "time", lambda: 1000.0)
+        await cache.set("model", "old", [0.0])
+        monkeypatch.setattr(embedding_cache.time, "time", lambda: 2000.0)
+        await cache.set("model", "a", [1.0])
+        monkeypatch.setattr(embedding_cache.time, "time", lambda: 2001.0)
+        await cache.set("model", "b", [2.0])
+        after_prune = cache.stats()
+        # 上限を超えた分は古いものから削除（次の削除は3回書き込んだ後）
+        for i, text in enumerate(["c", "d", "e"]):
+            monkeypatch.setattr(embedding_cache.time, "time", lambda i=i: 2002.0 + i)
+            await cache.set("model", text, [3.0])
+        stats = cache.stats()
+        cache.close()
+
+        reader = EmbeddingCache(ttl_seconds=60, db_path=db_path)
+        remaining = [await reader.get("model", t) is not None for t in "abcde"]
+        reader.close()
+        return after_prune, stats, remaining
+
+    after_prune, stats, remaining = asyncio.run(run())
+
+    assert after_prune["disk_size"] == 2
+    assert after_prune["disk_evictions"] == 1
+    assert stats["disk_size"] == 2
+    assert stats["disk_evictions"] == 4
+    assert remaining == [False, False, False, True, True]
@@ -0,0 +1,141 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy.ext.asyncio import create_async_engine
+from admission import ConcurrencyLimiter, UpstreamLimits
+from metrics import tokens_total, upstream_duration
+from models import Conversation, Message, MessageBase
+from services.history_service import HistoryService
+
+
+def _service(token_budget: int, summary_enabled: bool = True) -> HistoryService:
+    return HistoryService(
+        create_async_engine("sqlite+aiosqlite://"),
+        token_budget=token_budget,
+        summary_enabled=summary_enabled,
+    )
+
+
+def _stored(conversation: Conversation, *contents: str) -> list[Message]:
+    roles = ["user", "assistant"]
+    return [
+        Message(conversation_id=conversation.id, role=roles[i % 2], content=c)
+        for i, c in enumerate(contents)
+    ]
+
+
+def test_pack_keeps_newest_messages_within_budget():
+    conversation = Conversation()
+    stored = _stored(conversation, "あ" * 20, "い" * 20, "う" * 20, "え" * 20)
+    new_message = MessageBase(role="user", content="お" * 10)
+
+    # 新しいメッセージ(10+4) と直近2件(24+24) が収まる予算（要約なし）
+    history, overflow, summarized_count = _service(70, summary_enabled=False).pack(
+        conversation, stored, new_message
+    )
+
+    assert [m.content for m in history] == ["う" * 20, "え" * 20]
+    assert [m.content for m in overflow] == ["あ" * 20, "い" * 20]
+    assert summarized_count == 2
+
+
+def test_pack_keeps_overflow_until_summary_covers_it():
+    conversation = Conversation()
+    stored = _stored(conversation, "あ" * 20, "い" * 20, "う" * 20, "え" * 20)
+    new_message = MessageBase(role="user", content="お" * 10)
+
+    # 初めてあふれたターンでは、要約がまだないため古いメッセージも履歴に残す
+    history, overflow, summarized_count = _service(70).pack(
+        conversation, stored, new_message
+    )
+
+    assert [m.content for m in history] == ["あ" * 20, "い" * 20, "う" * 20, "え" * 20]
+    assert [m.content for m in overflow] == ["あ" * 20, "い" * 20]
+    assert summarized_count == 2
+
+    # 要約が反映された後は、要約済みのメッセージを要約に置き換える
+    conversation.summary = "古い会話の要約"
+    conversation.summarized_message_count = summarized_count
+    history, overflow, _ = _service(100).pack(conversation, stored, new_message)
+
+    assert history[0].role == "system" and "古い会話の要約" in history[0].content
+    assert [m.content for m in history[1:]] == ["う" * 20, "え" * 20]
+    assert overflow == []
+
+
+def test_pack_limits_unsummarized_overflow_to_budget():
+    conversation = Conversation()
+    stored = _stored(conversation, "あ" * 20, "い" * 20, "う" * 20, "え" * 20, "か" * 20)
+    new_message = MessageBase(role="user", content="お" * 10)
+
+    # 直近2件が予算内、あふれた3件のうち予算(70)に収まる新しい2件だけを残す
+    history, overflow, _ = _service(70).pack(conversation, stored, new_message)
+
+    assert [m.content for m in history] == ["い" * 20, "う" * 20, "え" * 20, "か" * 20]
+    assert [m.content for m in overflow] == ["あ" * 20, "い" * 20, "う" * 20]
+
+
+def test_pack_prepends_summary_and_skips_summarized_messages():
+    conversation = Conversation(summary="有給休暇の話", summarized_message_count=2)
+    stored = _stored(conversation, "古い質問", "古い回答", "質問", "回答")
+    new_message = MessageBase(role="user", content="次の質問")
+
+    history, overflow, summarized_count = _service(1000).pack(
+        conversation, stored, new_message
+    )
+
+    assert history[0].role == "system" and "有給休暇の話" in history[0].content
+    assert [m.content for m in history[1:]] == ["質問", "回答"]
+    assert overflow == []
+    assert summarized_count == 2
+
+
+def test_summary_waits_for_upstream_chat_slot():
+    chat = ConcurrencyLimiter("test_summary_chat", max_concurrent=1, max_queue=1)
+    limits = UpstreamLimits(
+        chat,
+        ConcurrencyLimiter("test_summary_embedding", max_concurrent=0),
+        ConcurrencyLimiter("test_summary_search", max_concurrent=0),
+    )
+    service = HistoryService(
+        create_async_engine("sqlite+aiosqlite://"), upstream_limits=limits
+    )
+    openai_client = AsyncMock()
+    openai_client.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content="要約"))], usage=None
+    )
+    conversation = Conversation()
+
+    async def run() -> str:
+        # チャットの枠がすべて使用中の間は、要約のLLM呼び出しも待つ
+        await chat.acquire()
+        task = asyncio.create_task(
+            service._summarize(openai_client, None, _stored(conversation, "質問", "回答"))
+        )
+        await asyncio.sleep(0.01)
+        assert chat.stats()["queue_depth"] == 1
+        openai_client.chat.completions.create.assert_not_awaited()
+        chat.release()
+        return await task
+
+    assert asyncio.run(run()) == "要約"
+    assert chat.stats()["in_use"] == 0
+
+
+def test_summary_records_upstream_latency_and_token_usage():
+    service = HistoryService(create_async_engine("sqlite+aiosqlite://"))
+    openai_client = AsyncMock()
+    openai_client.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content="要約"))],
+        usage=MagicMock(prompt_tokens=120, completion_tokens=30),
+    )
+    prompt_before = tokens_total.value(operation="summary", kind="prompt")
+    completion_before = tokens_total.value(operation="summary", kind="completion")
+    calls_before = upstream_duration.count(upstream="openai_chat", outcome="success")
+
+    asyncio.run(
+        service._summarize(openai_client, None, _stored(Conversation(), "質問", "回答"))
+    )
+
+    assert tokens_total.value(operation="summary", kind="prompt") == prompt_before + 120
+    assert tokens_total.value(operation="summary", kind="completion") == completion_before + 30
+    assert upstream_duration.count(upstream="openai_chat", outcome="success") == calls_before + 1
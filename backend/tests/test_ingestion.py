@@ -0,0 +1,308 @@
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+from azure.search.documents.indexes.models import SearchFieldDataType, SearchIndex, SimpleField
+from ingestion.checkpoint import Checkpoint
+from ingestion import chunker
+from ingestion.chunker import Chunker, split_document, split_text
+from ingestion.manifest import Manifest, content_hash
+from ingestion.pipeline import IngestionPipeline
+from ingestion.reader import iter_json_array
+from ingestion.sinks import ensure_chunk_fields
+from repositories.search_repository import group_by_parent
+
+DOCUMENTS = [
+    {"id": f"doc_{i}", "page": i, "category": "c", "source": "s", "content": f"第{i}条 内容"}
+    for i in range(10)
+]
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class FakeEmbeddings:
+    def __init__(self, fail_times: int = 0, error: Exception | None = None):
+        self.calls = 0
+        self.fail_times = fail_times
+        self.error = error or RateLimited("rate limited")
+
+    async def create(self, model, input):
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise self.error
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=[float(i)]) for i in range(len(input))],
+            usage=SimpleNamespace(total_tokens=len(input) * 5),
+        )
+
+
+class MemorySink:
+    def __init__(self):
+        self.batches: list[list[dict]] = []
+
+    async def upload(self, documents):
+        self.batches.append(list(documents))
+        return []
+
+    async def delete(self, document_ids):
+        self.deleted = list(document_ids)
+        return []
+
+
+def _pipeline(embeddings, sink, checkpoint):
+    client = SimpleNamespace(embeddings=embeddings)
+    return IngestionPipeline(
+        client,  # type: ignore[arg-type]
+        [sink],
+        checkpoint,
+        embedding_model="model",
+        embed_batch_size=3,
+        concurrency=2,
+        upload_batch_size=4,
+    )
+
+
+def test_iter_json_array_reads_across_chunks():
+    text = json.dumps(DOCUMENTS, ensure_ascii=False, indent=2)
+    documents = list(iter_json_array(io.StringIO(text), chunk_size=7))
+    assert documents == DOCUMENTS
+
+
+def test_pipeline_batches_retries_and_checkpoints(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    embeddings = FakeEmbeddings(fail_times=1)
+    sink = MemorySink()
+
+    stats = asyncio.run(
+        _pipeline(embeddings, sink, checkpoint).run([dict(d) for d in DOCUMENTS])
+    )
+
+    assert stats.uploaded == 10
+    assert stats.retries == 1
+    assert stats.embedding_requests == 4
+    assert all(len(batch) <= 4 for batch in sink.batches)
+    assert all("embedding" in d for batch in sink.batches for d in batch)
+    assert len(Checkpoint(str(tmp_path / "checkpoint")).completed) == 10
+
+
+def test_pipeline_does_not_retry_non_transient_errors(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    embeddings = FakeEmbeddings(fail_times=1, error=BadRequest("invalid input"))
+    sink = MemorySink()
+
+    stats = asyncio.run(
+        _pipeline(embeddings, sink, checkpoint).run([dict(d) for d in DOCUMENTS])
+    )
+
+    # 400 は再試行せず、そのバッチだけ失敗として記録する
+    assert stats.retries == 0
+    assert len(stats.failed_ids) == 3
+    assert stats.uploaded == 7
+
+
+def test_pipeline_resumes_from_checkpoint(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    checkpoint.mark_completed([d["id"] for d in DOCUMENTS[:6]])
+    sink = MemorySink()
+
+    stats = asyncio.run(
+        _pipeline(FakeEmbeddings(), sink, checkpoint).run([dict(d) for d in DOCUMENTS])
+    )
+
+    assert stats.skipped == 6
+    assert stats.uploaded == 4
+    assert sorted(d["id"] for batch in sink.batches for d in batch) == [
+        d["id"] for d in DOCUMENTS[6:]
+    ]
+
+
+def test_pipeline_reuploads_documents_edited_after_interruption(tmp_path):
+    path = str(tmp_path / "checkpoint")
+    asyncio.run(
+        _pipeline(FakeEmbeddings(), MemorySink(), Checkpoint(path)).run(
+            [dict(d) for d in DOCUMENTS[:6]]
+        )
+    )
+
+    # 中断後に内容が変わったドキュメントは、登録済みでも読み飛ばさない
+    edited = [dict(d) for d in DOCUMENTS]
+    edited[0]["content"] = "第0条 改定後の内容"
+    digest = content_hash(edited[0])
+    sink = MemorySink()
+    stats = asyncio.run(_pipeline(FakeEmbeddings(), sink, Checkpoint(path)).run(edited))
+
+    assert stats.skipped == 5
+    assert sorted(d["id"] for batch in sink.batches for d in batch) == sorted(
+        d["id"] for d in [DOCUMENTS[0], *DOCUMENTS[6:]]
+    )
+    assert Checkpoint(path).is_completed("doc_0", digest)
+
+
+def test_manifest_plans_added_changed_and_deleted(tmp_path):
+    path = str(tmp_path / "manifest")
+    manifest = Manifest(path)
+    manifest.record_uploaded(
+        [{"id": d["id"], "hash": content_hash(d), "model": "model"} for d in DOCUMENTS[:3]]
+    )
+
+    source = [dict(d) for d in DOCUMENTS[1:4]]
+    source[0]["content"] = "改定後の内容"
+    plan = Manifest(path).plan({d["id"]: content_hash(d) for d in source}, "model")
+
+    assert plan.added == ["doc_3"]
+    assert plan.changed == ["doc_1"]
+    assert plan.deleted == ["doc_0"]
+    assert plan.unchanged == 1
+
+    # Embeddingモデルやチャンク分割設定が変わった場合はすべて再登録の対象になる
+    hashes = {d["id"]: content_hash(d) for d in DOCUMENTS[:3]}
+    assert manifest.plan(hashes, "new-model").changed == ["doc_0", "doc_1", "doc_2"]
+    assert manifest.plan(hashes, "model", "400:50").changed == ["doc_0", "doc_1", "doc_2"]
+
+
+def test_manifest_records_deletions_and_compacts(tmp_path):
+    path = str(tmp_path / "manifest")
+    manifest = Manifest(path)
+    manifest.record_uploaded(
+        [{"id": "a", "hash": "1", "model": "m"}, {"id": "b", "hash": "2", "model": "m"}]
+    )
+    manifest.record_uploaded([{"id": "a", "hash": "3", "model": "m", "chunks": ["a__000"]}])
+    manifest.record_deleted(["b"])
+
+    # チャンク分割前のドキュメントIDは、インデックスから削除するまで削除待ちとして残す
+    assert Manifest(path).entries == {
+        "a": {"id": "a", "hash": "3", "model": "m", "chunks": ["a__000"], "stale": ["a"]}
+    }
+    assert manifest.index_ids("a") == ["a__000"]
+    assert Manifest(path).stale_ids() == ["a"]
+    manifest.clear_stale({"a"})
+    assert manifest.stale_ids() == []
+    manifest.compact()
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    assert Manifest(path).entries == manifest.entries
+
+
+def test_pipeline_reports_uploaded_batches_and_deletes(tmp_path):
+    sink = MemorySink()
+    uploaded: list[str] = []
+    pipeline = _pipeline(FakeEmbeddings(), sink, Checkpoint(str(tmp_path / "checkpoint")))
+    pipeline.on_uploaded = lambda documents: uploaded.extend(d["id"] for d in documents)
+
+    asyncio.run(pipeline.run([dict(d) for d in DOCUMENTS]))
+    deleted = asyncio.run(pipeline.delete(["old_1", "old_2"]))
+
+    assert sorted(uploaded) == sorted(d["id"] for d in DOCUMENTS)
+    assert deleted == ["old_1", "old_2"]
+    assert sink.deleted == ["old_1", "old_2"]
+
+
+LONG_CONTENT = (
+    "第1条（目的）\n本規則は、従業員の就業に関する事項を定める。本規則に定めのない事項は法令による。\n\n"
+    "第2条（適用範囲）\n本規則は、全従業員に適用する。ただし、有期雇用従業員には別途定める規定を優先する。"
+    "なお、派遣社員には適用しない。"
+)
+
+
+def test_split_text_respects_article_boundaries_and_budget(monkeypatch):
+    # tiktoken の有無に依存しないよう、1文字1トークンとして数える
+    monkeypatch.setattr(chunker, "count_tokens", len)
+    chunks = split_text(LONG_CONTENT, max_tokens=55, overlap_tokens=30)
+
+    assert all(len(chunk) <= 55 for chunk in chunks)
+    # 条の見出しは本文と同じチャンクに含まれ、条の先頭で区切られる
+    assert chunks[0].startswith("第1条（目的）\n本規則は")
+    assert chunks[1].startswith("第2条（適用範囲）\n本規則は")
+    assert "第1条" not in chunks[1]
+    # 条の途中の区切りでは、前のチャンク末尾の文を重複して含める
+    assert chunks[1].endswith("ただし、有期雇用従業員には別途定める規定を優先する。")
+    assert chunks[2] == "ただし、有期雇用従業員には別途定める規定を優先する。なお、派遣社員には適用しない。"
+
+
+def test_split_text_hard_splits_oversized_sentence(monkeypatch):
+    monkeypatch.setattr(chunker, "count_tokens", len)
+    chunks = split_text("あ" * 250, max_tokens=100, overlap_tokens=10)
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+
+
+def test_split_document_carries_parent_metadata():
+    document = {**DOCUMENTS[0], "content": LONG_CONTENT}
+    chunks = split_document(document, max_tokens=50, overlap_tokens=0)
+
+    assert [chunk["id"] for chunk in chunks[:2]] == ["doc_0__000", "doc_0__001"]
+    for index, chunk in enumerate(chunks):
+        assert chunk["parent_id"] == "doc_0"
+        assert chunk["chunk_index"] == index
+        assert (chunk["page"], chunk["category"], chunk["source"]) == (0, "c", "s")
+
+
+def test_chunker_process_pool_keeps_input_order():
+    documents = [{**d, "content": LONG_CONTENT} for d in DOCUMENTS]
+    inline = list(Chunker(50, 30).split_all(documents))
+    pooled = list(Chunker(50, 30, workers=2, batch_size=3).split_all(documents))
+    assert pooled == inline
+    assert [parent_id for parent_id, _ in pooled] == [d["id"] for d in DOCUMENTS]
+
+
+def test_chunker_split_all_async_matches_split_all():
+    documents = [{**d, "content": LONG_CONTENT} for d in DOCUMENTS]
+    expected = list(Chunker(50, 30).split_all(documents))
+
+    async def collect(chunker: Chunker) -> list:
+        return [item async for item in chunker.split_all_async(documents)]
+
+    assert asyncio.run(collect(Chunker(50, 30, batch_size=4))) == expected
+    assert asyncio.run(collect(Chunker(50, 30, workers=2, batch_size=3))) == expected
+
+
+def test_group_by_parent_merges_chunks_and_removes_overlap():
+    results = [
+        {"id": "a__001", "parent_id": "a", "chunk_index": 1, "content": "二文目。三文目。",
+         "@search.score": 0.9, "@search.reranker_score": None},
+        {"id": "b__000", "parent_id": "b", "chunk_index": 0, "content": "別の規定。",
+         "@search.score": 0.5, "@search.reranker_score": None},
+        {"id": "a__000", "parent_id": "a", "chunk_index": 0, "content": "一文目。二文目。",
+         "@search.score": 0.7, "@search.reranker_score": None},
+    ]
+    grouped = group_by_parent(results)
+
+    assert [result["id"] for result in grouped] == ["a", "b"]
+    assert grouped[0]["content"] == "一文目。二文目。三文目。"
+    assert grouped[0]["@search.score"] == 0.9
+
+
+class FakeIndexClient:
+    def __init__(self, index):
+        self.index = index
+        self.updates = 0
+
+    async def get_index(self, name):
+        return self.index
+
+    async def create_or_update_index(self, index):
+        self.updates += 1
+        self.index = index
+
+
+def test_ensure_chunk_fields_adds_missing_fields_once():
+    index = SearchIndex(
+        name="handbook",
+        fields=[SimpleField(name="id", type=SearchFieldDataType.String, key=True)],
+    )
+    client = FakeIndexClient(index)
+
+    first = asyncio.run(ensure_chunk_fields(client, "handbook"))  # type: ignore[arg-type]
+    second = asyncio.run(ensure_chunk_fields(client, "handbook"))  # type: ignore[arg-type]
+
+    assert first == ["parent_id", "chunk_index"]
+    assert second == []
+    assert client.updates == 1
+    fields = {field.name: field for field in client.index.fields}
+    assert fields["parent_id"].filterable
+    assert fields["chunk_index"].type == SearchFieldDataType.Int32
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import pytest
+from exceptions import SearchError
+from repositories.local_search_repository import (
+    LocalSearchRepository,
+    load_snapshot,
+    save_snapshot,
+    tokenize,
+)
+
+DOCUMENTS = [
+    {
+        "id": "1",
+        "category": "勤務時間",
+        "source": "就業規則.pdf",
+        "page": "3",
+        "content": "所定労働時間は1日8時間とする。",
+        "embedding": [1.0, 0.0, 0.0],
+    },
+    {
+        "id": "2",
+        "category": "休暇",
+        "source": "就業規則.pdf",
+        "page": "10",
+        "content": "年次有給休暇は入社6ヶ月後に10日付与する。",
+        "embedding": [0.0, 1.0, 0.0],
+    },
+    {
+        "id": "3",
+        "category": "休暇",
+        "source": "福利厚生.pdf",
+        "page": "2",
+        "content": "慶弔休暇として結婚時に5日付与する。",
+        "embedding": [0.0, 0.7, 0.7],
+    },
+]
+
+
+def _search(repo: LocalSearchRepository, **kwargs) -> list[dict]:
+    return asyncio.run(repo.hybrid_search(**kwargs))
+
+
+def test_tokenize_uses_bigrams_for_japanese():
+    assert tokenize("有給休暇 PTO") == ["有給", "給休", "休暇", "pto"]
+
+
+def test_hybrid_search_fuses_vector_and_bm25():
+    repo = LocalSearchRepository(DOCUMENTS)
+    results = _search(repo, vector_query=[0.0, 1.0, 0.1], top_k=2, text_query="有給休暇")
+
+    assert [r["id"] for r in results] == ["2", "3"]
+    assert "embedding" not in results[0]
+    assert results[0]["@search.score"] > results[1]["@search.score"]
+
+
+def test_filter_on_category_and_source():
+    repo = LocalSearchRepository(DOCUMENTS)
+    results = _search(
+        repo,
+        vector_query=[1.0, 0.0, 0.0],
+        top_k=5,
+        filter="category eq '休暇' and not (source eq '福利厚生.pdf')",
+    )
+    assert [r["id"] for r in results] == ["2"]
+
+    results = _search(
+        repo, vector_query=[1.0, 0.0, 0.0], top_k=5, filter="search.in(id, '1,3')"
+    )
+    assert {r["id"] for r in results} == {"1", "3"}
+
+
+def test_invalid_filter_raises_search_error():
+    repo = LocalSearchRepository(DOCUMENTS)
+    with pytest.raises(SearchError):
+        _search(repo, vector_query=[1.0, 0.0, 0.0], filter="category gt")
+
+
+def test_load_from_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    save_snapshot(path, DOCUMENTS)
+    repo = LocalSearchRepository.from_snapshot(path)
+    assert len(repo.documents) == 3
+
+
+def test_load_snapshot_applies_appended_updates_and_deletions(tmp_path):
+    path = str(tmp_path / "snapshot.jsonl")
+    save_snapshot(path, DOCUMENTS)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({**DOCUMENTS[0], "content": "改定後"}, ensure_ascii=False) + "\n")
+        f.write(json.dumps({"id": "2", "@deleted": True}) + "\n")
+
+    documents = load_snapshot(path)
+    assert [d["id"] for d in documents] == ["1", "3"]
+    assert documents[0]["content"] == "改定後"
@@ -0,0 +1,52 @@
+import json
+import logging
+from logger import JSONFormatter, SamplingFilter, get_logger, setup_logging
+
+
+def _record(level: int = logging.INFO, **extra_fields) -> logging.LogRecord:
+    record = logging.LogRecord("test", level, __file__, 1, "メッセージ %s", ("引数",), None)
+    if extra_fields:
+        record.extra_fields = extra_fields
+    return record
+
+
+def test_get_logger_adds_shared_handler_once():
+    first = get_logger("tests.logger.once")
+    second = get_logger("tests.logger.once")
+    assert first is second
+    assert first.handlers == [setup_logging()]
+
+
+def test_json_formatter_includes_extra_fields_and_exception():
+    try:
+        raise ValueError("失敗")
+    except ValueError:
+        import sys
+
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "エラー", None, sys.exc_info())
+    record.extra_fields = {"request_id": "abc"}
+
+    data = json.loads(JSONFormatter().format(record))
+    assert data["message"] == "エラー"
+    assert data["request_id"] == "abc"
+    assert "ValueError: 失敗" in data["exception"]
+    assert data["timestamp"].endswith("Z")
+
+
+def test_sampling_filter_keeps_warnings_and_whole_requests():
+    sampler = SamplingFilter({logging.INFO: 0.0})
+    assert sampler.filter(_record(logging.WARNING))
+    assert not sampler.filter(_record(logging.INFO))
+
+    # 同じ request_id のログは同じ判定になり、出力されたログには sample_rate が付く
+    sampler = SamplingFilter({logging.INFO: 0.5})
+    decisions = {
+        request_id: [sampler.filter(_record(request_id=request_id)) for _ in range(3)]
+        for request_id in map(str, range(50))
+    }
+    assert all(len(set(results)) == 1 for results in decisions.values())
+    assert 0 < sum(results[0] for results in decisions.values()) < 50
+
+    record = _record(request_id=next(r for r, results in decisions.items() if results[0]))
+    sampler.filter(record)
+    assert record.extra_fields["sample_rate"] == 0.5
@@ -0,0 +1,160 @@
+import asyncio
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Conversation, Message
+from repositories.async_conversation_repository import AsyncConversationRepository
+from repositories.message_writer import MessageWriteBehind
+
+
+def test_write_behind_is_read_your_writes(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+        writer = MessageWriteBehind(engine, batch_size=100, flush_interval_seconds=60)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            repo = AsyncConversationRepository(session, writer)
+            conversation = await repo.create_conversation()
+            await repo.add_message(conversation.id, "user", "質問")
+            await repo.add_message(conversation.id, "assistant", "回答")
+            await repo.update_conversation_title(conversation.id, "タイトル")
+
+            # 書き込み前でもキュー内のメッセージが読める
+            before_flush = await repo.get_messages(conversation.id)
+            pending = writer.stats()["pending_messages"]
+
+        await writer.flush()
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            repo = AsyncConversationRepository(session)
+            after_flush = await repo.get_messages(conversation.id)
+            stored = await session.get(Conversation, conversation.id)
+
+        await engine.dispose()
+        return before_flush, pending, after_flush, stored, writer.stats()
+
+    before_flush, pending, after_flush, stored, stats = asyncio.run(run())
+
+    assert [m.content for m in before_flush] == ["質問", "回答"]
+    assert pending == 2
+    assert [m.content for m in after_flush] == ["質問", "回答"]
+    assert stored is not None and stored.title == "タイトル"
+    assert stats["pending_messages"] == 0
+    assert stats["flushed_messages"] == 2
+
+
+def _writer_with_conversation(tmp_path, **kwargs):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    writer = MessageWriteBehind(engine, **kwargs)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            return await AsyncConversationRepository(session).create_conversation()
+
+    return engine, writer, setup
+
+
+async def _stored_messages(engine, conversation_id: str) -> list[str]:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        messages = await AsyncConversationRepository(session).get_messages(conversation_id)
+    return [m.content for m in messages]
+
+
+def test_write_behind_keeps_messages_after_transient_failure(tmp_path):
+    engine, writer, setup = _writer_with_conversation(tmp_path, flush_interval_seconds=60)
+    original_write = writer._write
+    failures = {"remaining": 2}
+
+    # 一括書き込みと1件ずつの書き込みがどちらも一時的に失敗する
+    async def flaky_write(messages, titles):
+        if failures["remaining"] > 0:
+            failures["remaining"] -= 1
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        await original_write(messages, titles)
+
+    writer._write = flaky_write
+
+    async def run():
+        conversation = await setup()
+        writer.enqueue_message(
+            Message(conversation_id=conversation.id, role="user", content="質問")
+        )
+        await writer.flush()
+        after_failure = writer.stats()
+        await writer.flush()
+        stored = await _stored_messages(engine, conversation.id)
+        await engine.dispose()
+        return after_failure, stored, writer.stats()
+
+    after_failure, stored, stats = asyncio.run(run())
+
+    assert after_failure["pending_messages"] == 1
+    assert after_failure["failed_messages"] == 0
+    assert after_failure["consecutive_failures"] == 1
+    assert stored == ["質問"]
+    assert stats["pending_messages"] == 0
+    assert stats["consecutive_failures"] == 0
+
+
+def test_write_behind_drops_only_integrity_errors(tmp_path):
+    engine, writer, setup = _writer_with_conversation(tmp_path, flush_interval_seconds=60)
+
+    async def run():
+        conversation = await setup()
+        duplicate = Message(conversation_id=conversation.id, role="user", content="質問")
+        writer.enqueue_message(duplicate)
+        await writer.flush()
+        # 同じIDのメッセージは制約違反になるため破棄し、他のメッセージは書き込む
+        writer.enqueue_message(Message(**duplicate.model_dump()))
+        writer.enqueue_message(
+            Message(conversation_id=conversation.id, role="assistant", content="回答")
+        )
+        await writer.flush()
+        stored = await _stored_messages(engine, conversation.id)
+        await engine.dispose()
+        return stored, writer.stats()
+
+    stored, stats = asyncio.run(run())
+
+    assert stored == ["質問", "回答"]
+    assert stats["pending_messages"] == 0
+    assert stats["failed_messages"] == 1
+
+
+def test_write_behind_stop_waits_for_running_flush(tmp_path):
+    engine, writer, setup = _writer_with_conversation(tmp_path, flush_interval_seconds=0.01)
+    original_write = writer._write
+    flush_started = asyncio.Event()
+
+    # コミット後、キューから取り除く前に時間がかかる書き込み
+    async def slow_write(messages, titles):
+        await original_write(messages, titles)
+        flush_started.set()
+        await asyncio.sleep(0.05)
+
+    writer._write = slow_write
+
+    async def run():
+        conversation = await setup()
+        writer.start()
+        writer.enqueue_message(
+            Message(conversation_id=conversation.id, role="user", content="質問")
+        )
+        await flush_started.wait()
+        await writer.stop()
+        stored = await _stored_messages(engine, conversation.id)
+        await engine.dispose()
+        return stored, writer.stats()
+
+    stored, stats = asyncio.run(run())
+
+    # 書き込み中に停止しても、同じバッチを再度書き込まない
+    assert stored == ["質問"]
+    assert stats["pending_messages"] == 0
+    assert stats["failed_messages"] == 0
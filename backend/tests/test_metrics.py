@@ -0,0 +1,72 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from exceptions import SearchError
+from metrics import Counter, Histogram, MetricsRegistry, errors_total, stage_duration, track_stage
+from middleware import LoggingMiddleware
+from routers import metrics as metrics_router
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.register(
+        Histogram("test_duration_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+    )
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.1, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(3.0, stage="a")
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE test_duration_seconds histogram" in lines
+    assert 'test_duration_seconds_bucket{stage="a",le="0.1"} 2' in lines
+    assert 'test_duration_seconds_bucket{stage="a",le="1"} 3' in lines
+    assert 'test_duration_seconds_bucket{stage="a",le="+Inf"} 4' in lines
+    assert 'test_duration_seconds_count{stage="a"} 4' in lines
+    assert histogram.count(stage="a") == 4
+
+
+def test_counter_escapes_label_values():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("test_total", "Test.", ("type",)))
+    counter.inc(type='a"b')
+    counter.inc(2, type='a"b')
+
+    assert 'test_total{type="a\\"b"} 3' in registry.render().splitlines()
+
+
+def test_track_stage_counts_errors_by_class():
+    before_errors = errors_total.value(stage="test_stage", type="SearchError")
+    before_count = stage_duration.count(stage="test_stage")
+
+    with pytest.raises(SearchError):
+        with track_stage("test_stage"):
+            raise SearchError("検索に失敗しました")
+    with track_stage("test_stage"):
+        pass
+
+    assert errors_total.value(stage="test_stage", type="SearchError") == before_errors + 1
+    assert stage_duration.count(stage="test_stage") == before_count + 2
+
+
+def test_metrics_endpoint_records_route_template():
+    app = FastAPI()
+    app.add_middleware(LoggingMiddleware)
+    app.include_router(metrics_router.router)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: str):
+        return {"id": item_id}
+
+    with TestClient(app) as client:
+        client.get("/items/1")
+        client.get("/items/2")
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="200"}'
+        in response.text
+    )
@@ -0,0 +1,42 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+import middleware
+from logger import request_id_var
+from middleware import LoggingMiddleware
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(LoggingMiddleware)
+
+    @app.get("/stream")
+    def stream():
+        def body():
+            # ストリーミング中もリクエストIDを参照できる
+            yield f"data: {request_id_var.get()}\n\n"
+            yield "data: end\n\n"
+
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    return app
+
+
+def test_streaming_response_is_timed_to_completion(monkeypatch):
+    logged: list[dict] = []
+    monkeypatch.setattr(
+        middleware.logger, "info", lambda message, extra: logged.append(extra["extra_fields"])
+    )
+
+    with TestClient(_app()) as client:
+        response = client.get("/stream", headers={"X-Request-ID": "req-1"})
+
+    assert response.headers["X-Request-ID"] == "req-1"
+    assert "X-Process-Time" in response.headers
+    assert response.text == "data: req-1\n\ndata: end\n\n"
+
+    completed = logged[-1]
+    assert completed["status_code"] == 200
+    assert completed["bytes_sent"] == len(response.content)
+    assert 0 <= completed["ttfb"] <= completed["process_time"]
+    assert request_id_var.get() is None
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import Response
+from sqlmodel import Session, SQLModel, create_engine
+from models import Conversation, Message
+from repositories.conversation_repository import ConversationRepository
+from repositories.pagination import decode_cursor, encode_cursor
+from routers.history import NEXT_CURSOR_HEADER, get_all_conversations
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    created_at = datetime(2026, 1, 2, 3, 4, 5, 678)
+    assert decode_cursor(encode_cursor(created_at, "abc")) == (created_at, "abc")
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_conversations_page_through_ties_in_descending_order(session):
+    base = datetime(2026, 1, 1)
+    # 同じ作成日時の会話も id で順序が決まり、重複・欠落なく辿れる
+    for i in range(7):
+        session.add(Conversation(id=f"c{i}", created_at=base + timedelta(seconds=i // 2)))
+    session.commit()
+    repo = ConversationRepository(session)
+
+    seen: list[str] = []
+    cursor = None
+    while True:
+        page, cursor = repo.get_conversations_page(3, cursor)
+        assert len(page) <= 3
+        seen.extend(conversation.id for conversation in page)
+        if cursor is None:
+            break
+
+    assert seen == ["c6", "c5", "c4", "c3", "c2", "c1", "c0"]
+
+
+def test_conversation_list_is_unpaginated_without_limit_or_cursor(session):
+    base = datetime(2026, 1, 1)
+    for i in range(60):
+        session.add(Conversation(id=f"c{i:02d}", created_at=base + timedelta(seconds=i)))
+    session.commit()
+    repo = ConversationRepository(session)
+
+    # 既存クライアント（limit・cursor なし）には従来どおり全件を返す
+    response = Response()
+    conversations = get_all_conversations(response, limit=None, cursor=None, repo=repo)
+    assert len(conversations) == 60
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+    response = Response()
+    page = get_all_conversations(response, limit=50, cursor=None, repo=repo)
+    assert len(page) == 50
+    rest = get_all_conversations(
+        Response(), limit=None, cursor=response.headers[NEXT_CURSOR_HEADER], repo=repo
+    )
+    assert [c.id for c in page + rest] == [f"c{i:02d}" for i in reversed(range(60))]
+
+
+def test_messages_page_in_ascending_order(session):
+    base = datetime(2026, 1, 1)
+    session.add(Conversation(id="c"))
+    session.add(Conversation(id="other"))
+    for i in range(5):
+        session.add(
+            Message(id=f"m{i}", conversation_id="c", role="user", content=str(i), created_at=base + timedelta(seconds=i))
+        )
+    session.add(Message(id="x", conversation_id="other", role="user", content="x", created_at=base))
+    session.commit()
+    repo = ConversationRepository(session)
+
+    first, cursor = repo.get_messages_page("c", 2)
+    second, cursor = repo.get_messages_page("c", 2, cursor)
+    last, end = repo.get_messages_page("c", 2, cursor)
+
+    assert [m.id for m in first + second + last] == ["m0", "m1", "m2", "m3", "m4"]
+    assert end is None
+
+
+def test_conversation_detail_returns_conversation_and_message_page(session):
+    base = datetime(2026, 1, 1)
+    session.add(Conversation(id="c", title="タイトル"))
+    session.add(Conversation(id="empty"))
+    for i in range(3):
+        session.add(
+            Message(id=f"m{i}", conversation_id="c", role="user", content=str(i), created_at=base + timedelta(seconds=i))
+        )
+    session.commit()
+    repo = ConversationRepository(session)
+
+    conversation, messages, cursor = repo.get_conversation_detail("c", 2)
+    assert conversation.title == "タイトル"
+    assert [m.id for m in messages] == ["m0", "m1"]
+    _, rest, end = repo.get_conversation_detail("c", 2, cursor)
+    assert [m.id for m in rest] == ["m2"] and end is None
+
+    # メッセージがない会話も取得でき、存在しない会話は None
+    conversation, messages, _ = repo.get_conversation_detail("empty", 2)
+    assert conversation.id == "empty" and messages == []
+    assert repo.get_conversation_detail("missing", 2) is None
@@ -0,0 +1,109 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from dependencies import get_request_profiler
+from metrics import track_stage
+from profiling import RequestProfiler, _timeline_lanes
+from routers import profiles
+
+
+async def _slow_upstream() -> str:
+    await asyncio.sleep(0.05)
+    return "回答"
+
+
+async def _stream():
+    with track_stage("test_upstream_stage"):
+        answer = await _slow_upstream()
+    yield answer
+
+
+def test_maybe_profile_is_disabled_without_token_or_sample_rate():
+    profiler = RequestProfiler()
+
+    assert not profiler.enabled
+    assert profiler.maybe_profile("anything") is None
+
+
+def test_maybe_profile_requires_matching_token():
+    profiler = RequestProfiler(admin_token="secret")
+
+    assert profiler.maybe_profile(None) is None
+    assert profiler.maybe_profile("wrong") is None
+    assert profiler.maybe_profile("secret") is not None
+
+
+def test_wrap_records_awaits_and_stage_timeline():
+    profiler = RequestProfiler(admin_token="secret", interval_seconds=0.002)
+    session = profiler.maybe_profile("secret")
+    assert session is not None
+
+    async def consume() -> list[str]:
+        return [item async for item in profiler.wrap(session, _stream())]
+
+    assert asyncio.run(consume()) == ["回答"]
+    assert profiler.get(session.id) is session
+
+    speedscope = session.to_speedscope()
+    frames = speedscope["shared"]["frames"]
+    sampled = speedscope["profiles"][0]
+    stacks = [[frames[i]["name"] for i in sample] for sample in sampled["samples"]]
+    # await 中のサンプルは、待っている上流呼び出しのコルーチンまで辿れる
+    assert any(stack[:2] == ["_stream", "_slow_upstream"] for stack in stacks)
+    assert len(sampled["samples"]) == len(sampled["weights"])
+
+    assert [stage["name"] for stage in profiler.summaries()[0]["stages"]] == [
+        "test_upstream_stage"
+    ]
+    assert speedscope["profiles"][1]["type"] == "evented"
+
+
+def test_timeline_lanes_split_partially_overlapping_stages():
+    lanes = _timeline_lanes(
+        [("stream", 0.0, 1.0), ("ttft", 0.0, 0.2), ("db_write", 0.9, 1.5)]
+    )
+
+    assert lanes == [
+        [("O", "stream", 0.0), ("O", "ttft", 0.0), ("C", "ttft", 0.2), ("C", "stream", 1.0)],
+        [("O", "db_write", 0.9), ("C", "db_write", 1.5)],
+    ]
+
+
+def test_profile_endpoints_require_token():
+    profiler = RequestProfiler(admin_token="secret")
+    app = FastAPI()
+    app.include_router(profiles.router)
+    app.dependency_overrides[get_request_profiler] = lambda: profiler
+
+    with TestClient(app) as client:
+        assert client.get("/api/v1/admin/profiles/").status_code == 403
+        response = client.get(
+            "/api/v1/admin/profiles/", headers={"X-Profile-Token": "secret"}
+        )
+        assert response.status_code == 200
+        assert response.json() == []
+        assert (
+            client.get(
+                "/api/v1/admin/profiles/unknown", headers={"X-Profile-Token": "secret"}
+            ).status_code
+            == 404
+        )
+
+
+def test_concurrent_profiles_are_limited_at_stream_start():
+    profiler = RequestProfiler(admin_token="secret", interval_seconds=0.002, max_concurrent=1)
+    # どちらのリクエストもストリーム開始前にセッションを受け取る
+    sessions = [profiler.maybe_profile("secret"), profiler.maybe_profile("secret")]
+    assert all(session is not None for session in sessions)
+
+    async def consume(session) -> list[str]:
+        return [item async for item in profiler.wrap(session, _stream())]
+
+    async def run() -> list[list[str]]:
+        return await asyncio.gather(*(consume(session) for session in sessions))
+
+    assert asyncio.run(run()) == [["回答"], ["回答"]]
+    # 記録するのは先に始まった1件だけ
+    assert len(profiler.summaries()) == 1
+    assert profiler.get(sessions[0].id) is sessions[0]
+    assert profiler.maybe_profile("secret") is not None
@@ -0,0 +1,51 @@
+from models import MessageBase
+from services.query_rewrite_policy import QueryRewritePolicy
+
+
+def _messages(*contents: str) -> list[MessageBase]:
+    roles = ["user", "assistant"]
+    return [MessageBase(role=roles[i % 2], content=c) for i, c in enumerate(contents)]
+
+
+def test_skip_single_turn():
+    policy = QueryRewritePolicy()
+    assert policy.should_skip(_messages("有給休暇は何日ですか？"))
+    assert policy.stats()["skipped_single_turn"] == 1
+
+
+def test_skip_short_self_contained_query():
+    policy = QueryRewritePolicy(self_contained_max_chars=40)
+    messages = _messages("勤務時間は？", "10時から19時です。", "リモートワークの申請方法は？")
+    assert policy.should_skip(messages)
+    assert policy.stats()["skipped_self_contained"] == 1
+
+
+def test_does_not_skip_context_dependent_query():
+    policy = QueryRewritePolicy(self_contained_max_chars=40)
+    messages = _messages("有給休暇は何日？", "10日です。", "それは繰り越せますか？")
+    assert not policy.should_skip(messages)
+
+
+def test_does_not_skip_elliptical_follow_up_by_default():
+    policy = QueryRewritePolicy()
+    for follow_up in ("パートの場合は？", "繰り越しはできますか？", "申請期限は？"):
+        messages = _messages("有給休暇は何日？", "入社6か月後に10日付与されます。", follow_up)
+        assert not policy.should_skip(messages)
+    assert policy.stats()["skipped_self_contained"] == 0
+
+
+def test_window_caps_history():
+    policy = QueryRewritePolicy(max_history_messages=3, max_history_chars=1000)
+    messages = _messages("a", "b", "c", "d", "e")
+    assert [m.content for m in policy.window(messages)] == ["c", "d", "e"]
+    assert policy.stats()["truncated_histories"] == 1
+
+
+def test_cache_keyed_by_window():
+    policy = QueryRewritePolicy()
+    window = _messages("有給休暇は何日？", "10日です。", "それは繰り越せますか？")
+    policy.store(window, "有給休暇 繰り越し")
+
+    assert policy.get_cached(window) == "有給休暇 繰り越し"
+    assert policy.get_cached(_messages("別の質問", "回答", "それは？")) is None
+    assert policy.stats()["cache_hits"] == 1
@@ -0,0 +1,220 @@
+import asyncio
+import time
+import httpx
+import pytest
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+from openai import APIConnectionError, BadRequestError, RateLimitError
+from admission import ConcurrencyLimiter
+from exceptions import EmbeddingError, SearchError
+from resilience import CircuitBreaker, ResilientCall, is_transient, request_deadline
+
+
+def _call(**kwargs) -> ResilientCall:
+    options = {"base_delay": 0.001, "max_delay": 0.001, "hedge_quantile": 0}
+    options.update(kwargs)
+    return ResilientCall("test_upstream", SearchError, **options)
+
+
+def test_transient_failure_is_retried():
+    call = _call(max_attempts=3)
+    attempts = 0
+
+    async def operation() -> str:
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise SearchError("一時的なエラー") from TimeoutError()
+        return "結果"
+
+    assert asyncio.run(call.call(operation)) == "結果"
+    assert attempts == 3
+    assert call.stats()["retries"] == 2
+
+
+def _status_error(error_class, status_code: int):
+    request = httpx.Request("POST", "https://example.com")
+    response = httpx.Response(status_code, request=request)
+    return error_class("error", response=response, body=None)
+
+
+def _azure_error(status_code: int) -> HttpResponseError:
+    error = HttpResponseError("error")
+    error.status_code = status_code
+    return error
+
+
+def _wrapped(cause: Exception) -> SearchError:
+    try:
+        raise cause
+    except Exception:
+        # 検索リポジトリと同じく、元の例外を包んで送出する
+        try:
+            raise SearchError("検索中にエラーが発生しました")
+        except SearchError as e:
+            return e
+
+
+def test_is_transient_classifies_timeouts_connections_429_and_5xx():
+    request = httpx.Request("POST", "https://example.com")
+    assert is_transient(TimeoutError())
+    assert is_transient(APIConnectionError(request=request))
+    assert is_transient(ServiceRequestError("接続できません"))
+    assert is_transient(_status_error(RateLimitError, 429))
+    assert is_transient(_azure_error(503))
+    assert is_transient(_wrapped(_azure_error(500)))
+
+    assert not is_transient(_status_error(BadRequestError, 400))
+    assert not is_transient(_wrapped(_azure_error(400)))
+    assert not is_transient(SearchError("サポートされていないフィルタ式です"))
+    assert not is_transient(ValueError("不正な入力"))
+
+
+def test_caller_error_is_not_retried_and_does_not_trip_breaker():
+    breaker = CircuitBreaker("test_caller_error", failure_threshold=1)
+    call = _call(max_attempts=3, breaker=breaker)
+    attempts = 0
+
+    async def operation() -> str:
+        nonlocal attempts
+        attempts += 1
+        raise _wrapped(_azure_error(400))
+
+    with pytest.raises(SearchError):
+        asyncio.run(call.call(operation))
+
+    assert attempts == 1
+    assert call.stats()["retries"] == 0
+    assert breaker.state == "closed"
+
+
+def test_failures_are_raised_as_error_class():
+    call = ResilientCall(
+        "test_embedding", EmbeddingError, max_attempts=2, base_delay=0.001, max_delay=0.001
+    )
+
+    async def operation() -> str:
+        raise ConnectionError("接続できません")
+
+    with pytest.raises(EmbeddingError):
+        asyncio.run(call.call(operation))
+
+
+def test_attempt_timeout_is_limited_by_request_deadline():
+    call = _call(timeout_seconds=5, max_attempts=1)
+
+    async def operation() -> str:
+        await asyncio.sleep(1)
+        return "結果"
+
+    async def run() -> str:
+        request_deadline.set(time.monotonic() + 0.02)
+        return await call.call(operation)
+
+    start = time.perf_counter()
+    with pytest.raises(SearchError):
+        asyncio.run(run())
+
+    assert time.perf_counter() - start < 0.5
+    assert call.stats()["timeouts"] == 1
+
+
+def test_slow_primary_is_hedged_and_hedge_wins():
+    call = _call(hedge_quantile=0.95, hedge_min_delay=0.01, hedge_min_samples=1)
+    call.latencies.observe(0.01)
+    started = 0
+
+    async def operation() -> str:
+        nonlocal started
+        started += 1
+        # 最初の呼び出しだけが遅い
+        await asyncio.sleep(1 if started == 1 else 0)
+        return f"呼び出し{started}"
+
+    start = time.perf_counter()
+    assert asyncio.run(call.call(operation)) == "呼び出し2"
+    assert time.perf_counter() - start < 0.5
+    assert call.stats()["hedges"] == 1
+    assert call.stats()["hedge_wins"] == 1
+
+
+def _slow_primary(started: list[int]):
+    async def operation() -> str:
+        started.append(len(started) + 1)
+        await asyncio.sleep(0.2 if len(started) == 1 else 0)
+        return f"呼び出し{len(started)}"
+
+    return operation
+
+
+def test_hedge_takes_its_own_limiter_slot_and_releases_it():
+    call = _call(hedge_quantile=0.95, hedge_min_delay=0.01, hedge_min_samples=1)
+    call.latencies.observe(0.01)
+    limiter = ConcurrencyLimiter("test_hedge_slot", max_concurrent=2)
+    in_use: list[int] = []
+    started: list[int] = []
+    slow = _slow_primary(started)
+
+    async def operation() -> str:
+        in_use.append(limiter.stats()["in_use"])
+        return await slow()
+
+    async def run() -> str:
+        # 元の呼び出しは呼び出し側が確保した枠で実行する
+        async with limiter.slot():
+            result = await call.call(operation, hedge_limiter=limiter)
+        await asyncio.sleep(0.01)
+        return result
+
+    assert asyncio.run(run()) == "呼び出し2"
+    # ヘッジの実行中は2枠を使い、取り消し・終了後にすべて解放される
+    assert in_use == [1, 2]
+    assert limiter.stats()["in_use"] == 0
+    assert call.stats()["hedges"] == 1
+
+
+def test_hedge_is_skipped_when_limiter_has_no_free_slot():
+    call = _call(hedge_quantile=0.95, hedge_min_delay=0.01, hedge_min_samples=1)
+    call.latencies.observe(0.01)
+    limiter = ConcurrencyLimiter("test_hedge_full", max_concurrent=1)
+    started: list[int] = []
+
+    async def run() -> str:
+        async with limiter.slot():
+            return await call.call(_slow_primary(started), hedge_limiter=limiter)
+
+    assert asyncio.run(run()) == "呼び出し1"
+    assert started == [1]
+    assert call.stats()["hedges"] == 0
+    assert call.stats()["hedges_skipped"] == 1
+    assert limiter.stats()["in_use"] == 0
+
+
+def test_circuit_breaker_fails_fast_and_recovers():
+    breaker = CircuitBreaker("test_breaker", failure_threshold=2, reset_timeout_seconds=0.05)
+    call = _call(max_attempts=1, breaker=breaker)
+    attempts = 0
+    healthy = False
+
+    async def operation() -> str:
+        nonlocal attempts
+        attempts += 1
+        if not healthy:
+            raise SearchError("上流の障害") from ConnectionError()
+        return "結果"
+
+    for _ in range(2):
+        with pytest.raises(SearchError):
+            asyncio.run(call.call(operation))
+    assert breaker.state == "open"
+
+    # 停止中は上流を呼ばずにすぐ失敗する
+    with pytest.raises(SearchError):
+        asyncio.run(call.call(operation))
+    assert attempts == 2
+    assert breaker.stats()["rejected"] == 1
+
+    # 一定時間後の試行が成功すれば再開する
+    time.sleep(0.06)
+    healthy = True
+    assert asyncio.run(call.call(operation)) == "結果"
+    assert breaker.state == "closed"
@@ -0,0 +1,120 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from metrics import singleflight_deduplicated_total
+from services.chat_service import ChatService
+from singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def factory() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "結果"
+
+    before = singleflight_deduplicated_total.value(operation="test_share")
+
+    async def run() -> list[str]:
+        return await asyncio.gather(
+            *(flight.do("test_share", "key", factory) for _ in range(5))
+        )
+
+    assert asyncio.run(run()) == ["結果"] * 5
+    assert calls == 1
+    assert singleflight_deduplicated_total.value(operation="test_share") == before + 4
+    assert flight.stats() == {
+        "in_flight": 0,
+        "operations": {"test_share": {"calls": 5, "deduplicated": 4}},
+    }
+
+
+def test_exception_propagates_to_every_waiter():
+    flight = SingleFlight()
+
+    async def factory() -> str:
+        await asyncio.sleep(0.01)
+        raise ValueError("上流エラー")
+
+    async def run() -> list:
+        return await asyncio.gather(
+            *(flight.do("test_error", "key", factory) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_caller_does_not_affect_other_waiters():
+    flight = SingleFlight()
+
+    async def factory() -> str:
+        await asyncio.sleep(0.02)
+        return "結果"
+
+    async def run() -> str:
+        first = asyncio.create_task(flight.do("test_cancel", "key", factory))
+        second = asyncio.create_task(flight.do("test_cancel", "key", factory))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "結果"
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight()
+    calls = 0
+
+    async def factory() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return calls
+
+    async def run() -> None:
+        await asyncio.gather(
+            flight.do("test_keys", "a", factory), flight.do("test_keys", "b", factory)
+        )
+
+    asyncio.run(run())
+
+    assert calls == 2
+
+
+def test_chat_service_coalesces_identical_embeddings_and_searches():
+    openai_client = AsyncMock()
+
+    async def create_embedding(**kwargs):
+        await asyncio.sleep(0.01)
+        return MagicMock(data=[MagicMock(embedding=[1.0, 0.0])], usage=None)
+
+    openai_client.embeddings.create.side_effect = create_embedding
+    search_repository = AsyncMock()
+    search_repository.hybrid_search.return_value = [
+        {"id": "a", "source": "a.pdf", "page": 1, "category": "c", "content": "本文"}
+    ]
+    service = ChatService(
+        openai_client, search_repository, AsyncMock(), single_flight=SingleFlight()
+    )
+
+    async def run() -> list:
+        # 表記揺れ（全角・半角）は同じ入力として扱う
+        return await asyncio.gather(
+            service._embed_and_search("有給休暇は?"),
+            service._embed_and_search("有給休暇は？"),
+        )
+
+    first, second = asyncio.run(run())
+
+    assert first == second
+    assert openai_client.embeddings.create.await_count == 1
+    assert search_repository.hybrid_search.await_count == 1
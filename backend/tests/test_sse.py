@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pytest
+from sse import cancel_on_disconnect, coalesce, message_event, title_event
+
+
+async def _events(items: list, delays: dict[int, float] | None = None):
+    for index, item in enumerate(items):
+        delay = (delays or {}).get(index)
+        if delay:
+            await asyncio.sleep(delay)
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+async def _collect(stream) -> list[str]:
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.parametrize("content", ["こんにちは", 'a"b\\c\n', "😀"])
+def test_events_match_json_dumps_format(content):
+    assert message_event(content) == f"data: {json.dumps({'type': 'message', 'content': content})}\n\n"
+    assert title_event(content) == f"data: {json.dumps({'type': 'title', 'title': content})}\n\n"
+
+
+def test_coalesce_flushes_first_event_then_batches():
+    events = [message_event(str(i)) for i in range(5)]
+
+    writes = asyncio.run(_collect(coalesce(_events(events), interval_seconds=10)))
+
+    assert writes == [events[0], "".join(events[1:])]
+
+
+def test_coalesce_flushes_on_size():
+    events = ["x" * 10 for _ in range(7)]
+
+    writes = asyncio.run(_collect(coalesce(_events(events), max_bytes=30, interval_seconds=10)))
+
+    assert writes == ["x" * 10, "x" * 30, "x" * 30]
+
+
+def test_coalesce_flushes_on_interval_while_upstream_stalls():
+    events = ["a", "b", "c"]
+
+    # b を溜めた後に上流が止まっても、期限が来た時点で b を送信する
+    writes = asyncio.run(
+        _collect(coalesce(_events(events, delays={2: 0.2}), interval_seconds=0.02))
+    )
+
+    assert writes == ["a", "b", "c"]
+
+
+def test_coalesce_without_interval_passes_events_through():
+    events = ["a", "b", "c"]
+
+    assert asyncio.run(_collect(coalesce(_events(events), interval_seconds=0))) == events
+
+
+def test_coalesce_propagates_errors_after_buffered_events():
+    async def run() -> list[str]:
+        writes: list[str] = []
+        with pytest.raises(RuntimeError):
+            async for chunk in coalesce(_events(["a", "b", RuntimeError("失敗")]), interval_seconds=10):
+                writes.append(chunk)
+        return writes
+
+    assert asyncio.run(run()) == ["a"]
+
+
+def _disconnect_after(seconds: float):
+    async def receive() -> dict:
+        await asyncio.sleep(seconds)
+        return {"type": "http.disconnect"}
+
+    return receive
+
+
+def test_cancel_on_disconnect_cancels_producer_while_awaiting_upstream():
+    state = {}
+
+    async def events():
+        yield "a"
+        try:
+            await asyncio.sleep(10)  # 上流の応答待ち
+            yield "b"
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def run() -> list[str]:
+        return [event async for event in cancel_on_disconnect(events(), _disconnect_after(0.05))]
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=2)) == ["a"]
+    assert state == {"cancelled": True}
+
+
+def test_cancel_on_disconnect_propagates_producer_errors():
+    async def events():
+        yield "a"
+        raise RuntimeError("失敗")
+
+    async def run() -> list[str]:
+        received: list[str] = []
+        with pytest.raises(RuntimeError):
+            async for event in cancel_on_disconnect(events(), _disconnect_after(10)):
+                received.append(event)
+        return received
+
+    assert asyncio.run(run()) == ["a"]
@@ -0,0 +1,44 @@
+"""トークン数計測モジュール
+
+tiktoken がインストールされていれば正確なトークン数を、なければ近似値を返す。
+近似値は日本語などの非ASCII文字を1文字1トークン、ASCII文字を4文字1トークンとして数える。
+"""
+
+from functools import lru_cache
+from logger import get_logger
+
+try:
+    import tiktoken
+except ImportError:  # 任意の依存関係
+    tiktoken = None
+
+logger = get_logger(__name__)
+
+# メッセージ1件あたりのロール・区切りなどのオーバーヘッド
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # エンコーディングファイルを取得できない環境では近似値を使用する
+        logger.warning(f"tiktokenのエンコーディングを読み込めませんでした: {e}")
+        return None
+
+
+# テキストのトークン数を計測
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+# メッセージ1件のトークン数を計測
+def count_message_tokens(content: str) -> int:
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
@@ -1,56 +1,208 @@
 '''
 Azure AI Searchにサンプルデータの内容を登録する
+
+入力をストリーミングで読み込み、条・段落単位のチャンクに分割（プロセスプールで並列実行）してから
+Embeddingをまとめて並行生成し、一定件数ごとに登録する。
+途中で停止した場合は、同じコマンドを再実行するとチェックポイントから再開する。
+--sync を指定すると、マニフェスト（内容ハッシュ）と比較して新規・変更分だけを再Embeddingし、
+入力から消えたドキュメントはインデックスから削除する。--dry-run で差分だけを表示する。
 '''
 
+import argparse
 import asyncio
-import json
+import os
+import sys
 from utils import get_env
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
 from openai import AsyncOpenAI
+from caches.answer_cache import touch_index_version
+from ingestion.checkpoint import Checkpoint
+from ingestion.chunker import Chunker
+from ingestion.manifest import Manifest, content_hash
+from ingestion.pipeline import IngestionPipeline, Sink
+from ingestion.reader import iter_documents
+from ingestion.sinks import AzureSearchSink, SnapshotSink, ensure_chunk_fields
 
-# 接続定義
-service_endpoint = get_env("AZURE_SEARCH_ENDPOINT")
-index_name = get_env("AZURE_SEARCH_INDEX_NAME")
-credential = AzureKeyCredential(get_env("AZURE_SEARCH_API_KEY"))
-open_ai_api_Key = get_env("OPENAI_API_KEY")
 
-# Azure AI Searchクライアントの作成
-search_client = SearchClient(service_endpoint, index_name, credential)
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='社内規定データを検索インデックスに登録する')
+    parser.add_argument('--input', default='handbook_data.json', help='入力ファイル（JSON配列 または JSON Lines）')
+    parser.add_argument('--embed-batch-size', type=int, default=64, help='1回のEmbedding APIに渡す件数')
+    parser.add_argument('--concurrency', type=int, default=4, help='Embedding APIの同時実行数')
+    parser.add_argument('--upload-batch-size', type=int, default=500, help='1回の登録で送る件数')
+    parser.add_argument('--chunk-max-tokens', type=int, default=400, help='1チャンクの最大トークン数')
+    parser.add_argument('--chunk-overlap', type=int, default=50, help='前のチャンクから重複して含める最大トークン数')
+    parser.add_argument('--chunk-workers', type=int, default=os.cpu_count() or 1, help='チャンク分割の並列プロセス数')
+    parser.add_argument('--checkpoint', default='.ingest_checkpoint', help='チェックポイントファイル')
+    parser.add_argument('--reset', action='store_true', help='チェックポイントを破棄して最初から登録する')
+    parser.add_argument(
+        '--local-only',
+        action='store_true',
+        help='Azure AI Searchには登録せず、ローカル検索用スナップショットのみ作成する',
+    )
+    parser.add_argument('--manifest', default='.ingest_manifest', help='登録済みドキュメントの内容ハッシュを記録するファイル')
+    parser.add_argument('--sync', action='store_true', help='前回からの差分（新規・変更・削除）だけを反映する')
+    parser.add_argument('--dry-run', action='store_true', help='差分を表示するだけで登録・削除は行わない（--sync と併用）')
+    return parser.parse_args()
 
-# OpenAIクライアントの作成
-openai_client = AsyncOpenAI(api_key=open_ai_api_Key)
 
-# JSONファイルの読み込み
-json_data = json.load(open('handbook_data.json', 'r', encoding='utf-8'))
+# ベクトル化とデータ登録
+async def main(args: argparse.Namespace) -> int:
+    embedding_model = get_env("EMBEDDING_MODEL", "text-embedding-3-small")
+    snapshot_path = get_env("LOCAL_SEARCH_SNAPSHOT", "search_snapshot.jsonl")
+    manifest = Manifest(args.manifest)
+    chunker = Chunker(args.chunk_max_tokens, args.chunk_overlap, workers=args.chunk_workers)
 
-async def get_embedding(text: str) -> list[float]:
-    try:
-        response = await openai_client.embeddings.create(
-            model="text-embedding-3-small", input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f'Embedding生成に失敗しました: {e}')
-        return []
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.reset:
+        checkpoint.clear()
 
+    # 差分同期の場合は、入力の内容ハッシュをマニフェストと比較して対象を決める
+    plan = None
+    if args.sync or args.dry_run:
+        source_hashes = {str(doc["id"]): content_hash(doc) for doc in iter_documents(args.input)}
+        plan = manifest.plan(source_hashes, embedding_model, chunker.signature)
+        print(plan.describe())
+        if args.dry_run:
+            return 0
+        if not plan.has_changes and not manifest.stale_ids():
+            print('変更はありません。')
+            return 0
+    elif not checkpoint.completed:
+        # 新規の全件登録ではスナップショットを作り直す（再開時は追記する）
+        # マニフェストは残し、前回登録したIDのうち不要になったもの（チャンク分割前のドキュメントIDなど）を
+        # 登録後にインデックスから削除する
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
 
-# ベクトル化とデータ登録
-async def main():
-    print('ベクトル化実行中...')
-    for doc in json_data:
-        doc['embedding'] = await get_embedding(doc['content'])
-        doc['page'] = str(doc['page'])
+    sinks: list[Sink] = [SnapshotSink(snapshot_path)]
+    search_client = None
+    if not args.local_only:
+        endpoint = get_env("AZURE_SEARCH_ENDPOINT")
+        index_name = get_env("AZURE_SEARCH_INDEX_NAME")
+        credential = AzureKeyCredential(get_env("AZURE_SEARCH_API_KEY"))
+
+        # チャンク分割前に作成したインデックスには parent_id / chunk_index がないため、登録前に追加する
+        async with SearchIndexClient(endpoint, credential) as index_client:
+            added = await ensure_chunk_fields(index_client, index_name)
+        if added:
+            print(f'インデックスにフィールドを追加しました: {", ".join(added)}')
+
+        search_client = SearchClient(endpoint, index_name, credential)
+        sinks.append(AzureSearchSink(search_client, merge=plan is not None))
+
+    # 親ドキュメントごとに未登録のチャンクIDを管理し、すべて登録できたらマニフェストに記録する
+    hashes: dict[str, str] = {}
+    entries: dict[str, dict] = {}
+    remaining: dict[str, set[str]] = {}
+    seen: set[str] = set()
+
+    def record(parent_ids: list[str]) -> None:
+        completed = [entries.pop(parent_id) for parent_id in parent_ids]
+        for entry in completed:
+            remaining.pop(entry["id"], None)
+        # 変更前より減ったチャンクは、マニフェストに削除待ちとして記録される
+        manifest.record_uploaded(completed)
 
+    def source_documents():
+        for doc in iter_documents(args.input):
+            document_id = str(doc["id"])
+            seen.add(document_id)
+            if plan is not None and document_id not in plan.to_upload:
+                continue
+            hashes[document_id] = content_hash(doc)
+            yield doc
+
+    async def chunks():
+        async for parent_id, document_chunks in chunker.split_all_async(source_documents()):
+            chunk_ids = [chunk["id"] for chunk in document_chunks]
+            entries[parent_id] = {
+                "id": parent_id,
+                "hash": hashes.pop(parent_id),
+                "model": embedding_model,
+                "chunking": chunker.signature,
+                "chunks": chunk_ids,
+            }
+            remaining[parent_id] = {
+                chunk["id"]
+                for chunk in document_chunks
+                if not checkpoint.is_completed(chunk["id"], content_hash(chunk))
+            }
+            if not remaining[parent_id]:
+                record([parent_id])
+            for chunk in document_chunks:
+                yield chunk
+
+    def on_uploaded(uploaded: list[dict]) -> None:
+        completed: list[str] = []
+        for chunk in uploaded:
+            left = remaining.get(chunk["parent_id"])
+            if left is None:
+                continue
+            left.discard(chunk["id"])
+            if not left:
+                completed.append(chunk["parent_id"])
+                remaining.pop(chunk["parent_id"])
+        if completed:
+            record(completed)
+
+    openai_client = AsyncOpenAI(api_key=get_env("OPENAI_API_KEY"))
+    pipeline = IngestionPipeline(
+        openai_client,
+        sinks,
+        checkpoint,
+        embedding_model=embedding_model,
+        embed_batch_size=args.embed_batch_size,
+        concurrency=args.concurrency,
+        upload_batch_size=args.upload_batch_size,
+        on_uploaded=on_uploaded,
+    )
+
+    print('ベクトル化・登録中...')
     try:
-        print('登録中...')
-        await search_client.upload_documents(json_data)
-    except Exception as e:
-        print(f'登録に失敗しました: {e}')
-        return
+        stats = await pipeline.run(chunks())
+
+        # 入力から消えたドキュメントと、減ったチャンクをインデックスから削除する
+        if plan is not None:
+            removed = plan.deleted
+        else:
+            removed = [document_id for document_id in manifest.entries if document_id not in seen]
+        delete_ids = manifest.stale_ids() + [
+            i for parent_id in removed for i in manifest.index_ids(parent_id)
+        ]
+        if delete_ids:
+            deleted = set(await pipeline.delete(delete_ids))
+            manifest.clear_stale(deleted)
+            manifest.record_deleted(
+                parent_id for parent_id in removed if set(manifest.index_ids(parent_id)) <= deleted
+            )
+            print(f'{len(deleted)}件削除しました。')
+    finally:
+        if search_client is not None:
+            await search_client.close()
+        await openai_client.close()
+
+    report = stats.report()
+    print(
+        f"{report['uploaded']}件登録しました。"
+        f"（スキップ: {report['skipped']}件, 失敗: {report['failed']}件, "
+        f"{report['elapsed_seconds']}秒, {report['docs_per_second']} docs/s, "
+        f"{report['tokens_per_second']} tokens/s）"
+    )
+
+    if stats.failed_ids:
+        print(f'登録・削除に失敗したドキュメント: {", ".join(stats.failed_ids[:20])}')
+        print('同じコマンドを再実行すると、失敗したドキュメントから再開します。')
+        return 1
 
-    print(f'{len(json_data)}件登録しました。')
+    # すべて反映できたらチェックポイントを削除し、マニフェストを整理して回答キャッシュを無効化する
+    checkpoint.clear()
+    manifest.compact()
+    touch_index_version(get_env("INDEX_VERSION_FILE", ".index_version"))
+    return 0
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    sys.exit(asyncio.run(main(parse_args())))
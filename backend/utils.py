@@ -5,8 +5,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-def get_env(key: str) -> str:
-    value = os.getenv(key)
+def get_env(key: str, default: str | None = None) -> str:
+    value = os.getenv(key, default)
     if value is None:
         raise ConfigurationError(f"{key}が設定されていません")
     return value
@@ -64,16 +64,17 @@ export default function SendMessage({
 
           // AIの回答をstateに追加
           const decoder = new TextDecoder();
+          // 受信データの途中で切れたイベント（次の受信で続きが届く）
+          let pending = '';
           try {
             while (true) {
               const { done, value } = await reader.read();
               if (done) break;
 
-              // バイナリからテキスト変換
-              const text = decoder.decode(value, { stream: true });
-              const lines = text
-                .split('\n\n')
-                .filter((line) => line.trim() !== '');
+              // バイナリからテキスト変換（複数のイベントがまとめて届くことがある）
+              const events = (pending + decoder.decode(value, { stream: true })).split('\n\n');
+              pending = events.pop() ?? '';
+              const lines = events.filter((line) => line.trim() !== '');
 
               for (const line of lines) {
                 if (line.startsWith('data: ')) {
@@ -86,6 +87,14 @@ export default function SendMessage({
                       newMessages[newMessages.length - 1].content = aiMessage;
                       return newMessages;
                     });
+                  } else if (eventData.type === 'error') {
+                    // 回答の生成中に中断された場合は、エラーメッセージを回答の末尾に表示
+                    aiMessage += (aiMessage ? '\n\n' : '') + eventData.message;
+                    setMessages((prev: Message[]) => {
+                      const newMessages = [...prev];
+                      newMessages[newMessages.length - 1].content = aiMessage;
+                      return newMessages;
+                    });
                   } else if (eventData.type === 'title') {
                     setConversations((prev: Conversation[]) => {
                       const newConversations = [...prev].map((conv) => {
@@ -1,4 +1,4 @@
-import { ChatRequest, Conversation } from '@/types';
+import { ChatRequest, Conversation, Message } from '@/types';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL;
 
@@ -37,15 +37,27 @@ export async function deleteConversation(
   return response;
 }
 
-// 会話に紐づくメッセージ履歴取得
-export async function fetchMessages(conversationId: string) {
-  const response = await fetch(
-    `${API_BASE_URL}/conversations/${conversationId}/messages`
-  );
-  if (!response.ok) throw new Error('Failed to fetch messages');
+// 会話に紐づくメッセージ履歴取得（会話詳細APIから表示に必要なフィールドのみ取得）
+export async function fetchMessages(conversationId: string): Promise<Message[]> {
+  // 1回500件ずつ取得し、X-Next-Cursor がなくなるまで次のページを辿る
+  const messages: Message[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({
+      fields: 'messages.role,messages.content',
+      limit: '500',
+    });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(
+      `${API_BASE_URL}/conversations/${conversationId}/detail?${params}`
+    );
+    if (!response.ok) throw new Error('Failed to fetch messages');
 
-  const data = await response.json();
-  return data;
+    const data = await response.json();
+    messages.push(...data.messages);
+    cursor = response.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return messages;
 }
 
 // チャットリクエスト送信